@@ -0,0 +1,161 @@
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import time
+import pygame
+
+from card import CARD_SUITS, CARD_VALUES
+
+# Directory of the current script
+script_dir = os.path.dirname(__file__)
+
+# Path for the cards' images
+back_of_card = os.path.join(script_dir, "resources", "miscellaneous", "card_back.jpg")
+cards_dir = os.path.join(script_dir, 'resources', 'cards')
+
+# Pre-scaled atlas cache, see build_cache
+cache_dir = os.path.join(script_dir, 'resources', 'cache')
+CACHE_MAGIC = b'SOLA'
+CACHE_VERSION = 1
+# magic, version, card width, card height, atlas width, atlas height, sha1 of the source images
+CACHE_HEADER = struct.Struct('<4sHHHII20s')
+
+
+def source_paths():
+    # The atlas images in slot order: each suit's values, then the back of the card
+    paths = [os.path.join(cards_dir, f'{value}_of_{suit}.png') for suit in CARD_SUITS for value in CARD_VALUES]
+    paths.append(back_of_card)
+    return paths
+
+def source_hash():
+    # SHA-1 over the names and contents of every source image
+    digest = hashlib.sha1()
+    for path in source_paths():
+        digest.update(os.path.basename(path).encode())
+        with open(path, 'rb') as file:
+            digest.update(file.read())
+    return digest.digest()
+
+def cache_path(card_size):
+    return os.path.join(cache_dir, f'cards_{round(card_size[0])}x{round(card_size[1])}.bin')
+
+
+class CardAssets:
+    """
+    All card images scaled to one card size and packed into a single atlas surface.
+
+    The atlas has one row per suit (in CARD_SUITS order, one column per value) and a last row
+    holding the back of the card. Each image is a subsurface of the atlas.
+
+    Attributes:
+        faces (dict): Card image filename -> subsurface, the keys Card.name_of_card uses.
+        back (Surface): Back of card subsurface.
+        load_time (float): Seconds spent loading, scaling and packing the images.
+        memory_bytes (int): Size of the atlas pixel data.
+    """
+
+    def __init__(self, card_size, use_cache=True):
+        start = time.perf_counter()
+        self.card_size = card_size
+        width, height = round(card_size[0]), round(card_size[1])
+
+        self.from_cache = False
+        self.atlas = self.load_cache() if use_cache else None
+        if self.atlas is not None:
+            self.from_cache = True
+        else:
+            self.atlas = pygame.Surface((width * len(CARD_VALUES), height * (len(CARD_SUITS) + 1)), pygame.SRCALPHA)
+            for slot, path in enumerate(source_paths()):
+                self.pack(path, ((slot % len(CARD_VALUES)) * width, (slot // len(CARD_VALUES)) * height))
+            if use_cache:
+                self.save_cache()
+
+        # Match the display pixel format so blits don't convert on every frame
+        if pygame.display.get_surface() is not None:
+            self.atlas = self.atlas.convert_alpha()
+
+        self.faces = {}
+        for row, suit in enumerate(CARD_SUITS):
+            for column, value in enumerate(CARD_VALUES):
+                rect = pygame.Rect(column * width, row * height, width, height)
+                self.faces[f'{value}_of_{suit}.png'] = self.atlas.subsurface(rect)
+        self.back = self.atlas.subsurface(pygame.Rect(0, len(CARD_SUITS) * height, width, height))
+
+        self.load_time = time.perf_counter() - start
+        self.memory_bytes = self.atlas.get_pitch() * self.atlas.get_height()
+
+    def load_cache(self):
+        # Returns the atlas from the on-disk cache, or None if it is missing or stale
+        path = cache_path(self.card_size)
+        try:
+            with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                magic, version, width, height, atlas_width, atlas_height, digest = CACHE_HEADER.unpack_from(data)
+                if (magic != CACHE_MAGIC or version != CACHE_VERSION
+                        or (width, height) != (round(self.card_size[0]), round(self.card_size[1]))
+                        or len(data) != CACHE_HEADER.size + atlas_width * atlas_height * 4
+                        or digest != source_hash()):
+                    return None
+                # frombuffer wraps the mapped pixels, copy() gives the surface its own memory before the map closes
+                pixels = memoryview(data)[CACHE_HEADER.size:]
+                try:
+                    return pygame.image.frombuffer(pixels, (atlas_width, atlas_height), 'RGBA').copy()
+                finally:
+                    pixels.release()
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def save_cache(self):
+        # Writes the scaled atlas to the cache, failures only cost the next start its speed
+        path = cache_path(self.card_size)
+        header = CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, round(self.card_size[0]), round(self.card_size[1]),
+                                   self.atlas.get_width(), self.atlas.get_height(), source_hash())
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            temp_path = path + '.tmp'
+            with open(temp_path, 'wb') as file:
+                file.write(header)
+                file.write(pygame.image.tobytes(self.atlas, 'RGBA'))
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"Could not write card cache {path}: {e}")
+
+    def pack(self, image_path, position):
+        # Loads and scales one image into its atlas slot
+        try:
+            image = pygame.image.load(image_path)
+        except pygame.error as e:
+            print(f"Error loading image {image_path}: {e}")
+            sys.exit(1)
+        image = pygame.transform.scale(image, self.card_size)
+        # BLEND_RGBA_MAX onto the cleared atlas copies the pixels, alpha included, as they are
+        self.atlas.blit(image, position, special_flags=pygame.BLEND_RGBA_MAX)
+
+    def describe(self):
+        source = 'cache' if self.from_cache else 'images'
+        return f'{len(self.faces) + 1} card images loaded from {source} in {self.load_time * 1000:.1f} ms, {self.memory_bytes / 1024:.0f} KiB'
+
+
+# One set of assets per card size for the whole process
+_card_assets = {}
+
+def get_card_assets(card_size):
+    # Returns the shared CardAssets for the card size, loading them the first time
+    assets = _card_assets.get(tuple(card_size))
+    if assets is None:
+        assets = CardAssets(card_size)
+        _card_assets[tuple(card_size)] = assets
+    return assets
+
+
+def build_cache(card_size):
+    # Build step: rescales the source images and rewrites the cache for the card size
+    assets = CardAssets(card_size, use_cache=False)
+    assets.save_cache()
+    return cache_path(card_size)
+
+if __name__ == "__main__":
+    from card import CARD_WIDTH, CARD_HEIGHT
+    pygame.init()
+    print(f'Wrote {build_cache((CARD_WIDTH, CARD_HEIGHT))}')
@@ -0,0 +1,316 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+
+# Rendering runs headless, this has to be set before pygame is imported
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import pygame
+
+'''
+Benchmark suite for the rules, layout, hit testing, rendering, new games and cold start.
+
+Every benchmark plays seeded deals (see deals.py), so two runs measure the same work. Results are written
+as JSON, and a run can be compared against an earlier results file to catch regressions:
+
+    python benchmark.py --output before.json
+    python benchmark.py --output after.json --compare before.json
+
+Each benchmark reports the mean, p50, p99 and minimum time of one iteration, plus per iteration the peak
+bytes allocated (tracemalloc) and the net change in allocated memory blocks (a steady non-zero value
+is a leak). Allocations are measured in separate iterations, so tracing doesn't slow the timed ones.
+'''
+
+RESULTS_VERSION = 1
+BENCHMARK_DEALS = [1, 2, 3, 4, 5, 6, 7, 8] # Deal numbers the benchmarks play
+REGRESSION_THRESHOLD = 0.10 # Relative slowdown of p50 reported as a regression by --compare
+
+
+def summarise(times):
+    times = sorted(times)
+    return {
+        'iterations': len(times),
+        'mean_us': sum(times) / len(times) * 1e6,
+        'p50_us': times[len(times) // 2] * 1e6,
+        'p99_us': times[min(len(times) - 1, int(len(times) * 0.99))] * 1e6,
+        'min_us': times[0] * 1e6,
+    }
+
+def measure(run, iterations, setup=None, alloc_iterations=20):
+    # Times `iterations` calls of run() (each after an untimed setup() if given), then traces a few more
+    # calls for allocations. Returns the result dict of the benchmark.
+    for _ in range(min(10, iterations)):
+        if setup:
+            setup()
+        run()
+
+    times = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    result = summarise(times)
+
+    peaks = []
+    blocks = []
+    tracemalloc.start()
+    try:
+        for _ in range(alloc_iterations):
+            if setup:
+                setup()
+            tracemalloc.reset_peak()
+            before_bytes = tracemalloc.get_traced_memory()[0]
+            before_blocks = sys.getallocatedblocks()
+            run()
+            blocks.append(sys.getallocatedblocks() - before_blocks)
+            peaks.append(tracemalloc.get_traced_memory()[1] - before_bytes)
+    finally:
+        tracemalloc.stop()
+    result['alloc_peak_bytes'] = sorted(peaks)[len(peaks) // 2]
+    result['net_blocks'] = sorted(blocks)[len(blocks) // 2]
+    return result
+
+
+def new_ui():
+    # A Ui on the first benchmark deal, whatever game was autosaved. Its score events go nowhere, so the
+    # benchmark moves don't end up in the player's score log.
+    from ui import Ui
+    from gamemode import Gamemode
+    from events import NullSink
+    ui = Ui(NullSink())
+    ui.setup(Gamemode.KLONDIKE, deal_id=BENCHMARK_DEALS[0])
+    ui.render()
+    return ui
+
+def play_random_moves(ui, rng, count):
+    # Plays up to `count` random legal moves through the Deck, as the player would
+    from engine import STOCK
+    deck = ui.deck
+    for _ in range(count):
+        moves = deck.state.legal_moves()
+        if not moves:
+            return
+        move = rng.choice(moves)
+        if move.count == 0:
+            if move.src == STOCK:
+                deck.transfer_card_from_deck_to_waste()
+            else:
+                deck.transfer_waste_to_deck()
+        else:
+            pile = deck.piles[move.src]
+            deck.move_card(pile.cards[-move.count], pile, deck.piles[move.dst])
+
+def positions(ui, rng, count=20):
+    # Sets up `count` reproducible mid-game positions spread over the benchmark deals, yielding after each one
+    from gamemode import Gamemode
+    for deal_id in BENCHMARK_DEALS:
+        for _ in range(count // len(BENCHMARK_DEALS) or 1):
+            ui.setup(Gamemode.KLONDIKE, deal_id=deal_id)
+            play_random_moves(ui, rng, rng.randint(0, 60))
+            yield
+
+
+def bench_is_valid_move(ui, iterations):
+    # Every face-up card against every pile, over a set of mid-game positions
+    rng = random.Random(1)
+    checks = []
+    for _ in positions(ui, rng):
+        deck = ui.deck
+        cards = [(card, pile) for pile in deck.piles for card in pile.cards if card.discovered]
+        checks.append((deck, [(card, origin, target) for card, origin in cards for target in deck.piles]))
+    total = sum(len(batch) for _, batch in checks)
+
+    def run():
+        for deck, batch in checks:
+            for card, origin, target in batch:
+                deck.is_valid_move(card, origin, target)
+    result = measure(run, iterations)
+    result['per_call_us'] = result['p50_us'] / total
+    return result
+
+def bench_move_card(ui, iterations):
+    # One legal move_card per iteration from the same mid-game position, taken back with undo outside the timing
+    from gamemode import Gamemode
+    rng = random.Random(2)
+    ui.setup(Gamemode.KLONDIKE, deal_id=BENCHMARK_DEALS[1])
+    play_random_moves(ui, rng, 20)
+    deck = ui.deck
+    moves = [move for move in deck.state.legal_moves() if move.count]
+    current = [None]
+
+    def setup():
+        if current[0] is not None:
+            deck.undo()
+        # The Ui would take these every frame
+        deck.dirty_rects.clear()
+        current[0] = rng.choice(moves)
+
+    def run():
+        move = current[0]
+        pile = deck.piles[move.src]
+        deck.move_card(pile.cards[-move.count], pile, deck.piles[move.dst])
+    return measure(run, iterations, setup)
+
+def bench_update_positions(ui, iterations):
+    rng = random.Random(3)
+    for _ in positions(ui, rng, 1):
+        pass
+    piles = ui.deck.piles
+
+    def run():
+        for pile in piles:
+            pile.update_positions()
+    return measure(run, iterations)
+
+def bench_get_card_at_position(ui, iterations):
+    rng = random.Random(4)
+    for _ in positions(ui, rng, 1):
+        pass
+    deck = ui.deck
+    width, height = ui.screen.get_size()
+    points = [(rng.randrange(width), rng.randrange(height)) for _ in range(1000)]
+
+    def run():
+        for point in points:
+            deck.get_card_at_position(point)
+    result = measure(run, iterations)
+    result['per_call_us'] = result['p50_us'] / len(points)
+    return result
+
+def bench_display(ui, iterations, cached):
+    # Deck.display onto the screen, rebuilding the draw list every time unless cached
+    rng = random.Random(5)
+    for _ in positions(ui, rng, 1):
+        pass
+    deck = ui.deck
+    screen = ui.screen
+    run = (lambda: deck.display(screen)) if cached else (lambda: (deck.invalidate_draw_list(), deck.display(screen)))
+    return measure(run, iterations)
+
+def bench_full_frame(ui, iterations):
+    # A whole-screen Ui.draw_frame, as drawn after a dialog opens or closes
+    rng = random.Random(6)
+    for _ in positions(ui, rng, 1):
+        pass
+    return measure(ui.draw_frame, iterations)
+
+def bench_setup(ui, iterations):
+    # New game latency, cycling through the benchmark deals
+    from gamemode import Gamemode
+    deals = iter(BENCHMARK_DEALS * (iterations // len(BENCHMARK_DEALS) + 20))
+    return measure(lambda: ui.setup(Gamemode.KLONDIKE, deal_id=next(deals)), iterations)
+
+def bench_cold_start(iterations):
+    # Wall time from starting a new interpreter to the first frame on screen, see cold_start_child
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), '--cold-start-child'],
+                               cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+        times.append(time.perf_counter() - start)
+        if child.returncode:
+            raise RuntimeError(f'cold start failed:\n{child.stderr}')
+    return summarise(times)
+
+def cold_start_child():
+    # Starts the game as main.py does and exits after the first frame
+    from ui import Ui
+    from events import NullSink
+    ui = Ui(NullSink())
+    ui.render()
+    ui.score_events.close()
+    ui.hints.close()
+
+
+def run_benchmarks(quick=False):
+    scale = 0.1 if quick else 1.0
+    def count(n):
+        return max(20, int(n * scale))
+
+    ui = new_ui()
+    benchmarks = [
+        ('rules.is_valid_move', lambda: bench_is_valid_move(ui, count(200))),
+        ('rules.move_card', lambda: bench_move_card(ui, count(5000))),
+        ('layout.update_positions', lambda: bench_update_positions(ui, count(5000))),
+        ('hit.get_card_at_position', lambda: bench_get_card_at_position(ui, count(500))),
+        ('render.display_cached', lambda: bench_display(ui, count(2000), True)),
+        ('render.display_rebuild', lambda: bench_display(ui, count(2000), False)),
+        ('render.full_frame', lambda: bench_full_frame(ui, count(1000))),
+        ('game.setup', lambda: bench_setup(ui, count(300))),
+        ('startup.cold_start', lambda: bench_cold_start(max(3, int(10 * scale)))),
+    ]
+    results = {}
+    try:
+        for name, bench in benchmarks:
+            results[name] = bench()
+            print(f"{name:28} p50 {results[name]['p50_us']:10.1f} us  p99 {results[name]['p99_us']:10.1f} us")
+    finally:
+        ui.score_events.close()
+        ui.hints.close()
+    return results
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'video_driver': os.environ.get('SDL_VIDEODRIVER'),
+    }
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    # Prints the p50 change of every benchmark in both runs, returns the names that got slower than threshold
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        change = result['p50_us'] / old['p50_us'] - 1 if old['p50_us'] else 0.0
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:28} {old['p50_us']:10.1f} -> {result['p50_us']:10.1f} us ({change:+.1%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the benchmark suite.')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD, help='p50 slowdown counted as a regression')
+    parser.add_argument('--quick', action='store_true', help='run a tenth of the iterations')
+    parser.add_argument('--cold-start-child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.cold_start_child:
+        cold_start_child()
+        return
+
+    results = run_benchmarks(args.quick)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'version': RESULTS_VERSION, 'environment': environment(), 'results': results}, file, indent=2, sort_keys=True)
+            file.write('\n')
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if baseline.get('version') != RESULTS_VERSION:
+            print(f'{args.compare} was written by another version of the benchmarks')
+            sys.exit(2)
+        print()
+        if compare(results, baseline['results'], args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import random
+
+from engine import GameState, new_deck
+from gamemode import Gamemode
+
+'''
+Numbered deals: every 64-bit deal id maps to one fixed card order, the same on every machine and Python
+version, so a deal can be replayed, shared and benchmarked.
+
+The order comes from a splitmix64 generator seeded with the deal id driving a Fisher-Yates shuffle of
+new_deck(), with rejection so each index is exactly uniform. DEAL_VERSION names this algorithm; any change
+to it must get a new version so old deal numbers keep their cards.
+'''
+
+DEAL_VERSION = 1
+MAX_DEAL_ID = (1 << 64) - 1
+
+_MASK = (1 << 64) - 1
+
+
+def splitmix64(state):
+    # Returns the next generator state and its 64-bit output
+    state = (state + 0x9E3779B97F4A7C15) & _MASK
+    z = state
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK
+    return state, z ^ (z >> 31)
+
+def deal_order(deal_id, version=DEAL_VERSION):
+    # Returns the 52 card codes of the deal, in the order GameState.deal and Deck.load_piles deal them
+    if version != DEAL_VERSION:
+        raise ValueError(f'unknown deal version {version}')
+    if not 0 <= deal_id <= MAX_DEAL_ID:
+        raise ValueError(f'deal id {deal_id} is not a 64-bit number')
+
+    order = new_deck()
+    state = deal_id
+    for i in range(len(order) - 1, 0, -1):
+        # Lemire's multiply-shift, redrawing the few outputs that would bias the index
+        bound = i + 1
+        threshold = (-bound & _MASK) % bound
+        while True:
+            state, value = splitmix64(state)
+            product = value * bound
+            if product & _MASK >= threshold:
+                break
+        j = product >> 64
+        order[i], order[j] = order[j], order[i]
+    return order
+
+def deal(deal_id, gamemode=Gamemode.KLONDIKE):
+    # Headless GameState of the numbered deal
+    return GameState.deal(deal_order(deal_id), gamemode)
+
+def random_deal_id():
+    return random.getrandbits(64)
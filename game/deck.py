@@ -1,18 +1,14 @@
-import os
-import random
 import pygame
 from pile import *
 from card import *
 from pile_type import *
 from gamemode import Gamemode
-import sys
-
-# Directory of the current script
-script_dir = os.path.dirname(__file__)
-
-# Path for the cards' images
-back_of_card = os.path.join(script_dir, "resources", "miscellaneous", "card_back.jpg")
-cards_dir = os.path.join(script_dir,'resources', 'cards') 
+from engine import GameState, Move, DRAW, RECYCLE, PILE_COUNT, STOCK, TABLEAU_COUNT, WASTE, card_code
+from journal import MoveJournal, MOVE, DRAWN
+from deals import DEAL_VERSION, deal, deal_order
+from replay import Replay, decode_moves
+from assets import get_card_assets
+from hitindex import HitIndex
 
 class Deck:
     #Represents the deck of cards in the game
@@ -23,40 +19,37 @@ class Deck:
         self.values = CARD_VALUES
         self.mat_color = (136, 191, 134)
         self.piles = [] # List of Pile objects
-        self.card_images = {} # Dictionary to store card images
+        self.state = None # Headless GameState the piles are a view of
+        self.deal_id = None # Number of the deal being played, see deals.py
+        self.journal = MoveJournal() # Played moves, for undo and redo
+        self.cards_by_code = [] # Card objects indexed by their engine card code
+        self.hit_index = None # Finds the pile and card under a point
+        self.dirty_rects = [] # Screen areas changed since the Ui last drew them
+        self.draw_list = None # Cached (image, position) pairs drawn by display
+        self.unsaved = False # Set whenever the game state changes, cleared by the Ui's autosave
         self.card_size = card_size
 
-        # Load back of card image and resize
-        self.back_image_of_card = pygame.image.load(back_of_card)
-        self.back_image_of_card = self.resize_back_image_of_card()
-    
-    
-    def resize_back_image_of_card(self):
-        return pygame.transform.scale(self.back_image_of_card, self.card_size)
+        # Card images are loaded once per process and shared by every new game
+        self.assets = get_card_assets(card_size)
+        self.card_images = self.assets.faces # Card image filename -> image
+        self.back_image_of_card = self.assets.back
 
-    def resize_card_images(self):
-        for name_of_card, card_image in self.card_images.items():
-            self.card_images[name_of_card] = pygame.transform.scale(card_image, self.card_size)
+        # Mats are drawn slightly larger than the cards
+        margin = 3
+        self.mat_image = pygame.Surface((self.card_size[0] + (margin * 2), self.card_size[1] + (margin * 2)))
+        self.mat_image.fill(self.mat_color)
 
     def load_cards(self):
-        # Loads card images from resources and creates Card objects for each suit and value.
+        # Creates Card objects for each suit and value, their images come from the shared assets
         for suit in self.suits:
             for value in self.values:
                 filename = f'{value}_of_{suit}.png'
-                image_path = os.path.join(cards_dir, filename)
-                try:
-                    card_image = pygame.image.load(image_path)
-                    resized_image = pygame.transform.scale(card_image, self.card_size)
-                    # Use filename as the key to store the image
-                    self.card_images[filename] = resized_image
-                    # Also pass just the filename to the Card constructor
-                    self.cards.append(Card(filename, self.card_size, suit, value))
-                except pygame.error as e:
-                    print(f"Error loading image {image_path}: {e}")
-                    sys.exit(1)
-
-    def load_piles(self, display_size):
-        #Initializes the piles for the game.
+                # Pass just the filename to the Card constructor, it is the key of the card's image
+                self.cards.append(Card(filename, self.card_size, suit, value))
+        self.cards_by_code = list(self.cards)
+
+    def load_piles(self, display_size, state=None):
+        #Initializes the piles for the game, dealing a new game unless a saved GameState is given.
         SCREEN_WIDTH, SCREEN_HEIGHT = display_size
         pile_spacing = 50
         start_x = 50
@@ -74,12 +67,7 @@ class Deck:
         ]
 
         for cards, x, y in tableau_piles:
-            tableau = Pile(cards, x, y, (CARD_WIDTH, CARD_HEIGHT))
-            # Set all cards in the pile to face-down except the last one
-            for card in tableau.cards[:-1]:
-                card.discovered = False
-            tableau.cards[-1].discovered = True
-            self.piles.append(tableau)
+            self.piles.append(Pile(cards, x, y, (CARD_WIDTH, CARD_HEIGHT)))
 
         # Initialize stock, waste, and foundation piles
         stock = Pile(self.cards[28:], start_x, pile_spacing, (CARD_WIDTH, CARD_HEIGHT), pile_type=PileType.STOCK)
@@ -92,52 +80,103 @@ class Deck:
         # Aggregate all piles into a list
         self.piles.extend([stock, waste, foundation1, foundation2, foundation3, foundation4])
 
-    def shuffle_cards(self):
-        # Shuffles the cards in the deck.
-        random.shuffle(self.cards)
-
-    def update(self, piles_to_update):
-        #Updates the specified piles or all piles if none are specified.
+        # Point lookups for picking up and dropping cards
+        self.hit_index = HitIndex(self.piles, self.card_size[0])
+
+        # Deal the same order into the game state, which owns the rules from here on
+        if state is None:
+            order = [card_code(card.suit, card.value) for card in self.cards]
+            state = GameState.deal(order, self.ui.starting_gamemode)
+        self.state = state
+        self.sync_piles()
+
+    def sync_piles(self, indices=None):
+        # Rebuilds the given piles (or all of them) from the game state. Faces are set from the first card that
+        # changed onward, and those cards are laid out when the piles are next drawn or hit tested.
+        for index in range(PILE_COUNT) if indices is None else indices:
+            pile = self.piles[index]
+            self.dirty_rects.append(self.pile_rect(pile))
+            cards = [self.cards_by_code[code] for code in self.state.piles[index]]
+            first = 0 if indices is None else self.first_change(index, cards)
+            for position in range(first, len(cards)):
+                cards[position].discovered = self.state.is_face_up(index, position)
+            pile.cards = cards
+            pile.mark_dirty(first)
+            self.dirty_rects.append(self.pile_rect(pile))
+        self.draw_list = None
+        self.unsaved = True
+
+    def first_change(self, index, cards):
+        # Returns the index of the first card of the pile that is not the same card with the same face in `cards`.
+        # Moves change the top of a pile and the face of the card under it, so the search starts at the top.
+        old = self.piles[index].cards
+        first = min(len(old), len(cards))
+        while first and (old[first - 1] is not cards[first - 1]
+                         or old[first - 1].discovered != self.state.is_face_up(index, first - 1)):
+            first -= 1
+        if old[:first] != cards[:first]:
+            # Changed further down, e.g. the waste turned back over onto the stock
+            return 0
+        if index < TABLEAU_COUNT:
+            # The faces further down are right if the face-down cards still end where the state says
+            hidden = self.state.hidden[index]
+            if (0 < hidden <= first and old[hidden - 1].discovered) or (hidden < first and not old[hidden].discovered):
+                return 0
+        return first
+
+    def layout(self):
+        # Lays out the cards that changed since the piles were last laid out
         for pile in self.piles:
-            pile.update()
-        if piles_to_update != None:
-            for pile in piles_to_update:
-                pile.update_positions()
-            
+            pile.layout()
+
+    def pile_rect(self, pile):
+        # Returns the screen area covered by the pile's mat and its laid out cards
+        margin = 3
+        width = self.card_size[0] + (margin * 2)
+        height = self.card_size[1] + (margin * 2)
+        if pile.fanned and pile.cards:
+            height += (len(pile.cards) - 1) * pile.card_spacing
+        if pile.pile_type == PileType.WASTE and self.ui.starting_gamemode == Gamemode.VEGAS:
+            # Room for the three card fan
+            width += 2 * 25
+        return pygame.Rect(pile.x - margin, pile.y - margin, width, height)
+
+    def shuffle_cards(self, deal_id):
+        # Puts the cards in the order of the numbered deal
+        self.deal_id = deal_id
+        self.cards = [self.cards_by_code[code] for code in deal_order(deal_id)]
+
     def get_card_at_position(self, mouse_pos):
-        #Returns the card and its pile at the given mouse position
-        for pile in self.piles:
-            for card in reversed(pile.cards):
-                if card.is_mouse_over(mouse_pos):
-                    return card, pile
-        return None, None
+        #Returns the card and its pile at the given mouse position, laid out so it can be picked up
+        self.layout()
+        return self.hit_index.card_at(mouse_pos)
 
     def get_pile_at_position(self, mouse_pos):
         #determines which pile is selected and it's position
-        for pile in self.piles:
-            if pile.is_mouse_over(mouse_pos): 
-                return pile
-        return None
+        return self.hit_index.pile_at(mouse_pos)
 
     def move_card(self, card, origin_pile, target_pile, score=None):
-        # checks if the move is valid using the existing logic
+        # Moves the card, and every card on top of it, from the origin pile to the target pile
         if not self.is_valid_move(card, origin_pile, target_pile):
             return False  # Exit if the move is not valid
 
-        # Remove the card from the origin pile and add it to the target pile
-        origin_pile.cards.remove(card)
-        target_pile.cards.append(card)
+        origin = self.piles.index(origin_pile)
+        target = self.piles.index(target_pile)
+        count = len(origin_pile.cards) - origin_pile.cards.index(card)
+        self.journal.play(self.state, Move(origin, target, count))
 
-        # If there are still cards in the origin pile, turn the new top card face up
-        if origin_pile.cards:
-            origin_pile.cards[-1].discovered = True
+        # Update cards and positions of both piles
+        self.sync_piles((origin, target))
 
-        # Update position of both piles
-        origin_pile.update_positions()
-        target_pile.update_positions()
-
-        # Update the score if a score object is passed, when card is moved from stock pile/deck to foundation pile or tableau pile
+        # Update the score if a score object is passed
         if score:
+            self.score_move(target_pile, count, score)
+
+        return True
+
+    def score_move(self, target_pile, count, score):
+        # Scores a move to the target pile, once for every card moved
+        for _ in range(count):
             # If the move is valid, increment the move count
             score.increment_move_count()
 
@@ -146,121 +185,106 @@ class Deck:
             elif target_pile.pile_type == PileType.TABLEAU:
                 score.move_to_tableau()
                 score.reset_consecutive_moves()
-            else: 
+            else:
                 score.reset_consecutive_moves()  # Reset the counter if the move is not to the foundation or tableau
 
-        return True
-    
-
-
-    
     def transfer_card_from_deck_to_waste(self):
-        # Find the deck and waste piles
-        deck_pile = next((pile for pile in self.piles if pile.pile_type == PileType.STOCK), None)
-        waste_pile = next((pile for pile in self.piles if pile.pile_type == PileType.WASTE), None)
+        # Turns the next card (three cards in Vegas) from the stock onto the waste pile
+        if self.journal.play(self.state, DRAW):
+            self.sync_piles((STOCK, WASTE))
+
+    def transfer_waste_to_deck(self):
+        # Turns the waste pile back over onto the empty stock pile, returns False if the game is lost
+        if self.journal.play(self.state, RECYCLE):
+            self.sync_piles((STOCK, WASTE))
+        return not self.state.lost
+
+    def restore_history(self, moves):
+        # Plays the encoded moves of a resumed game from its deal, so undo and the game's replay cover the
+        # whole game. Keeps the loaded state if the moves don't lead to it.
+        state = deal(self.deal_id, self.state.gamemode)
+        journal = MoveJournal()
+        for move in decode_moves(moves):
+            if journal.play(state, move) is None:
+                return False
+        if state.zobrist != self.state.zobrist or state.piles != self.state.piles:
+            return False
+        self.state = state
+        self.journal = journal
+        return True
 
-        if deck_pile and waste_pile and deck_pile.cards:
-            # Take the top card from the deck pile
-            card = deck_pile.cards.pop()
-            card.discovered = True  # Flip the card face up
+    def replay(self):
+        # The game so far as a Replay
+        return Replay(self.deal_id, self.state.gamemode, self.state.score, bytes(self.journal.encoded), DEAL_VERSION)
 
-            # Set the card's position to the waste pile's position
-            card.set_position(waste_pile.x, waste_pile.y)
+    def undo(self, score=None):
+        # Takes back the last move and its points, returns False if there is nothing to undo
+        delta = self.journal.undo(self.state)
+        if delta is None:
+            return False
+        self.sync_piles((delta.src, delta.dst))
+        if score:
+            score.undo(delta)
+        return True
 
-            waste_pile.cards.append(card) 
+    def redo(self, score=None):
+        # Plays the last undone move again, returns False if there is nothing to redo
+        delta = self.journal.redo(self.state)
+        if delta is None:
+            return False
+        self.sync_piles((delta.src, delta.dst))
+        if score:
+            if delta.kind == MOVE:
+                self.score_move(self.piles[delta.dst], delta.count, score)
+            elif delta.kind != DRAWN:
+                score.refresh_stockpile()
+        return True
 
-    def transfer_waste_to_deck(self):
-       
-        deck_pile = next((pile for pile in self.piles if pile.pile_type == PileType.STOCK), None)
-        waste_pile = next((pile for pile in self.piles if pile.pile_type == PileType.WASTE), None)
-
-        # Check if the stock pile is empty and the waste pile has cards
-        if deck_pile and waste_pile and not deck_pile.cards and waste_pile.cards:
-            # Reverse the order of cards in the waste pile to maintain the correct order when moving back to the deck
-            reversed_cards = reversed(waste_pile.cards)  
-            for card in reversed_cards:
-                card.discovered = False 
-                card.set_position(deck_pile.x, deck_pile.y)  # Set the card's position to the deck pile's position
-                deck_pile.cards.append(card)
-            waste_pile.cards.clear()  
-        
     def is_valid_move(self, card, origin_pile, target_pile):
-        # Check if the target pile is not empty
-        if target_pile.cards:
-            top_target_card = target_pile.cards[-1]
-            
-            # Ensure the move is to a tableau pile and check color and value rules
-            if target_pile.pile_type == PileType.TABLEAU:
-                # Different colors and the moving card's value is one less than the top card's value
-                if ((card.color != top_target_card.color) and
-                    (CARD_VALUE_MAP[card.value] == CARD_VALUE_MAP[top_target_card.value] - 1)):
-                    return True
-
-            # For moves to the foundation piles
-            elif target_pile.pile_type == PileType.FOUNDATION:
-                # Same suit and the moving card's value is one more than the top card's value
-                if (card.suit == top_target_card.suit and
-                    CARD_VALUE_MAP[card.value] == CARD_VALUE_MAP[top_target_card.value] + 1):
-                    return True
-
-        # If the target pile is empty and the moving card is an Ace
-        elif not target_pile.cards and card.value == "ace" and target_pile.pile_type == PileType.FOUNDATION:
-            return True
-
-        # If the target tableau pile is empty and the moving card is a King
-        elif not target_pile.cards and card.value == "king" and target_pile.pile_type == PileType.TABLEAU:
-            return True
-
-        return False
+        # Checks the move of the card, and every card on top of it, against the game rules
+        if card not in origin_pile.cards or target_pile not in self.piles:
+            return False
+        count = len(origin_pile.cards) - origin_pile.cards.index(card)
+        return self.state.can_move(self.piles.index(origin_pile), self.piles.index(target_pile), count)
 
     def display(self, game_display):
-        # draw the stock pile
-        stock_pile = next((pile for pile in self.piles if pile.pile_type == PileType.STOCK), None)
-        if stock_pile:
-            self.draw_pile(game_display, stock_pile)
-        
-        # draw the waste pile
-        waste_pile = next((pile for pile in self.piles if pile.pile_type == PileType.WASTE), None)
-        if waste_pile:
-            self.draw_pile(game_display, waste_pile)
-        
-        # Draw other piles
-        for pile in self.piles:
-            if pile not in [stock_pile, waste_pile]:
-                self.draw_pile(game_display, pile)
-
-    def draw_pile(self, game_display, pile):
-        margin = 3 
-
-        # Draw the mats with slightly larger size than cards
-        pygame.draw.rect(game_display, self.mat_color, [
-            pile.x - margin, 
-            pile.y - margin, 
-            self.card_size[0] + (margin * 2), 
-            self.card_size[1] + (margin * 2)
-        ])
-        # Draws cards on top of mats
+        # Draws every card with a single blits call, the draw list is kept until a pile changes.
+        # Returns the number of images drawn
+        if self.draw_list is None:
+            self.draw_list = self.build_draw_list()
+        game_display.blits(self.draw_list, doreturn=False)
+        return len(self.draw_list)
+
+    def invalidate_draw_list(self):
+        # Called when cards move on screen without the game state changing, e.g. while dragging
+        self.draw_list = None
+
+    def card_image(self, card):
+        return self.card_images[card.name_of_card] if card.discovered else self.back_image_of_card
+
+    def draw_mats(self, surface):
+        # The mats don't move, so the Ui draws them once into its background layer
+        margin = 3
+        surface.blits([(self.mat_image, (pile.x - margin, pile.y - margin)) for pile in self.piles], doreturn=False)
+
+    def build_draw_list(self):
+        # Returns the (image, position) pairs for a frame, the cards in pile order
+        self.layout()
+        draw_list = []
+        fan = []
+
         for pile in self.piles:
-            if pile.pile_type == PileType.WASTE:
-                if self.ui.starting_gamemode == Gamemode.KLONDIKE:
-                    for card in pile.cards:
-                        img = self.card_images[card.name_of_card] if card.discovered else self.back_image_of_card
-                        game_display.blit(img, (card.x, card.y))
-                else:
-                    # Some logic assisted by ChatGPT
-                    cards_to_draw = min(3, len(pile.cards))
-                    start_index = len(pile.cards) - cards_to_draw
-                    
-                    #if cards_to_draw > 0:
-                    fan_count = 0
-                    
-                    for _, card in enumerate(pile.cards[start_index:], start=start_index):
-                        img = self.card_images[card.name_of_card] if card.discovered else self.back_image_of_card
-                        game_display.blit(img, (card.x+fan_count*25, card.y))
-                        fan_count += 1
+            if pile.fanned:
+                cards = pile.cards
+            elif pile.pile_type == PileType.WASTE and self.ui.starting_gamemode == Gamemode.VEGAS:
+                # Vegas shows the top three waste cards fanned out, drawn last
+                cards = []
+                top_cards = pile.cards[-3:]
+                fan = [(self.card_image(card), (card.x + fan_count * 25, card.y)) for fan_count, card in enumerate(top_cards)]
             else:
-                for card in pile.cards:
-                    img = self.card_images[card.name_of_card] if card.discovered else self.back_image_of_card
-                    game_display.blit(img, (card.x, card.y))
+                # Stacked cards share a position, so only the top card shows (and the one below while it is dragged)
+                cards = pile.cards[-2:]
+            draw_list.extend((self.card_image(card), card.position) for card in cards)
 
-            
+        draw_list.extend(fan)
+        return draw_list
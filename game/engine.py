@@ -0,0 +1,475 @@
+import random
+from collections import namedtuple
+
+from card import CARD_SUITS, CARD_VALUES
+from gamemode import Gamemode
+
+# Pile indices, in the same order Deck.load_piles builds self.piles
+TABLEAU_COUNT = 7
+STOCK = 7
+WASTE = 8
+FOUNDATION_START = 9
+PILE_COUNT = 13
+TABLEAU_PILES = range(0, TABLEAU_COUNT)
+FOUNDATION_PILES = range(FOUNDATION_START, PILE_COUNT)
+
+# Cards are encoded as suit_index * 13 + (rank - 1), suits in CARD_SUITS order
+DECK_SIZE = len(CARD_SUITS) * len(CARD_VALUES)
+RED_SUITS = (CARD_SUITS.index("hearts"), CARD_SUITS.index("diamonds"))
+ACE = 1
+KING = 13
+
+# A move takes the top `count` cards of pile `src` onto pile `dst`.
+# Drawing from the stock and recycling the waste are expressed as the two special moves below.
+Move = namedtuple('Move', ['src', 'dst', 'count'])
+DRAW = Move(STOCK, WASTE, 0)
+RECYCLE = Move(WASTE, STOCK, 0)
+
+
+# Zobrist keys, fixed so the same position hashes the same in every run.
+# A tableau card is keyed by the card under it (BASE for the bottom card) rather than by its column, so
+# swapping whole columns gives the same hash, and foundation cards are keyed by the card alone.
+BASE = DECK_SIZE
+_zobrist_random = random.Random(0x50117a12e)
+TABLEAU_KEYS = [_zobrist_random.getrandbits(64) for _ in range(DECK_SIZE * (DECK_SIZE + 1) * 2)]
+FOUNDATION_KEYS = [_zobrist_random.getrandbits(64) for _ in range(DECK_SIZE)]
+STOCK_KEYS = [_zobrist_random.getrandbits(64) for _ in range(DECK_SIZE * DECK_SIZE)]
+WASTE_KEYS = [_zobrist_random.getrandbits(64) for _ in range(DECK_SIZE * DECK_SIZE)]
+BUDGET_KEYS = [_zobrist_random.getrandbits(64) for _ in range(4)]
+
+
+def tableau_key(card, under, face_up):
+    # Key of a tableau card lying on card `under` (BASE at the bottom of a pile)
+    return TABLEAU_KEYS[(card * (DECK_SIZE + 1) + under) * 2 + face_up]
+
+def stock_key(card, index):
+    return STOCK_KEYS[card * DECK_SIZE + index]
+
+def waste_key(card, index):
+    return WASTE_KEYS[card * DECK_SIZE + index]
+
+def budget_key(draw_count):
+    # Every count of 0 or less plays the same, as does every count above 3
+    return BUDGET_KEYS[min(max(draw_count, 0), 3)]
+
+
+def card_code(suit, value):
+    # Returns the int code of the card with the given suit and value names.
+    return CARD_SUITS.index(suit) * 13 + CARD_VALUES.index(value)
+
+def card_suit(code):
+    return code // 13
+
+def card_rank(code):
+    # Rank from 1 (ace) to 13 (king), matching CARD_VALUE_MAP
+    return code % 13 + 1
+
+def card_is_red(code):
+    return code // 13 in RED_SUITS
+
+def card_name(code):
+    # Returns the image filename used for the card in resources/cards
+    return f'{CARD_VALUES[code % 13]}_of_{CARD_SUITS[code // 13]}.png'
+
+def is_safe(heights, card):
+    '''
+    Whether playing the card to its foundation can never cost the game, given the foundation height of each
+    suit. Aces and twos always are. Any other card is once both suits of the other colour are up to one rank
+    below it, so nothing left needs it to build on, and the other suit of its colour is up to two ranks below
+    it. Without that last condition, a card of that suit two ranks below could still need a card of the other
+    colour taken back off the foundations, and that card this one.
+    '''
+    rank = card % 13 + 1
+    if rank <= 2:
+        return True
+    suit = card // 13
+    other = (suit + 2) % 4
+    if suit in RED_SUITS:
+        return heights[0] >= rank - 1 and heights[2] >= rank - 1 and heights[other] >= rank - 2
+    return heights[1] >= rank - 1 and heights[3] >= rank - 1 and heights[other] >= rank - 2
+
+def new_deck():
+    # Card codes in the order Deck.load_cards creates the Card objects
+    return list(range(DECK_SIZE))
+
+
+class GameState:
+    """
+    Headless Klondike game state, independent of pygame.
+
+    Attributes:
+        piles (list): 13 lists of card codes, bottom card first (7 tableau, stock, waste, 4 foundations).
+        hidden (list): Number of face-down cards at the bottom of each tableau pile.
+        gamemode (Gamemode): Rules in use, Klondike (draw 1) or Vegas (draw 3).
+        draw_amount (int): Number of cards drawn from the stock per click.
+        draw_count (int): Remaining stock recycles before a pass with no moves ends the game.
+        move_made (bool): Whether a card was moved since the last stock recycle.
+        lost (bool): Set when the stock is recycled with no move made and no recycles left.
+        score, moves_made, consecutive_foundation_moves, stockpile_refresh_count: Same meaning as in Score.
+        foundation_height (list): Number of cards of each suit on the foundations, kept up to date by move.
+        foundation_pile (list): Foundation pile holding each suit, or None before its ace is played.
+        zobrist (int): 64-bit hash of the card layout and recycle budget, kept up to date by every change.
+            Positions that only differ in the order of the tableau or foundation piles hash equally.
+    """
+
+    __slots__ = ('piles', 'hidden', 'gamemode', 'draw_amount', 'draw_count', 'move_made', 'lost',
+                 'score', 'moves_made', 'consecutive_foundation_moves', 'stockpile_refresh_count',
+                 'foundation_height', 'foundation_pile', 'zobrist')
+
+    def __init__(self, gamemode=Gamemode.KLONDIKE):
+        self.piles = [[] for _ in range(PILE_COUNT)]
+        self.hidden = [0] * TABLEAU_COUNT
+        self.gamemode = gamemode
+        # Same values Settings.update_settings applies for each gamemode
+        self.draw_amount = 1 if gamemode == Gamemode.KLONDIKE else 3
+        self.draw_count = self.draw_amount
+        self.move_made = False
+        self.lost = False
+        self.score = 0 if gamemode == Gamemode.KLONDIKE else -52
+        self.moves_made = 0
+        self.consecutive_foundation_moves = 0
+        self.stockpile_refresh_count = 0
+        self.foundation_height = [0] * len(CARD_SUITS)
+        self.foundation_pile = [None] * len(CARD_SUITS)
+        self.zobrist = budget_key(self.draw_count)
+
+    @classmethod
+    def deal(cls, order, gamemode=Gamemode.KLONDIKE):
+        # Deals the 52 card codes in `order` the same way Deck.load_piles does:
+        # tableau pile i takes the next i + 1 cards with only the last one face up, the rest go to the stock.
+        state = cls(gamemode)
+        start = 0
+        for i in TABLEAU_PILES:
+            state.piles[i] = list(order[start:start + i + 1])
+            state.hidden[i] = i
+            start += i + 1
+        state.piles[STOCK] = list(order[start:])
+        state.zobrist = state.compute_zobrist()
+        return state
+
+    def copy(self):
+        state = GameState.__new__(GameState)
+        state.piles = [list(pile) for pile in self.piles]
+        state.hidden = list(self.hidden)
+        state.gamemode = self.gamemode
+        state.draw_amount = self.draw_amount
+        state.draw_count = self.draw_count
+        state.move_made = self.move_made
+        state.lost = self.lost
+        state.score = self.score
+        state.moves_made = self.moves_made
+        state.consecutive_foundation_moves = self.consecutive_foundation_moves
+        state.stockpile_refresh_count = self.stockpile_refresh_count
+        state.foundation_height = list(self.foundation_height)
+        state.foundation_pile = list(self.foundation_pile)
+        state.zobrist = self.zobrist
+        return state
+
+    def compute_zobrist(self):
+        # Hashes the whole position from scratch, moves keep self.zobrist up to date without this
+        key = budget_key(self.draw_count)
+        for pile in TABLEAU_PILES:
+            under = BASE
+            for index, card in enumerate(self.piles[pile]):
+                key ^= tableau_key(card, under, index >= self.hidden[pile])
+                under = card
+        for pile in FOUNDATION_PILES:
+            for card in self.piles[pile]:
+                key ^= FOUNDATION_KEYS[card]
+        for index, card in enumerate(self.piles[STOCK]):
+            key ^= stock_key(card, index)
+        for index, card in enumerate(self.piles[WASTE]):
+            key ^= waste_key(card, index)
+        return key
+
+    def _pile_key(self, pile, index):
+        # Key of the face-up card at `index` of pile, as it lies there
+        cards = self.piles[pile]
+        card = cards[index]
+        if pile < TABLEAU_COUNT:
+            return tableau_key(card, cards[index - 1] if index else BASE, True)
+        if pile == WASTE:
+            return waste_key(card, index)
+        return FOUNDATION_KEYS[card]
+
+    def is_face_up(self, pile, index):
+        if pile < TABLEAU_COUNT:
+            return index >= self.hidden[pile]
+        return pile != STOCK
+
+    def face_up_count(self, pile):
+        # Number of cards at the top of the pile that can be picked up together
+        if pile < TABLEAU_COUNT:
+            return len(self.piles[pile]) - self.hidden[pile]
+        if pile == STOCK or not self.piles[pile]:
+            return 0
+        return 1
+
+    def accepts(self, pile, card):
+        # Mirrors the colour, suit and value checks of Deck.is_valid_move
+        cards = self.piles[pile]
+        if pile < TABLEAU_COUNT:
+            if not cards:
+                return card % 13 == KING - 1
+            top = cards[-1]
+            return card_is_red(card) != card_is_red(top) and card % 13 == top % 13 - 1
+        if pile >= FOUNDATION_START:
+            if not cards:
+                return card % 13 == ACE - 1
+            top = cards[-1]
+            return card // 13 == top // 13 and card % 13 == top % 13 + 1
+        return False
+
+    def can_move(self, src, dst, count=1):
+        if src == dst or count < 1 or count > self.face_up_count(src):
+            return False
+        # Only tableau piles accept more than one card at a time
+        if count > 1 and dst >= TABLEAU_COUNT:
+            return False
+        return self.accepts(dst, self.piles[src][-count])
+
+    def move(self, src, dst, count=1):
+        # Moves the top `count` cards of pile src onto pile dst, returns False if the move is not allowed.
+        if not self.can_move(src, dst, count):
+            return False
+
+        # Only the bottom moved card changes what it lies on, the cards above it keep their keys
+        origin = self.piles[src]
+        self.zobrist ^= self._pile_key(src, len(origin) - count)
+        self.piles[dst].extend(origin[-count:])
+        del origin[-count:]
+        self.zobrist ^= self._pile_key(dst, len(self.piles[dst]) - count)
+
+        # Keep the foundation summaries up to date, the source first so an ace moving between foundations
+        # ends up recorded on its new pile
+        if src >= FOUNDATION_START:
+            suit = self.piles[dst][-1] // 13
+            self.foundation_height[suit] -= 1
+            if not origin:
+                self.foundation_pile[suit] = None
+        if dst >= FOUNDATION_START:
+            suit = self.piles[dst][-1] // 13
+            self.foundation_height[suit] += 1
+            self.foundation_pile[suit] = dst
+
+        # Turn the new top card of a tableau pile face up
+        if src < TABLEAU_COUNT and origin and self.hidden[src] == len(origin):
+            self.hidden[src] -= 1
+            under = origin[-2] if len(origin) > 1 else BASE
+            self.zobrist ^= tableau_key(origin[-1], under, False) ^ tableau_key(origin[-1], under, True)
+
+        # Score each moved card the way Deck.move_card does
+        self.moves_made += count
+        if dst >= FOUNDATION_START:
+            self.consecutive_foundation_moves += 1
+            score_modifier = 10 if self.gamemode == Gamemode.KLONDIKE else 5
+            self.score += score_modifier * self.consecutive_foundation_moves
+        else:
+            self.score += 10 * count
+            self.consecutive_foundation_moves = 0
+
+        self.move_made = True
+        return True
+
+    def draw(self):
+        # Turns up to draw_amount cards from the stock onto the waste, returns the number of cards drawn.
+        stock = self.piles[STOCK]
+        waste = self.piles[WASTE]
+        drawn = min(self.draw_amount, len(stock))
+        for _ in range(drawn):
+            card = stock.pop()
+            self.zobrist ^= stock_key(card, len(stock)) ^ waste_key(card, len(waste))
+            waste.append(card)
+        return drawn
+
+    def recycle(self):
+        # Turns the waste back over onto the empty stock, returns False if the stock still has cards.
+        if self.piles[STOCK]:
+            return False
+
+        '''
+        Draw 3 allows for 3 complete shuffles of the stock,
+        Draw 1 allows for 1 complete shuffle of the stock.
+        Once they are used up, a pass through the stock without any move ends the game.
+        '''
+        self.zobrist ^= budget_key(self.draw_count) ^ budget_key(self.draw_count - 1)
+        self.draw_count -= 1
+        if not self.move_made and self.draw_count <= 0:
+            self.lost = True
+        self.move_made = False
+
+        self._flip_talon()
+        self.score -= 5
+        self.stockpile_refresh_count += 1
+        return True
+
+    def undo_move(self, src, dst, count, flipped):
+        # Puts the top `count` cards of dst back on src, turning src's top card face down again if
+        # the move flipped it. Counters are restored by the caller (see journal.MoveJournal).
+        target = self.piles[dst]
+        origin = self.piles[src]
+        if src < TABLEAU_COUNT and flipped:
+            self.hidden[src] += 1
+            under = origin[-2] if len(origin) > 1 else BASE
+            self.zobrist ^= tableau_key(origin[-1], under, False) ^ tableau_key(origin[-1], under, True)
+        if dst >= FOUNDATION_START:
+            suit = target[-1] // 13
+            self.foundation_height[suit] -= 1
+            if len(target) == 1:
+                self.foundation_pile[suit] = None
+        if src >= FOUNDATION_START:
+            suit = target[-1] // 13
+            self.foundation_height[suit] += 1
+            self.foundation_pile[suit] = src
+        self.zobrist ^= self._pile_key(dst, len(target) - count)
+        origin.extend(target[-count:])
+        del target[-count:]
+        self.zobrist ^= self._pile_key(src, len(origin) - count)
+
+    def undo_draw(self, count):
+        # Puts the last `count` drawn cards back on the stock
+        stock = self.piles[STOCK]
+        waste = self.piles[WASTE]
+        for _ in range(count):
+            card = waste.pop()
+            self.zobrist ^= waste_key(card, len(waste)) ^ stock_key(card, len(stock))
+            stock.append(card)
+
+    def undo_recycle(self):
+        # Turns the stock back over onto the waste, the caller restores draw_count with restore_budget
+        self._flip_talon()
+
+    def restore_budget(self, draw_count):
+        # Sets draw_count back to an earlier value, e.g. when a recycle is undone
+        self.zobrist ^= budget_key(self.draw_count) ^ budget_key(draw_count)
+        self.draw_count = draw_count
+
+    def _flip_talon(self):
+        # Turns the whole waste over onto the stock, or the stock onto the waste, one of them being empty
+        stock = self.piles[STOCK]
+        waste = self.piles[WASTE]
+        for index, card in enumerate(stock):
+            self.zobrist ^= stock_key(card, index) ^ waste_key(card, len(stock) - 1 - index)
+        for index, card in enumerate(waste):
+            self.zobrist ^= waste_key(card, index) ^ stock_key(card, len(waste) - 1 - index)
+        self.piles[STOCK] = waste[::-1]
+        self.piles[WASTE] = stock[::-1]
+
+    def apply(self, move):
+        # Plays a Move, including the special DRAW and RECYCLE moves.
+        if move.src == STOCK:
+            return self.draw() > 0
+        if move.src == WASTE and move.dst == STOCK:
+            return self.recycle()
+        return self.move(move.src, move.dst, move.count)
+
+    def is_won(self):
+        return all(len(self.piles[pile]) == 13 for pile in FOUNDATION_PILES)
+
+    def is_safe(self, card):
+        # Whether playing the card to its foundation can never cost the game, see is_safe
+        return is_safe(self.foundation_height, card)
+
+    def foundation_move(self, src):
+        # The Move of the top card of src onto its foundation, or None if it doesn't fit there yet
+        cards = self.piles[src]
+        if not cards or (src < TABLEAU_COUNT and self.hidden[src] == len(cards)):
+            return None
+        card = cards[-1]
+        suit = card // 13
+        if self.foundation_height[suit] != card % 13:
+            return None
+        dst = self.foundation_pile[suit]
+        if dst is None:
+            dst = next(pile for pile in FOUNDATION_PILES if not self.piles[pile])
+        return Move(src, dst, 1)
+
+    def next_safe_move(self):
+        # A safe foundation move from the waste or a tableau pile, or None. Only the top cards are looked at.
+        for src in (WASTE, *TABLEAU_PILES):
+            move = self.foundation_move(src)
+            if move is not None and self.is_safe(self.piles[src][-1]):
+                return move
+        return None
+
+    def can_auto_complete(self):
+        # Once every card is face up in the tableau the game plays itself out
+        return not self.piles[STOCK] and not self.piles[WASTE] and not any(self.hidden)
+
+    def next_finishing_move(self):
+        # The lowest card that can go to the foundations, or None, for playing out a game that can_auto_complete
+        moves = [move for move in map(self.foundation_move, TABLEAU_PILES) if move is not None]
+        return min(moves, key=lambda move: self.piles[move.src][-1] % 13, default=None)
+
+    def recycle_loses(self):
+        # Whether turning the waste over now would end the game
+        return not self.move_made and self.draw_count <= 1
+
+    def legal_moves(self):
+        '''
+        Returns every legal Move, including DRAW and RECYCLE.
+
+        Moves that only swap identical piles around are left out: a king run that already starts an
+        empty-bottomed tableau pile moving to another empty pile, and an ace moving between foundations.
+        Runs are found from the face-down counts and the foundation moves from the per-suit heights,
+        so no card is compared against every pile.
+        '''
+        piles = self.piles
+        hidden = self.hidden
+        heights = self.foundation_height
+        moves = []
+        empty_tableau = [pile for pile in TABLEAU_PILES if not piles[pile]]
+        empty_foundations = [pile for pile in FOUNDATION_PILES if not piles[pile]]
+        tableau_tops = [(pile, piles[pile][-1]) for pile in TABLEAU_PILES if piles[pile]]
+
+        def to_foundation(src, card):
+            suit = card // 13
+            if heights[suit] == card % 13:
+                if heights[suit]:
+                    moves.append(Move(src, self.foundation_pile[suit], 1))
+                else:
+                    moves.extend(Move(src, pile, 1) for pile in empty_foundations)
+
+        def to_tableau(src, card):
+            # A single card onto any tableau pile that takes it
+            for dst, top in tableau_tops:
+                if dst != src and card % 13 == top % 13 - 1 and card_is_red(card) != card_is_red(top):
+                    moves.append(Move(src, dst, 1))
+            if card % 13 == KING - 1:
+                moves.extend(Move(src, dst, 1) for dst in empty_tableau)
+
+        for src in TABLEAU_PILES:
+            cards = piles[src]
+            first = hidden[src]
+            if first >= len(cards):
+                continue
+            to_foundation(src, cards[-1])
+
+            # The face-up run descends one rank per card, so the only card that fits a target is at a known index
+            bottom_rank = cards[first] % 13
+            top_rank = cards[-1] % 13
+            for dst, top in tableau_tops:
+                if dst == src:
+                    continue
+                rank = top % 13 - 1
+                if top_rank <= rank <= bottom_rank:
+                    index = first + bottom_rank - rank
+                    if card_is_red(cards[index]) != card_is_red(top):
+                        moves.append(Move(src, dst, len(cards) - index))
+            if bottom_rank == KING - 1 and first:
+                moves.extend(Move(src, dst, len(cards) - first) for dst in empty_tableau)
+
+        if piles[WASTE]:
+            card = piles[WASTE][-1]
+            to_foundation(WASTE, card)
+            to_tableau(WASTE, card)
+
+        for src in FOUNDATION_PILES:
+            if piles[src]:
+                to_tableau(src, piles[src][-1])
+
+        if piles[STOCK]:
+            moves.append(DRAW)
+        elif piles[WASTE]:
+            moves.append(RECYCLE)
+        return moves
@@ -0,0 +1,226 @@
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from gamemode import Gamemode
+from simulate import DEFAULT_MAX_STEPS, POLICIES, np, random_orders, simulate
+
+'''
+Monte Carlo estimates of the win rate, the score (mean and variance), moves made and stock recycles for
+each rule set under each playout policy, played out by simulate.py in a process pool. Needs NumPy.
+
+Every (rule set, policy) pair is played in chunks of random deals. Chunk i of a pair gets its own random
+stream derived from (seed, rule set, policy, i), so the results depend only on the seed and not on which
+worker played what. Chunks are merged in order as they finish, and a pair stops as soon as the 95%
+confidence intervals of its win rate and mean score are both within the requested widths.
+
+    python estimate.py --policy random greedy foundation-first --win-ci 0.005 --score-ci 25
+'''
+
+# Gamemodes and the stock recycle budget each starts with (GameState.draw_count, the draw amount)
+RULE_SETS = {
+    'klondike': (Gamemode.KLONDIKE, 1),
+    'vegas': (Gamemode.VEGAS, 3),
+}
+Z_95 = 1.959964
+
+
+class Estimate:
+    """
+    Running totals of one (rule set, policy) pair. Chunks are merged with Chan's parallel variance
+    update, so the score variance never needs the individual scores.
+    """
+
+    def __init__(self, rules, policy):
+        self.rules = rules
+        self.policy = policy
+        self.games = 0
+        self.wins = 0
+        self.score_mean = 0.0
+        self.score_m2 = 0.0 # Sum of squared differences from the mean
+        self.moves = 0
+        self.recycles = 0
+        self.done = False
+        self.stopped_by = None
+
+    def merge(self, part):
+        # Adds the totals of a chunk, see play_chunk
+        games = self.games + part['games']
+        delta = part['score_mean'] - self.score_mean
+        self.score_mean += delta * part['games'] / games
+        self.score_m2 += part['score_m2'] + delta * delta * self.games * part['games'] / games
+        self.games = games
+        self.wins += part['wins']
+        self.moves += part['moves']
+        self.recycles += part['recycles']
+
+    def win_rate(self):
+        return self.wins / self.games if self.games else 0.0
+
+    def win_interval(self):
+        # Half width of the Wilson score interval, which stays sensible for win rates near 0 or 1
+        if not self.games:
+            return math.inf
+        n = self.games
+        p = self.win_rate()
+        return Z_95 * math.sqrt(p * (1 - p) / n + Z_95 * Z_95 / (4 * n * n)) / (1 + Z_95 * Z_95 / n)
+
+    def score_variance(self):
+        return self.score_m2 / (self.games - 1) if self.games > 1 else 0.0
+
+    def score_interval(self):
+        if self.games < 2:
+            return math.inf
+        return Z_95 * math.sqrt(self.score_variance() / self.games)
+
+    def summary(self):
+        return {
+            'rules': self.rules,
+            'policy': self.policy,
+            'games': self.games,
+            'win_rate': self.win_rate(),
+            'win_rate_ci': self.win_interval(),
+            'score_mean': self.score_mean,
+            'score_ci': self.score_interval(),
+            'score_variance': self.score_variance(),
+            'moves_mean': self.moves / self.games if self.games else 0.0,
+            'recycles_mean': self.recycles / self.games if self.games else 0.0,
+            'stopped_by': self.stopped_by,
+        }
+
+
+def play_chunk(gamemode, recycles, policy, games, seed, stream, max_steps):
+    # Worker side: plays `games` random deals on the chunk's own random stream, returns the chunk's totals
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=stream))
+    playouts = simulate(random_orders(games, rng), gamemode, policy, max_steps, rng, recycles=recycles)
+    score = playouts.score.astype(np.float64)
+    return {
+        'games': games,
+        'wins': int(playouts.won.sum()),
+        'score_mean': float(score.mean()),
+        'score_m2': float(((score - score.mean()) ** 2).sum()),
+        'moves': int(playouts.moves_made.sum()),
+        'recycles': int(playouts.recycles.sum()),
+    }
+
+
+def run_estimates(rule_sets, policies, seed=0, win_ci=0.005, score_ci=25.0, min_games=20000, max_games=1000000,
+                  chunk_size=4096, workers=None, max_steps=DEFAULT_MAX_STEPS):
+    # Plays every (rule set, policy) pair until its intervals are tight enough or it reaches max_games,
+    # returns their Estimates
+    estimates = [Estimate(rules, policy) for rules in rule_sets for policy in policies]
+    next_chunk = [0] * len(estimates)
+    finished_chunks = [dict() for _ in estimates] # Chunk results waiting for the ones before them
+    merged_chunks = [0] * len(estimates)
+    workers = workers or os.cpu_count() or 1
+    started = time.perf_counter()
+
+    def submit(pool, index):
+        # Queues the pair's next chunk, returns None once it has enough chunks queued or merged
+        estimate = estimates[index]
+        if estimate.done or next_chunk[index] * chunk_size >= max_games:
+            return None
+        chunk = next_chunk[index]
+        next_chunk[index] += 1
+        gamemode, recycles = RULE_SETS[estimate.rules]
+        games = min(chunk_size, max_games - chunk * chunk_size)
+        stream = (list(RULE_SETS).index(estimate.rules), POLICIES.index(estimate.policy), chunk)
+        future = pool.submit(play_chunk, gamemode, recycles, estimate.policy, games, seed, stream, max_steps)
+        future.key = (index, chunk)
+        return future
+
+    with ProcessPoolExecutor(workers) as pool:
+        # Keep a couple of chunks queued per worker, taking turns between the pairs still running
+        pending = set()
+        turn = 0
+        def refill():
+            nonlocal turn
+            idle = 0
+            while len(pending) < workers * 2 and idle < len(estimates):
+                future = submit(pool, turn % len(estimates))
+                turn += 1
+                idle = 0 if future is not None else idle + 1
+                if future is not None:
+                    pending.add(future)
+        refill()
+
+        while pending:
+            finished_futures, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished_futures:
+                index, chunk = future.key
+                estimate = estimates[index]
+                if estimate.done:
+                    continue
+                finished_chunks[index][chunk] = future.result()
+
+                # Merge in chunk order, so where a pair stops doesn't depend on the workers' timing
+                while merged_chunks[index] in finished_chunks[index] and not estimate.done:
+                    estimate.merge(finished_chunks[index].pop(merged_chunks[index]))
+                    merged_chunks[index] += 1
+                    if estimate.games >= min_games and estimate.win_interval() <= win_ci and estimate.score_interval() <= score_ci:
+                        estimate.done = True
+                        estimate.stopped_by = 'confidence'
+                    elif estimate.games >= max_games:
+                        estimate.done = True
+                        estimate.stopped_by = 'max_games'
+                if estimate.done:
+                    finished_chunks[index].clear()
+
+            # Chunks queued for pairs that have stopped are not needed any more
+            for future in [future for future in pending if estimates[future.key[0]].done]:
+                if future.cancel():
+                    pending.discard(future)
+            refill()
+
+            games = sum(estimate.games for estimate in estimates)
+            running = sum(not estimate.done for estimate in estimates)
+            elapsed = time.perf_counter() - started
+            print(f'{games} games, {running} of {len(estimates)} estimates running, {games / elapsed:.0f} games/s',
+                  end='\r', flush=True)
+
+    print()
+    return estimates
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Estimate win rates and scores for each rule set and playout policy.')
+    parser.add_argument('--rules', nargs='+', choices=list(RULE_SETS), default=list(RULE_SETS))
+    parser.add_argument('--policy', nargs='+', choices=POLICIES, default=list(POLICIES))
+    parser.add_argument('--seed', type=int, default=0, help='seed of every random stream')
+    parser.add_argument('--win-ci', type=float, default=0.005, help='stop once the 95%% interval of the win rate is within +- this')
+    parser.add_argument('--score-ci', type=float, default=25.0, help='stop once the 95%% interval of the mean score is within +- this')
+    parser.add_argument('--min-games', type=int, default=20000, help='games played before stopping early')
+    parser.add_argument('--max-games', type=int, default=1000000, help='games played at most per rule set and policy')
+    parser.add_argument('--chunk-size', type=int, default=4096, help='games per task')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--max-steps', type=int, default=DEFAULT_MAX_STEPS, help='moves before a game is abandoned')
+    parser.add_argument('--output', help='write the estimates to this JSON file')
+    args = parser.parse_args()
+
+    if np is None:
+        print('estimate.py needs NumPy: pip install numpy')
+        sys.exit(2)
+
+    estimates = run_estimates(args.rules, args.policy, args.seed, args.win_ci, args.score_ci, args.min_games,
+                              args.max_games, args.chunk_size, args.workers, args.max_steps)
+
+    print(f"{'rules':10} {'policy':17} {'games':>8} {'win rate':>17} {'mean score':>19} {'score sd':>9} {'moves':>7} {'recycles':>8}")
+    for estimate in estimates:
+        summary = estimate.summary()
+        print(f"{estimate.rules:10} {estimate.policy:17} {summary['games']:8} "
+              f"{summary['win_rate']:8.2%} +-{summary['win_rate_ci']:6.2%} "
+              f"{summary['score_mean']:9.1f} +-{summary['score_ci']:6.1f} {math.sqrt(summary['score_variance']):9.1f} "
+              f"{summary['moves_mean']:7.1f} {summary['recycles_mean']:8.2f}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'seed': args.seed, 'max_steps': args.max_steps, 'estimates': [estimate.summary() for estimate in estimates]},
+                      file, indent=2)
+            file.write('\n')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+import time
+from collections import deque, namedtuple
+
+'''
+Score events: every change to the score is emitted as a ScoreEvent, buffered in memory and handed to the
+sinks in batches by a background writer thread, so scoring never waits on a file or a log shipper.
+
+The stream is drop-tolerant: emit never blocks, and once `capacity` events are waiting the newest are
+dropped and counted in EventStream.dropped instead.
+
+A sink is any object with write(events), called on the writer thread with a list of ScoreEvents, and close().
+'''
+
+# Kinds of score event
+TABLEAU = 'tableau'
+FOUNDATION = 'foundation'
+FROM_FOUNDATION = 'from_foundation'
+REFRESH = 'refresh'
+UNDO = 'undo'
+
+ScoreEvent = namedtuple('ScoreEvent', ['kind', 'time', 'delta', 'score', 'consecutive'])
+'''
+One change to the score:
+    kind: What scored, one of the kinds above
+    time: Unix time of the change
+    delta: Points added (negative if taken away)
+    score: Score after the change
+    consecutive: Consecutive foundation moves after the change
+'''
+
+# Directory of the current script
+script_dir = os.path.dirname(__file__)
+SCORE_EVENT_LOG = os.path.join(script_dir, 'resources', 'logs', 'score_events.jsonl')
+
+
+class NullSink:
+    """
+    Discards every event.
+    """
+
+    def write(self, events):
+        pass
+
+    def close(self):
+        pass
+
+
+class JsonlSink:
+    """
+    Appends each event as a line of JSON to a file, opened on the first batch.
+    """
+
+    def __init__(self, path=SCORE_EVENT_LOG):
+        self.path = path
+        self.file = None
+
+    def write(self, events):
+        if self.file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.file = open(self.path, 'a')
+        self.file.write(''.join(json.dumps(event._asdict()) + '\n' for event in events))
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class AggregatorSink:
+    """
+    Keeps running totals in memory: points and event counts per kind, and the longest run of
+    consecutive foundation moves. Read them with summary(), from any thread.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.points = {}
+        self.counts = {}
+        self.longest_streak = 0
+
+    def write(self, events):
+        with self.lock:
+            for event in events:
+                self.points[event.kind] = self.points.get(event.kind, 0) + event.delta
+                self.counts[event.kind] = self.counts.get(event.kind, 0) + 1
+                self.longest_streak = max(self.longest_streak, event.consecutive)
+
+    def summary(self):
+        with self.lock:
+            return {'points': dict(self.points), 'counts': dict(self.counts), 'longest_streak': self.longest_streak}
+
+    def close(self):
+        pass
+
+
+class EventStream:
+    """
+    Buffers events and writes them to the sinks from a background thread, every `flush_interval`
+    seconds or as soon as `batch_size` events are waiting. The thread starts on the first event.
+    """
+
+    def __init__(self, *sinks, capacity=10000, batch_size=256, flush_interval=0.5):
+        self.sinks = sinks or (NullSink(),)
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.buffer = deque() # Appended by emit, emptied by the writer thread
+        self.dropped = 0
+        self.wake = threading.Event()
+        self.closed = False
+        self.writer = None
+
+    def emit(self, event):
+        # Queues the event for the sinks, dropping it if the buffer is full
+        if self.closed or len(self.buffer) >= self.capacity:
+            self.dropped += 1
+            return
+        self.buffer.append(event)
+        if self.writer is None:
+            self.writer = threading.Thread(target=self.run, name='score-events', daemon=True)
+            self.writer.start()
+        elif len(self.buffer) >= self.batch_size:
+            self.wake.set()
+
+    def run(self):
+        while not self.closed:
+            self.wake.wait(self.flush_interval)
+            self.wake.clear()
+            self.write_pending()
+        self.write_pending()
+
+    def write_pending(self):
+        # Writer side: hands everything buffered to the sinks, batch_size events at a time
+        while self.buffer:
+            batch = []
+            while self.buffer and len(batch) < self.batch_size:
+                batch.append(self.buffer.popleft())
+            for sink in self.sinks:
+                try:
+                    sink.write(batch)
+                except Exception as e:
+                    # A broken sink loses its events, it must not stop the others or the game
+                    print(f"Score event sink {type(sink).__name__} failed: {e}")
+
+    def close(self, timeout=1.0):
+        # Writes out what is buffered (waiting at most `timeout` seconds) and closes the sinks
+        if self.closed:
+            return
+        self.closed = True
+        if self.writer is not None:
+            self.wake.set()
+            self.writer.join(timeout)
+        for sink in self.sinks:
+            sink.close()
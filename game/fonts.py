@@ -0,0 +1,54 @@
+import pygame
+from collections import OrderedDict
+
+# (name, size) of the fonts used around the game, a name of None is pygame's default font
+DEFAULT_FONT = ('Times New Roman', 18)
+TITLE_FONT = ('Times New Roman', 24)
+HUD_FONT = (None, 30)
+
+_fonts = {}
+
+def get_font(name, size):
+    # Returns the shared Font object for (name, size), creating it on first use
+    key = (name, size)
+    font = _fonts.get(key)
+    if font is None:
+        font = pygame.font.Font(None, size) if name is None else pygame.font.SysFont(name, size)
+        _fonts[key] = font
+    return font
+
+
+class TextCache:
+    """
+    Rendered text surfaces keyed by (font, string, colour), least recently used entries are evicted first.
+    """
+
+    def __init__(self, max_size=256):
+        self.max_size = max_size
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, content, colour):
+        key = (font, content, tuple(colour))
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = font.render(content, True, colour)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
+
+text_cache = TextCache()
+
+def render_text(font, content, colour):
+    # Renders the text through the shared cache, the returned surface must not be modified
+    return text_cache.render(font, content, colour)
@@ -0,0 +1,102 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from engine import DRAW, RECYCLE, TABLEAU_COUNT, FOUNDATION_START, WASTE
+from save import encode, decode
+from solver import Solver
+
+# Seconds a hint search may take
+HINT_TIME_LIMIT = 1.0
+HINT_NODE_LIMIT = 200000
+
+
+def best_move(state, time_limit=HINT_TIME_LIMIT):
+    # Returns the Move to suggest: the first move of a win the solver finds in time, otherwise the best
+    # looking legal move, or None when there is nothing left to do
+    result = Solver(HINT_NODE_LIMIT, time_limit).solve(state)
+    if result.solvable and result.moves:
+        # The solver's moves are GameState moves already, draws included
+        return result.moves[0]
+
+    def rank(move):
+        # Foundation moves first, then moves turning up a hidden card, then the rest of the tableau moves
+        if move.count == 0:
+            return 0
+        if move.dst >= FOUNDATION_START:
+            return 4
+        if move.src < TABLEAU_COUNT and state.hidden[move.src] and state.hidden[move.src] == len(state.piles[move.src]) - move.count:
+            return 3
+        if move.src == WASTE:
+            return 2
+        return 1
+
+    # Moves back and forth between tableau piles and off the foundations are left out unless they free a card
+    moves = [move for move in state.legal_moves() if rank(move) > 1 or move == DRAW or move == RECYCLE]
+    if not moves:
+        return None
+    return max(moves, key=rank)
+
+def lower_priority():
+    # Worker start-up: on a machine short of cores the frame loop gets the CPU before the search
+    if hasattr(os, 'nice'):
+        os.nice(10)
+
+def search(record, time_limit):
+    # Worker side: the state comes in as its save record, which is far cheaper to send than the object
+    return best_move(decode(record), time_limit)
+
+
+class HintEngine:
+    """
+    Runs hint searches in a separate process so the frame loop never waits on them.
+
+    Each request bumps `generation`; a result only counts if no newer request or cancel happened since,
+    so a hint for a position the player has already left is dropped. on_done is called from a
+    background thread with the finished generation. `failed` is set when the latest search raised
+    instead of finishing.
+    """
+
+    def __init__(self, on_done=None, time_limit=HINT_TIME_LIMIT):
+        self.on_done = on_done
+        self.time_limit = time_limit
+        self.pool = None # Started on the first request
+        self.generation = 0
+        self.future = None
+        self.failed = False
+
+    def request(self, state):
+        # Starts a search on a snapshot of the state
+        self.cancel()
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(max_workers=1, initializer=lower_priority)
+        generation = self.generation
+        self.future = self.pool.submit(search, encode(state), self.time_limit)
+        if self.on_done:
+            self.future.add_done_callback(lambda future: self.on_done(generation))
+
+    def busy(self):
+        return self.future is not None and not self.future.done()
+
+    def result(self, generation):
+        # The suggested Move (or None) of a finished search, if it is still the latest request
+        if generation != self.generation or self.future is None or not self.future.done() or self.future.cancelled():
+            return None
+        try:
+            return self.future.result()
+        except Exception:
+            self.failed = True
+            return None
+
+    def cancel(self):
+        # Drops the running search, its result will be ignored
+        self.generation += 1
+        self.failed = False
+        if self.future is not None:
+            self.future.cancel()
+            self.future = None
+
+    def close(self):
+        self.cancel()
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
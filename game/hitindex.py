@@ -0,0 +1,59 @@
+class HitIndex:
+    """
+    Finds the pile and card under a screen point without scanning every card.
+
+    Piles never move sideways, so each pile is filed once under the columns of width cell_width it
+    spans. A point then only checks the one or two piles filed under its column, and the card inside a
+    fanned pile follows from the card_spacing arithmetic of Pile.card_position. The bottom edge of
+    each pile is refreshed through Pile.mark_dirty whenever its cards change.
+
+    Results are the same as scanning the laid out cards with Card.is_mouse_over and Pile.is_mouse_over,
+    with earlier piles in the list winning.
+    """
+
+    def __init__(self, piles, cell_width):
+        self.piles = piles
+        self.cell_width = cell_width
+        self.cells = {} # Column number -> indices of the piles spanning it, in pile order
+        self.bottoms = [0] * len(piles) # Bottom edge of each pile, as used by Pile.is_mouse_over
+
+        for index, pile in enumerate(piles):
+            first_cell = int(pile.x // cell_width)
+            last_cell = int((pile.x + pile.card_width) // cell_width)
+            for cell in range(first_cell, last_cell + 1):
+                self.cells.setdefault(cell, []).append(index)
+            pile.hit_index = self
+            pile.hit_slot = index
+            self.update_pile(pile)
+
+    def update_pile(self, pile):
+        # Called by Pile.mark_dirty
+        pile_height = pile.card_height + (len(pile.cards) - 1) * pile.card_spacing if pile.fanned else pile.card_height
+        self.bottoms[pile.hit_slot] = pile.y + pile_height
+
+    def candidates(self, x):
+        return self.cells.get(int(x // self.cell_width), ())
+
+    def pile_at(self, mouse_pos):
+        x, y = mouse_pos
+        for index in self.candidates(x):
+            pile = self.piles[index]
+            if pile.x <= x <= pile.x + pile.card_width and pile.y <= y <= self.bottoms[index]:
+                return pile
+        return None
+
+    def card_at(self, mouse_pos):
+        # Returns the topmost card under the point and its pile, or (None, None)
+        x, y = mouse_pos
+        for index in self.candidates(x):
+            pile = self.piles[index]
+            if not pile.cards or not pile.x <= x <= pile.x + pile.card_width or y < pile.y:
+                continue
+            if pile.fanned:
+                # Cards start card_spacing apart, the last one starting above the point is on top
+                card_index = min(len(pile.cards) - 1, int((y - pile.y) // pile.card_spacing))
+                if y <= pile.y + card_index * pile.card_spacing + pile.card_height:
+                    return pile.cards[card_index], pile
+            elif y <= pile.y + pile.card_height:
+                return pile.cards[-1], pile
+        return None, None
@@ -0,0 +1,151 @@
+from array import array
+from collections import namedtuple
+
+from engine import DRAW, RECYCLE, Move, STOCK, WASTE
+
+# Kinds of journal entries
+MOVE = 0
+DRAWN = 1
+RECYCLED = 2
+
+Delta = namedtuple('Delta', ['kind', 'src', 'dst', 'count', 'flipped', 'move_made', 'lost', 'consecutive', 'score'])
+'''
+One played move as the journal stores it:
+    kind: MOVE, DRAWN or RECYCLED
+    src, dst, count: piles and number of cards moved (cards drawn for DRAWN)
+    flipped: whether the move turned the new top card of src face up
+    move_made, lost, consecutive: GameState.move_made, lost and consecutive_foundation_moves before the move
+    score: points the move added to the score
+'''
+
+# Bit layout of a packed entry, the score delta takes the (signed) high bits
+_SRC_SHIFT = 2
+_DST_SHIFT = 6
+_COUNT_SHIFT = 10
+_FLIPPED_BIT = 1 << 16
+_MOVE_MADE_BIT = 1 << 17
+_LOST_BIT = 1 << 18
+_CONSECUTIVE_SHIFT = 19
+_SCORE_SHIFT = 26
+
+
+def pack(delta):
+    return (delta.kind | delta.src << _SRC_SHIFT | delta.dst << _DST_SHIFT | delta.count << _COUNT_SHIFT
+            | (_FLIPPED_BIT if delta.flipped else 0) | (_MOVE_MADE_BIT if delta.move_made else 0)
+            | (_LOST_BIT if delta.lost else 0) | delta.consecutive << _CONSECUTIVE_SHIFT | delta.score << _SCORE_SHIFT)
+
+def unpack(entry):
+    return Delta(entry & 3, entry >> _SRC_SHIFT & 15, entry >> _DST_SHIFT & 15, entry >> _COUNT_SHIFT & 63,
+                 bool(entry & _FLIPPED_BIT), bool(entry & _MOVE_MADE_BIT), bool(entry & _LOST_BIT),
+                 entry >> _CONSECUTIVE_SHIFT & 127, entry >> _SCORE_SHIFT)
+
+def replay_bytes(delta):
+    # The move in the replay encoding (see replay.py): src << 4 | dst, then the count, which is 0 for the talon
+    if delta.kind == MOVE:
+        return bytes((delta.src << 4 | delta.dst, delta.count))
+    move = DRAW if delta.kind == DRAWN else RECYCLE
+    return bytes((move.src << 4 | move.dst, move.count))
+
+
+class MoveJournal:
+    """
+    Unlimited undo/redo for a GameState, one 8 byte entry per move.
+
+    Entries before `position` can be undone, the ones after it redone. Playing a new move drops the redo entries.
+    Undo and redo only touch the moved cards.
+
+    `encoded` holds the moves up to `position` in the replay encoding, kept up to date move by move so saving
+    the game never encodes its whole history again.
+    """
+
+    def __init__(self):
+        self.entries = array('q')
+        self.position = 0
+        self.encoded = bytearray()
+
+    def __len__(self):
+        return self.position
+
+    def can_undo(self):
+        return self.position > 0
+
+    def can_redo(self):
+        return self.position < len(self.entries)
+
+    def play(self, state, move):
+        # Plays the Move on the state and records it, returns the Delta or None if nothing happened
+        delta = self._apply(state, move)
+        if delta is not None:
+            del self.entries[self.position:]
+            self.entries.append(pack(delta))
+            self.encoded += replay_bytes(delta)
+            self.position += 1
+        return delta
+
+    def undo(self, state):
+        # Takes back the last move, returns its Delta or None if there is nothing to undo
+        if not self.position:
+            return None
+        self.position -= 1
+        del self.encoded[-2:]
+        delta = unpack(self.entries[self.position])
+        if delta.kind == MOVE:
+            state.undo_move(delta.src, delta.dst, delta.count, delta.flipped)
+            state.moves_made -= delta.count
+        elif delta.kind == DRAWN:
+            state.undo_draw(delta.count)
+        else:
+            state.undo_recycle()
+            state.restore_budget(state.draw_count + 1)
+            state.stockpile_refresh_count -= 1
+        state.score -= delta.score
+        state.move_made = delta.move_made
+        state.lost = delta.lost
+        state.consecutive_foundation_moves = delta.consecutive
+        return delta
+
+    def redo(self, state):
+        # Plays the next undone move again, returns its Delta or None if there is nothing to redo
+        if self.position == len(self.entries):
+            return None
+        delta = unpack(self.entries[self.position])
+        if delta.kind == MOVE:
+            self._apply(state, Move(delta.src, delta.dst, delta.count))
+        else:
+            self._apply(state, DRAW if delta.kind == DRAWN else RECYCLE)
+        self.encoded += replay_bytes(delta)
+        self.position += 1
+        return delta
+
+    def moves(self):
+        # The Moves that lead from the deal to the current position, undone moves left out
+        moves = []
+        for entry in self.entries[:self.position]:
+            delta = unpack(entry)
+            if delta.kind == MOVE:
+                moves.append(Move(delta.src, delta.dst, delta.count))
+            else:
+                moves.append(DRAW if delta.kind == DRAWN else RECYCLE)
+        return moves
+
+    def clear(self):
+        del self.entries[:]
+        self.position = 0
+        del self.encoded[:]
+
+    def _apply(self, state, move):
+        move_made, lost, consecutive, score = state.move_made, state.lost, state.consecutive_foundation_moves, state.score
+        if move.src == STOCK:
+            count = state.draw()
+            if not count:
+                return None
+            return Delta(DRAWN, STOCK, WASTE, count, False, move_made, lost, consecutive, 0)
+        if move.src == WASTE and move.dst == STOCK:
+            if not state.recycle():
+                return None
+            return Delta(RECYCLED, WASTE, STOCK, 0, False, move_made, lost, consecutive, state.score - score)
+        hidden = state.hidden[move.src] if move.src < len(state.hidden) else 0
+        if not state.move(move.src, move.dst, move.count):
+            return None
+        flipped = move.src < len(state.hidden) and state.hidden[move.src] < hidden
+        return Delta(MOVE, move.src, move.dst, move.count, flipped, move_made, lost, consecutive, state.score - score)
@@ -0,0 +1,57 @@
+import time
+import pygame
+from collections import deque
+
+
+class FrameScheduler:
+    """
+    Paces the main loop: capped at active_fps while something is moving, otherwise blocked on the
+    event queue (waking up at least every idle_timeout_ms) so an idle game uses no CPU.
+
+    Keeps the last `history` frames to report the achieved frame rate and frame-time percentiles.
+    """
+
+    def __init__(self, active_fps=60, idle_timeout_ms=500, history=600):
+        self.active_fps = active_fps
+        self.idle_timeout_ms = idle_timeout_ms
+        self.clock = pygame.time.Clock()
+        self.frame_intervals = deque(maxlen=history) # Seconds from one frame start to the next
+        self.frame_times = deque(maxlen=history) # Seconds spent working in each frame
+        self.frame_start = None
+
+    def next_frame(self, active):
+        # Waits for the next frame and returns its events
+        if active:
+            self.clock.tick(self.active_fps)
+            events = pygame.event.get()
+        else:
+            event = pygame.event.wait(self.idle_timeout_ms)
+            events = [] if event.type == pygame.NOEVENT else [event] + pygame.event.get()
+            # Keeps the clock from counting the idle wait against the next capped frame
+            self.clock.tick()
+
+        now = time.perf_counter()
+        if self.frame_start is not None:
+            self.frame_intervals.append(now - self.frame_start)
+        self.frame_start = now
+        return events
+
+    def end_frame(self):
+        # Records how long the frame took to handle events and render
+        if self.frame_start is not None:
+            self.frame_times.append(time.perf_counter() - self.frame_start)
+
+    def fps(self):
+        total = sum(self.frame_intervals)
+        return len(self.frame_intervals) / total if total else 0.0
+
+    def percentile(self, percent):
+        # Frame time in seconds below which `percent` of the recent frames fall
+        if not self.frame_times:
+            return 0.0
+        times = sorted(self.frame_times)
+        return times[min(len(times) - 1, int(len(times) * percent / 100))]
+
+    def describe(self):
+        return (f'{self.fps():.1f} fps, frame time p50 {self.percentile(50) * 1000:.2f} ms, '
+                f'p95 {self.percentile(95) * 1000:.2f} ms, p99 {self.percentile(99) * 1000:.2f} ms')
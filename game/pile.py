@@ -27,13 +27,20 @@ class Pile:
         # The cards that belong to this pile.
         self.cards = cards
 
+        # Set by HitIndex, which is told when the cards change.
+        self.hit_index = None
+        self.hit_slot = None
+
+        # Index of the first card whose position is out of date, None while the pile is laid out.
+        self.dirty_from = 0
+
         # Update the pile to apply initial settings.
         self.update()  
     
     @property
     def pile_bottom_card(self):
         # Calculates and returns the y-coordinate of the bottom of the pile.
-        return self.cards[-1].position[1] + self.card_height
+        return self.card_position(len(self.cards) - 1)[1] + self.card_height
 
     def update_faces(self):
         # Updates the face-up or face-down state of cards in the pile based on the pile's discovery attribute.
@@ -41,11 +48,31 @@ class Pile:
             for card in self.cards:
                 card.discovered = self.discovered if self.discovered is not None else card.discovered
 
+    def card_position(self, index):
+        # Returns where the card at the index is laid out, spacing cards vertically if the pile is fanned.
+        return (self.x, self.y + (index * self.card_spacing)) if self.fanned else (self.x, self.y)
+
+    def mark_dirty(self, index=0):
+        # The cards from the index up have changed, they are laid out by the next call to layout.
+        if self.dirty_from is None or index < self.dirty_from:
+            self.dirty_from = index
+        if self.hit_index is not None:
+            self.hit_index.update_pile(self)
+
+    def layout(self):
+        # Positions the cards from the first changed one onward, if any changed since the last layout.
+        if self.dirty_from is None:
+            return
+        cards = self.cards
+        spacing = self.card_spacing if self.fanned else 0
+        for index in range(self.dirty_from, len(cards)):
+            cards[index].position = (self.x, self.y + (index * spacing))
+        self.dirty_from = None
+
     def update_positions(self):
-        # Updates the positions of the cards in the pile, spacing them vertically if the pile is fanned.
-        if self.cards:
-            for index, card in enumerate(self.cards):
-                card.position = (self.x, self.y + (index * self.card_spacing)) if self.fanned else (self.x, self.y)
+        # Lays out every card in the pile again.
+        self.mark_dirty()
+        self.layout()
 
     def update(self):
         # Updates the faces and positions of the cards in the pile to reflect any changes in the pile's state.
@@ -0,0 +1,260 @@
+import cProfile
+import csv
+import io
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+from collections import deque
+
+import pygame
+
+from fonts import get_font, render_text
+
+'''
+Per-phase frame timing for Ui.mainloop, with an on-screen overlay and on-demand profiling.
+
+The main loop calls begin_frame once the frame's events are in, mark(phase) at the end of each phase (the
+time since the previous mark goes to that phase) and end_frame once the frame is on screen. Frames are kept
+in a ring buffer of `history` records, each with its phase times, the number of images blitted and the net
+change in allocated memory blocks.
+
+Hotkeys (see handle_key):
+    F3  show or hide the overlay
+    F4  export the ring buffer to CSV and JSONL files in resources/profiles, printing the pacing summary
+    F5  start or stop a cProfile capture, stopping writes a .prof file and prints the top functions
+    F6  start or stop a tracemalloc capture, stopping writes a snapshot and prints the top allocation sites
+'''
+
+# Phases of a frame, in the order the main loop runs them
+PHASES = ('events', 'auto_play', 'win_check', 'autosave', 'background', 'deck', 'gui', 'hud', 'drag', 'overlay', 'flip')
+COLUMNS = ('frame', 'time', 'total_ms') + tuple(f'{phase}_ms' for phase in PHASES) + ('blits', 'alloc_blocks')
+
+# Directory of the current script
+script_dir = os.path.dirname(__file__)
+PROFILE_DIR = os.path.join(script_dir, 'resources', 'profiles')
+
+# Seconds between overlay updates, and how many recent frames it averages
+OVERLAY_REFRESH = 0.5
+OVERLAY_FRAMES = 120
+OVERLAY_FONT = (None, 18)
+OVERLAY_POSITION = (8, 440)
+
+
+class FrameProfiler:
+    """
+    Collects the phase times of every frame. Marks outside a frame (e.g. a draw_frame call from the
+    benchmarks) are ignored, so instrumented code runs the same without a main loop.
+    """
+
+    def __init__(self, history=600, output_dir=PROFILE_DIR, pacing=None):
+        self.output_dir = output_dir
+        # The main loop's FrameScheduler, its frame rate and frame-time percentiles go in the overlay and exports
+        self.pacing = pacing
+        self.records = deque(maxlen=history)
+        self.frame_count = 0
+
+        # Timing of the frame in progress, frame_start is None between frames
+        self.frame_start = None
+        self.last_mark = None
+        self.phase_times = dict.fromkeys(PHASES, 0.0)
+        self.blits = 0
+        self.blocks_before = 0
+
+        # Overlay surface and when it was last redrawn, `overlay_changed` asks the Ui to redraw its area
+        self.overlay_visible = False
+        self.overlay = None
+        self.overlay_rect = pygame.Rect(OVERLAY_POSITION, (0, 0))
+        self.overlay_updated = 0.0
+        self.overlay_changed = False
+
+        # Running captures
+        self.profile = None
+        self.tracing = False
+
+    def begin_frame(self):
+        self.blocks_before = sys.getallocatedblocks()
+        for phase in PHASES:
+            self.phase_times[phase] = 0.0
+        self.blits = 0
+        self.frame_start = self.last_mark = time.perf_counter()
+
+    def mark(self, phase):
+        # Adds the time since the previous mark to `phase`
+        if self.frame_start is None:
+            return
+        now = time.perf_counter()
+        self.phase_times[phase] += now - self.last_mark
+        self.last_mark = now
+
+    def count_blits(self, count=1):
+        self.blits += count
+
+    def end_frame(self):
+        if self.frame_start is None:
+            return
+        now = time.perf_counter()
+        self.frame_count += 1
+        self.records.append((self.frame_count, time.time(), (now - self.frame_start) * 1000,
+                             *(self.phase_times[phase] * 1000 for phase in PHASES),
+                             self.blits, sys.getallocatedblocks() - self.blocks_before))
+        self.frame_start = None
+
+    def averages(self, frames=OVERLAY_FRAMES):
+        # Returns ({column: mean}, {column: max}) over the last `frames` frames
+        recent = list(self.records)[-frames:]
+        if not recent:
+            return {}, {}
+        columns = list(zip(*recent))
+        means = {name: sum(values) / len(values) for name, values in zip(COLUMNS, columns)}
+        peaks = {name: max(values) for name, values in zip(COLUMNS, columns)}
+        return means, peaks
+
+    # Overlay
+
+    def toggle_overlay(self):
+        self.overlay_visible = not self.overlay_visible
+        self.overlay_updated = 0.0
+        self.overlay_changed = True
+
+    def refresh_overlay(self):
+        # Rebuilds the overlay every OVERLAY_REFRESH seconds, returns the screen area to redraw or None
+        if self.overlay_visible and time.perf_counter() - self.overlay_updated >= OVERLAY_REFRESH:
+            old_rect = self.overlay_rect
+            self.overlay = self.build_overlay()
+            self.overlay_rect = self.overlay.get_rect(topleft=OVERLAY_POSITION)
+            self.overlay_updated = time.perf_counter()
+            self.overlay_changed = False
+            return old_rect.union(self.overlay_rect)
+        if self.overlay_changed:
+            # Hidden, the area it covered needs drawing once more
+            self.overlay_changed = False
+            return self.overlay_rect
+        return None
+
+    def build_overlay(self):
+        # Rows are (label, mean, max), plain text lines span the whole width
+        means, peaks = self.averages()
+        rows = [(f'last {min(len(self.records), OVERLAY_FRAMES)} frames', 'mean ms', 'max ms')]
+        for phase in PHASES + ('total',):
+            column = f'{phase}_ms'
+            rows.append((phase, f'{means.get(column, 0.0):.3f}', f'{peaks.get(column, 0.0):.3f}'))
+        rows.append(f"blits {means.get('blits', 0.0):.1f}   alloc blocks {means.get('alloc_blocks', 0.0):+.1f}")
+        if self.pacing is not None:
+            rows.append(f'{self.pacing.fps():.1f} fps   frame time p95 {self.pacing.percentile(95) * 1000:.2f} ms')
+        if self.profile is not None:
+            rows.append('cProfile capture running (F5)')
+        if self.tracing:
+            rows.append('tracemalloc capture running (F6)')
+
+        font = get_font(*OVERLAY_FONT)
+        colour = (255, 255, 255)
+        line_height = font.get_linesize()
+        surface = pygame.Surface((250, line_height * len(rows) + 8), pygame.SRCALPHA)
+        surface.fill((0, 0, 0, 180))
+        for index, row in enumerate(rows):
+            y = 4 + index * line_height
+            if isinstance(row, str):
+                surface.blit(render_text(font, row, colour), (6, y))
+                continue
+            # The numbers are right aligned in their columns
+            label, mean, peak = row
+            surface.blit(render_text(font, label, colour), (6, y))
+            for value, right in ((mean, 180), (peak, 244)):
+                text = render_text(font, value, colour)
+                surface.blit(text, text.get_rect(topright=(right, y)))
+        return surface
+
+    def draw_overlay(self, screen):
+        if self.overlay_visible and self.overlay is not None:
+            screen.blit(self.overlay, self.overlay_rect)
+            self.count_blits()
+
+    # Export and captures
+
+    def output_path(self, extension):
+        os.makedirs(self.output_dir, exist_ok=True)
+        return os.path.join(self.output_dir, time.strftime('frames-%Y%m%d-%H%M%S') + extension)
+
+    def export(self, path):
+        # Writes the ring buffer to `path`, as CSV or JSONL depending on its extension
+        with open(path, 'w', newline='') as file:
+            if path.endswith('.csv'):
+                writer = csv.writer(file)
+                writer.writerow(COLUMNS)
+                writer.writerows(self.records)
+            else:
+                for record in self.records:
+                    file.write(json.dumps(dict(zip(COLUMNS, record))) + '\n')
+
+    def export_all(self):
+        try:
+            for extension in ('.csv', '.jsonl'):
+                path = self.output_path(extension)
+                self.export(path)
+                print(f'Exported {len(self.records)} frames to {path}')
+            if self.pacing is not None:
+                print(f'Pacing: {self.pacing.describe()}')
+        except OSError as e:
+            print(f'Could not export the frame profile: {e}')
+
+    def toggle_cprofile(self):
+        if self.profile is None:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+            print('cProfile capture started')
+        else:
+            self.profile.disable()
+            stats = io.StringIO()
+            pstats.Stats(self.profile, stream=stats).sort_stats('cumulative').print_stats(20)
+            print(stats.getvalue())
+            try:
+                path = self.output_path('.prof')
+                self.profile.dump_stats(path)
+                print(f'cProfile capture written to {path}')
+            except OSError as e:
+                print(f'Could not write the cProfile capture: {e}')
+            self.profile = None
+        self.overlay_updated = 0.0
+
+    def toggle_tracemalloc(self):
+        if not self.tracing:
+            tracemalloc.start(10)
+            self.tracing = True
+            print('tracemalloc capture started')
+        else:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            self.tracing = False
+            for stat in snapshot.statistics('lineno')[:15]:
+                print(stat)
+            try:
+                path = self.output_path('.tracemalloc')
+                snapshot.dump(path)
+                print(f'tracemalloc snapshot written to {path}')
+            except OSError as e:
+                print(f'Could not write the tracemalloc snapshot: {e}')
+        self.overlay_updated = 0.0
+
+    def handle_key(self, event):
+        # Returns True if the key was one of the profiler's hotkeys
+        if event.key == pygame.K_F3:
+            self.toggle_overlay()
+        elif event.key == pygame.K_F4:
+            self.export_all()
+        elif event.key == pygame.K_F5:
+            self.toggle_cprofile()
+        elif event.key == pygame.K_F6:
+            self.toggle_tracemalloc()
+        else:
+            return False
+        return True
+
+    def close(self):
+        # Stops any capture still running, writing out what it has
+        if self.profile is not None:
+            self.toggle_cprofile()
+        if self.tracing:
+            self.toggle_tracemalloc()
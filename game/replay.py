@@ -0,0 +1,525 @@
+import argparse
+import os
+import struct
+import sys
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from deals import DEAL_VERSION, deal, deal_order
+from engine import DECK_SIZE, FOUNDATION_PILES, FOUNDATION_START, KING, Move, STOCK, TABLEAU_COUNT, WASTE
+from gamemode import Gamemode
+from save import GAMEMODES
+from simulate import Batch, LOST, np
+
+'''
+Compact game replays and a headless verifier for them.
+
+A replay is a REPLAY_HEADER followed by two bytes per move: (src << 4 | dst, count), with drawing from the
+stock written as DRAW and recycling the waste as RECYCLE (count 0). Replay files are replays back to back,
+so games can simply be appended to an archive and read back one at a time.
+
+The verifier plays each replay through the GameState rules (the headless copy of Deck.is_valid_move,
+Deck.move_card and Score), stopping at the first illegal move. Most replays are valid, so they are first
+played with only the checks and score keeping of those rules: side by side in a simulate.Batch when NumPy
+is installed (batch_replay), one at a time on bare pile lists otherwise (lean_replay). Only a replay that
+fails there is played again through GameState to find the illegal move:
+
+    python replay.py games.rpl [more.rpl ...] [--workers N]
+'''
+
+REPLAY_MAGIC = b'SOLR'
+REPLAY_VERSION = 1
+# magic, replay version, deal version, gamemode index, claimed final score, deal id, number of moves
+REPLAY_HEADER = struct.Struct('<4sBBBiQH')
+
+# Directory of the current script
+script_dir = os.path.dirname(__file__)
+REPLAY_ARCHIVE = os.path.join(script_dir, 'resources', 'replays', 'games.rpl')
+
+# Kinds of move, looked up from the first byte of an encoded move (src << 4 | dst). 0 is never allowed.
+(RUN, TABLEAU_TO_FOUNDATION, WASTE_TO_FOUNDATION, FOUNDATION_TO_FOUNDATION, WASTE_TO_TABLEAU, FOUNDATION_TO_TABLEAU,
+ DRAW_KIND, RECYCLE_KIND) = range(1, 9)
+
+def move_kind(src, dst):
+    if src > 12 or dst > 12 or src == dst:
+        return 0
+    if src == STOCK or dst == STOCK:
+        return DRAW_KIND if dst == WASTE else RECYCLE_KIND if src == WASTE else 0
+    if dst == WASTE:
+        return 0
+    if dst >= FOUNDATION_START:
+        return TABLEAU_TO_FOUNDATION if src < TABLEAU_COUNT else WASTE_TO_FOUNDATION if src == WASTE else FOUNDATION_TO_FOUNDATION
+    return RUN if src < TABLEAU_COUNT else WASTE_TO_TABLEAU if src == WASTE else FOUNDATION_TO_TABLEAU
+
+MOVE_KINDS = bytes(move_kind(pair >> 4, pair & 15) for pair in range(256))
+
+# Whether a card may go onto a top card, indexed by top * DECK_SIZE + card with top EMPTY for an empty pile.
+# The same colour, suit and value checks as GameState.accepts.
+EMPTY = DECK_SIZE
+TABLEAU_FITS = bytes(card % 13 == KING - 1 if top == EMPTY else
+                     (card // 13 & 1) != (top // 13 & 1) and card % 13 == top % 13 - 1
+                     for top in range(DECK_SIZE + 1) for card in range(DECK_SIZE))
+FOUNDATION_FITS = bytes(card % 13 == 0 if top == EMPTY else card // 13 == top // 13 and card % 13 == top % 13 + 1
+                        for top in range(DECK_SIZE + 1) for card in range(DECK_SIZE))
+
+if np is not None:
+    # The fit tables for batch_replay, indexed [top, card] with EMPTY as a card fitting nowhere
+    TABLEAU_FIT_TABLE = np.zeros((DECK_SIZE + 1, DECK_SIZE + 1), dtype=bool)
+    TABLEAU_FIT_TABLE[:, :DECK_SIZE] = np.frombuffer(TABLEAU_FITS, dtype=bool).reshape(DECK_SIZE + 1, DECK_SIZE)
+    FOUNDATION_FIT_TABLE = np.zeros((DECK_SIZE + 1, DECK_SIZE + 1), dtype=bool)
+    FOUNDATION_FIT_TABLE[:, :DECK_SIZE] = np.frombuffer(FOUNDATION_FITS, dtype=bool).reshape(DECK_SIZE + 1, DECK_SIZE)
+    KIND_TABLE = np.frombuffer(MOVE_KINDS, dtype=np.uint8)
+
+Replay = namedtuple('Replay', ['deal_id', 'gamemode', 'score', 'moves', 'deal_version'])
+'''
+One recorded game:
+    deal_id, deal_version: The numbered deal played, see deals.py
+    gamemode: Gamemode whose rules were played
+    score: Final score claimed by the recording
+    moves: The encoded moves, see encode_moves
+'''
+
+Verification = namedtuple('Verification', ['replay', 'valid', 'score', 'won', 'moves_played', 'error'])
+'''
+Result of verify: `valid` is False if a move was illegal (described by `error`) or the claimed score is wrong.
+`score` and `won` are those of the replayed game, up to the first illegal move.
+'''
+
+
+def encode_moves(moves):
+    data = bytearray()
+    for move in moves:
+        data.append(move.src << 4 | move.dst)
+        data.append(move.count)
+    return bytes(data)
+
+def decode_moves(data):
+    return [Move(data[i] >> 4, data[i] & 15, data[i + 1]) for i in range(0, len(data), 2)]
+
+def encode(replay):
+    return REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, replay.deal_version, GAMEMODES.index(replay.gamemode),
+                              replay.score, replay.deal_id, len(replay.moves) // 2) + replay.moves
+
+def append_replay(replay, path=REPLAY_ARCHIVE):
+    # Adds the replay to the end of a replay file, creating it if needed
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'ab') as file:
+            file.write(encode(replay))
+        return True
+    except OSError as e:
+        print(f"Could not record replay to {path}: {e}")
+        return False
+
+def parse_header(header):
+    # Returns (Replay without its moves, number of moves) from a REPLAY_HEADER, raises ValueError if it isn't one
+    magic, version, deal_version, gamemode, score, deal_id, move_count = REPLAY_HEADER.unpack(header)
+    if magic != REPLAY_MAGIC or version != REPLAY_VERSION or gamemode >= len(GAMEMODES):
+        raise ValueError('not a replay file, or a newer replay version')
+    return Replay(deal_id, GAMEMODES[gamemode], score, b'', deal_version), move_count
+
+def decode(data):
+    # Returns the Replay of one encoded replay
+    replay, move_count = parse_header(data[:REPLAY_HEADER.size])
+    moves = data[REPLAY_HEADER.size:]
+    if len(moves) != move_count * 2:
+        raise ValueError('replay has the wrong number of moves')
+    return replay._replace(moves=bytes(moves))
+
+def read_replays(file):
+    # Yields the replays of an open binary file one at a time, raises ValueError on a damaged file
+    while True:
+        header = file.read(REPLAY_HEADER.size)
+        if not header:
+            return
+        if len(header) < REPLAY_HEADER.size:
+            raise ValueError('replay file ends inside a replay header')
+        replay, move_count = parse_header(header)
+        moves = file.read(move_count * 2)
+        if len(moves) < move_count * 2:
+            raise ValueError('replay file ends inside a move list')
+        yield replay._replace(moves=moves)
+
+
+@lru_cache(maxsize=1024)
+def dealt_state(deal_id, gamemode):
+    # Leaderboards hold many replays of the same deal, copying a kept state is cheaper than shuffling again
+    return deal(deal_id, gamemode)
+
+def lean_replay(state, moves):
+    '''
+    Plays the encoded moves on copies of the dealt piles, keeping only what the rules check and the score.
+    Returns (score, won), or None at the first move that isn't allowed.
+
+    The Zobrist hash, foundation tables and move counters of GameState are left out, as verification
+    never reads them. Suits 1 and 3 are the red ones (RED_SUITS), so a card's colour is its suit's low bit.
+    '''
+    piles = [list(pile) for pile in state.piles]
+    hidden = list(state.hidden)
+    stock = piles[STOCK]
+    waste = piles[WASTE]
+    draw_amount = state.draw_amount
+    draw_count = state.draw_count
+    foundation_points = 10 if state.gamemode == Gamemode.KLONDIKE else 5
+    score = state.score
+    consecutive = state.consecutive_foundation_moves
+    move_made = state.move_made
+    lost = state.lost
+    kinds = MOVE_KINDS
+    tableau_fits = TABLEAU_FITS
+    foundation_fits = FOUNDATION_FITS
+
+    for index in range(0, len(moves), 2):
+        pair = moves[index]
+        count = moves[index + 1]
+        kind = kinds[pair]
+        if lost or not kind:
+            return None
+        if kind == RUN:
+            src = pair >> 4
+            cards = piles[src]
+            target = piles[pair & 15]
+            start = len(cards) - count
+            if not count or start < hidden[src] or not tableau_fits[(target[-1] if target else EMPTY) * DECK_SIZE + cards[start]]:
+                return None
+            target += cards[start:]
+            del cards[start:]
+            if start and hidden[src] == start:
+                hidden[src] = start - 1
+            score += 10 * count
+            consecutive = 0
+        elif kind <= FOUNDATION_TO_FOUNDATION:
+            src = pair >> 4
+            cards = piles[src]
+            target = piles[pair & 15]
+            if count != 1 or not cards or src < TABLEAU_COUNT and hidden[src] == len(cards) \
+                    or not foundation_fits[(target[-1] if target else EMPTY) * DECK_SIZE + cards[-1]]:
+                return None
+            target.append(cards.pop())
+            if src < TABLEAU_COUNT and cards and hidden[src] == len(cards):
+                hidden[src] -= 1
+            consecutive += 1
+            score += foundation_points * consecutive
+        elif kind <= FOUNDATION_TO_TABLEAU:
+            # A single card from the waste or a foundation
+            cards = piles[pair >> 4]
+            target = piles[pair & 15]
+            if count != 1 or not cards or not tableau_fits[(target[-1] if target else EMPTY) * DECK_SIZE + cards[-1]]:
+                return None
+            target.append(cards.pop())
+            score += 10
+            consecutive = 0
+        elif kind == DRAW_KIND:
+            if count or not stock:
+                return None
+            drawn = min(draw_amount, len(stock))
+            waste += stock[:-drawn - 1:-1]
+            del stock[-drawn:]
+            continue
+        elif kind == RECYCLE_KIND:
+            if count or stock:
+                return None
+            draw_count -= 1
+            lost = not move_made and draw_count <= 0
+            move_made = False
+            stock += waste[::-1]
+            waste.clear()
+            score -= 5
+            continue
+        else:
+            return None
+        move_made = True
+
+    return score, all(len(piles[pile]) == 13 for pile in FOUNDATION_PILES)
+
+def batch_replay(gamemode, orders, moves):
+    '''
+    Plays the encoded moves of many games of one gamemode side by side, one move of every game per step,
+    in a simulate.Batch dealt from `orders` (52 byte deal orders, see deals.deal_order). Returns NumPy
+    arrays of the final scores, whether each game was won and whether all its moves were allowed (score
+    and won only mean something then).
+
+    Every move is checked like lean_replay before it is played. Moves between two foundations are never
+    needed and the Batch has no action for them, they count as not allowed here and are left to verify.
+    The piles are read through flat indices, as in Batch.
+    '''
+    n = len(moves)
+    # Games sorted longest first, so the games with a move left at each step are a prefix
+    lengths = np.array([len(game) // 2 for game in moves], dtype=np.intp)
+    order = np.argsort(-lengths, kind='stable')
+    sorted_lengths = lengths[order]
+    steps = int(sorted_lengths[0]) if n else 0
+    playing = np.searchsorted(-sorted_lengths, -np.arange(steps), side='left')
+    encoded = np.frombuffer(b''.join(moves[game].ljust(steps * 2, b'\0') for game in order), dtype=np.uint8)
+    encoded = encoded.reshape(n, steps * 2)
+    batch = Batch(np.frombuffer(b''.join(orders[game] for game in order), dtype=np.uint8).reshape(n, DECK_SIZE), gamemode)
+
+    # What a move is and how many cards it takes don't depend on the position, so those checks are made once
+    kinds = KIND_TABLE[encoded[:, 0::2]]
+    counts = encoded[:, 1::2]
+    needed = np.where(kinds == RUN, counts > 0, counts == np.where(kinds >= DRAW_KIND, 0, 1))
+    padding = np.arange(steps) >= sorted_lengths[:, None]
+    ok = (needed & (kinds != 0) & (kinds != FOUNDATION_TO_FOUNDATION) | padding).all(axis=1)
+
+    cards = batch.tableau.reshape(-1)
+    slots = batch.tableau.shape[2]
+    talon = batch.talon.reshape(-1)
+    talon_size = batch.talon.shape[1]
+    pile_length = batch.length.reshape(-1)
+    pile_hidden = batch.hidden.reshape(-1)
+    heights = batch.height.reshape(-1)
+    # Suit on each foundation pile (-1 when empty), the Batch only keeps each suit's height
+    pile_suit = np.full(n * 4, -1, dtype=np.intp)
+
+    def tableau_top(piles):
+        # Top card of flat tableau piles, EMPTY for an empty pile
+        length = pile_length[piles]
+        return np.where(length > 0, cards[piles * slots + length - 1].astype(np.intp), EMPTY)
+
+    def foundation_top(games, piles):
+        suit = pile_suit[games * 4 + piles]
+        return np.where(suit >= 0, suit * 13 + heights[games * 4 + suit] - 1, EMPTY)
+
+    def fits_tableau(piles, card):
+        return TABLEAU_FIT_TABLE[tableau_top(piles), card]
+
+    def fits_foundation(games, piles, card):
+        return FOUNDATION_FIT_TABLE[foundation_top(games, piles), card]
+
+    def turn_up(piles):
+        length = pile_length[piles]
+        hidden = pile_hidden[piles]
+        pile_hidden[piles] = np.where((length > 0) & (hidden == length), hidden - 1, hidden)
+
+    def to_foundation(games, piles, card):
+        pile_suit[games * 4 + piles] = card // 13
+        batch.to_foundation(games, card)
+
+    for step in range(steps):
+        active = playing[step]
+        pairs = encoded[:active, step * 2]
+        kind = kinds[:active, step]
+        playable = ok[:active]
+
+        games = np.flatnonzero(playable & (kind == RUN))
+        if len(games):
+            source = games * TABLEAU_COUNT + (pairs[games] >> 4)
+            target = games * TABLEAU_COUNT + (pairs[games] & 15)
+            count = counts[games, step].astype(np.intp)
+            start = pile_length[source] - count
+            card = cards[source * slots + np.maximum(start, 0)]
+            allowed = (start >= pile_hidden[source]) & fits_tableau(target, card)
+            ok[games[~allowed]] = False
+            games, source, target, count, start = games[allowed], source[allowed], target[allowed], count[allowed], start[allowed]
+
+            # The run's cards go on the target one slot at a time, most runs are a single card
+            origin = source * slots + start
+            destination = target * slots + pile_length[target]
+            for offset in range(int(count.max(initial=0))):
+                moving = offset < count
+                cards[destination[moving] + offset] = cards[origin[moving] + offset]
+            pile_length[target] += count
+            pile_length[source] = start
+            turn_up(source)
+            # GameState.move scores 10 points per card moved onto the tableau
+            batch.score[games] += 10 * count
+            batch.consecutive[games] = 0
+            batch.move_made[games] = True
+
+        games = np.flatnonzero(playable & (kind == TABLEAU_TO_FOUNDATION))
+        if len(games):
+            source = games * TABLEAU_COUNT + (pairs[games] >> 4)
+            target = (pairs[games] & 15) - FOUNDATION_START
+            card = np.where(pile_length[source] > pile_hidden[source], tableau_top(source), EMPTY)
+            allowed = fits_foundation(games, target, card)
+            ok[games[~allowed]] = False
+            source = source[allowed]
+            pile_length[source] -= 1
+            turn_up(source)
+            to_foundation(games[allowed], target[allowed], card[allowed])
+
+        # The waste's top card is the first one after the stock in the talon
+        games = np.flatnonzero(playable & ((kind == WASTE_TO_FOUNDATION) | (kind == WASTE_TO_TABLEAU)))
+        if len(games):
+            target = (pairs[games] & 15).astype(np.intp)
+            stock_length = batch.stock_len[games]
+            card = np.where(stock_length < batch.talon_len[games],
+                            talon[games * talon_size + np.minimum(stock_length, talon_size - 1)].astype(np.intp), EMPTY)
+            onto_foundation = target >= FOUNDATION_START
+            allowed = np.where(onto_foundation, fits_foundation(games, np.maximum(target - FOUNDATION_START, 0), card),
+                               fits_tableau(games * TABLEAU_COUNT + np.minimum(target, TABLEAU_COUNT - 1), card))
+            ok[games[~allowed]] = False
+            games, target, card, onto_foundation = games[allowed], target[allowed], card[allowed], onto_foundation[allowed]
+            batch.pop_waste(games)
+            to_foundation(games[onto_foundation], target[onto_foundation] - FOUNDATION_START, card[onto_foundation])
+            batch.to_tableau(games[~onto_foundation], target[~onto_foundation], card[~onto_foundation])
+
+        games = np.flatnonzero(playable & (kind == FOUNDATION_TO_TABLEAU))
+        if len(games):
+            source = (pairs[games] >> 4) - FOUNDATION_START
+            target = pairs[games] & 15
+            card = foundation_top(games, source)
+            allowed = fits_tableau(games * TABLEAU_COUNT + target, card)
+            ok[games[~allowed]] = False
+            games, source, target, card = games[allowed], source[allowed], target[allowed], card[allowed]
+            suit = games * 4 + card // 13
+            heights[suit] -= 1
+            pile_suit[games * 4 + source] = np.where(heights[suit] > 0, card // 13, -1)
+            batch.to_tableau(games, target, card)
+
+        # Drawing needs cards in the stock, recycling an empty stock. No move may follow a recycle that
+        # loses the game.
+        games = np.flatnonzero(playable & (kind >= DRAW_KIND))
+        if len(games):
+            allowed = (batch.stock_len[games] > 0) == (kind[games] == DRAW_KIND)
+            ok[games[~allowed]] = False
+            games = games[allowed]
+            batch.draw_or_recycle(games)
+            ok[games[(batch.outcome[games] == LOST) & (sorted_lengths[games] > step + 1)]] = False
+
+    # Back in the order of `moves`
+    unsorted = np.empty(n, dtype=np.intp)
+    unsorted[order] = np.arange(n)
+    return batch.score[unsorted], (batch.height == 13).all(axis=1)[unsorted], ok[unsorted]
+
+@lru_cache(maxsize=1024)
+def dealt_order(deal_id, deal_version):
+    # The deal's card order as 52 bytes for batch_replay, or None for a deal this version doesn't know
+    try:
+        return bytes(deal_order(deal_id, deal_version))
+    except ValueError:
+        return None
+
+def verify(replay):
+    # Replays the moves on the deal and checks each one against the rules, returns a Verification
+    try:
+        state = dealt_state(replay.deal_id, replay.gamemode) if replay.deal_version == DEAL_VERSION else None
+    except ValueError:
+        state = None
+    if state is None:
+        return Verification(replay, False, None, False, 0, f'unknown deal {replay.deal_id} (version {replay.deal_version})')
+
+    result = lean_replay(state, replay.moves)
+    if result is not None and result[0] == replay.score:
+        return Verification(replay, True, result[0], result[1], len(replay.moves) // 2, None)
+    # Something is wrong with the replay, play it through GameState to say what
+    return verify_rules(replay, state)
+
+def verify_rules(replay, state):
+    # Plays the moves on a copy of the dealt GameState, checking each one against the rules, returns a Verification
+    state = state.copy()
+    moves = replay.moves
+    for played in range(len(moves) // 2):
+        src = moves[played * 2] >> 4
+        dst = moves[played * 2] & 15
+        count = moves[played * 2 + 1]
+        # The game ends when the stock is recycled with no recycles left and no move made
+        if state.lost:
+            error = 'move after the game was lost'
+        elif src == STOCK and dst == WASTE and not count:
+            error = None if state.draw() else 'draw from an empty stock'
+        elif src == WASTE and dst == STOCK and not count:
+            error = None if state.recycle() else 'recycle with cards left in the stock'
+        elif src > 12 or dst > 12 or not state.move(src, dst, count):
+            error = f'illegal move of {count} card(s) from pile {src} to pile {dst}'
+        else:
+            error = None
+        if error:
+            return Verification(replay, False, state.score, False, played, f'move {played + 1}: {error}')
+
+    if state.score != replay.score:
+        return Verification(replay, False, state.score, state.is_won(), len(moves) // 2,
+                            f'claimed score {replay.score} but the moves score {state.score}')
+    return Verification(replay, True, state.score, state.is_won(), len(moves) // 2, None)
+
+def verify_many(replays):
+    # Verifications of a list of replays, in order. Without NumPy this is verify of each one.
+    if np is None:
+        return [verify(replay) for replay in replays]
+
+    results = [None] * len(replays)
+    for gamemode in GAMEMODES:
+        indices = [index for index, replay in enumerate(replays) if replay.gamemode == gamemode]
+        orders = [dealt_order(replays[index].deal_id, replays[index].deal_version) for index in indices]
+        indices = [index for index, order in zip(indices, orders) if order is not None]
+        if not indices:
+            continue
+        scores, won, ok = batch_replay(gamemode, [order for order in orders if order is not None],
+                                       [replays[index].moves for index in indices])
+        for index, score, game_won, game_ok in zip(indices, scores.tolist(), won.tolist(), ok.tolist()):
+            replay = replays[index]
+            if game_ok and score == replay.score:
+                results[index] = Verification(replay, True, score, game_won, len(replay.moves) // 2, None)
+
+    # Rejected replays and unknown deals are played again one at a time, which says what is wrong
+    return [result if result is not None else verify(replay) for replay, result in zip(replays, results)]
+
+def verify_encoded(chunk):
+    # Worker side: verifies a list of encoded replays, returns their Verifications without the move lists
+    return [result._replace(replay=result.replay._replace(moves=b''))
+            for result in verify_many([decode(data) for data in chunk])]
+
+
+def verify_files(paths, workers=1, chunk_size=16384):
+    # Yields a Verification for every replay in the files, in order, holding only a few chunks in memory
+    def replays():
+        for path in paths:
+            with open(path, 'rb') as file:
+                yield from read_replays(file)
+
+    def chunks():
+        chunk = []
+        for replay in replays():
+            chunk.append(replay)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    if workers <= 1:
+        for chunk in chunks():
+            yield from verify_many(chunk)
+        return
+
+    with ProcessPoolExecutor(workers) as pool:
+        # Keep a couple of chunks queued per worker, results come back in file order
+        pending = deque()
+        for chunk in chunks():
+            pending.append(pool.submit(verify_encoded, [encode(replay) for replay in chunk]))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verify recorded games against the rules.')
+    parser.add_argument('paths', nargs='+', help='replay files')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes (default: 1)')
+    parser.add_argument('--quiet', action='store_true', help='only print the summary')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    total = invalid = won = 0
+    try:
+        for index, result in enumerate(verify_files(args.paths, args.workers)):
+            total += 1
+            won += result.won
+            if not result.valid:
+                invalid += 1
+                if not args.quiet:
+                    print(f'replay {index} (deal #{result.replay.deal_id}): {result.error}')
+    except (OSError, ValueError) as e:
+        print(f'Stopped after {total} replays: {e}')
+        sys.exit(2)
+
+    elapsed = time.perf_counter() - started
+    rate = total / elapsed if elapsed else 0.0
+    print(f'{total} replays, {invalid} invalid, {won} won, {elapsed:.2f} s ({rate:.0f} replays/s)')
+    sys.exit(1 if invalid else 0)
+
+if __name__ == "__main__":
+    main()
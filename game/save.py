@@ -0,0 +1,131 @@
+import os
+import struct
+
+from engine import GameState, DECK_SIZE, TABLEAU_COUNT, STOCK, FOUNDATION_START, card_suit
+from gamemode import Gamemode
+
+'''
+Compact fixed-size binary encoding of a whole game, used for save/resume and for storing states in bulk.
+
+A record is STATE_RECORD.size (79) bytes:
+    52 bytes: every card in pile order, bottom card first, as its card code with FACE_UP_BIT set if face up
+    13 bytes: number of cards in each pile, in the same order as GameState.piles
+    gamemode, draw_count, flags (move_made, lost), score, moves_made, consecutive_foundation_moves,
+    stockpile_refresh_count
+
+Records have no header, so a file of records can be indexed as record_number * STATE_RECORD.size.
+Save files add a small SAVE_HEADER, which also holds the deal number (see deals.py), in front of the one
+record, followed by the game's moves in the replay encoding (see replay.py).
+'''
+
+FACE_UP_BIT = 0x80
+MOVE_MADE_FLAG = 1
+LOST_FLAG = 2
+GAMEMODES = [Gamemode.KLONDIKE, Gamemode.VEGAS] # Stored as their index
+
+STATE_RECORD = struct.Struct('<52s13sBbBiIBH')
+
+SAVE_MAGIC = b'SOLS'
+SAVE_VERSION = 3
+# magic, version, deal id, number of moves
+SAVE_HEADER = struct.Struct('<4sHQH')
+
+# Directory of the current script
+script_dir = os.path.dirname(__file__)
+save_dir = os.path.join(script_dir, 'resources', 'saves')
+AUTOSAVE_PATH = os.path.join(save_dir, 'autosave.sav')
+
+
+def encode(state, score=None, buffer=None, offset=0):
+    # Returns the record of the state, or writes it into buffer at offset when one is given.
+    # The score and move counters come from the Score object when one is passed, otherwise from the state.
+    counters = state if score is None else score
+    cards = bytearray(DECK_SIZE)
+    position = 0
+    for index, pile in enumerate(state.piles):
+        hidden = state.hidden[index] if index < TABLEAU_COUNT else (len(pile) if index == STOCK else 0)
+        for card_index, card in enumerate(pile):
+            cards[position] = card if card_index < hidden else card | FACE_UP_BIT
+            position += 1
+    flags = (MOVE_MADE_FLAG if state.move_made else 0) | (LOST_FLAG if state.lost else 0)
+    fields = (bytes(cards), bytes(len(pile) for pile in state.piles), GAMEMODES.index(state.gamemode),
+              state.draw_count, flags, counters.score, counters.moves_made, counters.consecutive_foundation_moves,
+              counters.stockpile_refresh_count)
+    if buffer is None:
+        return STATE_RECORD.pack(*fields)
+    STATE_RECORD.pack_into(buffer, offset, *fields)
+
+def decode(data, offset=0):
+    # Rebuilds the GameState from the record at offset in data, raises ValueError if it is not a valid game
+    try:
+        (cards, lengths, gamemode, draw_count, flags, score, moves_made, consecutive,
+         refresh_count) = STATE_RECORD.unpack_from(data, offset)
+        state = GameState(GAMEMODES[gamemode])
+    except (struct.error, IndexError):
+        raise ValueError('not a saved game')
+    if sum(lengths) != DECK_SIZE or sorted(card & ~FACE_UP_BIT for card in cards) != list(range(DECK_SIZE)):
+        raise ValueError('saved game does not hold one full deck')
+
+    position = 0
+    for index, length in enumerate(lengths):
+        pile = cards[position:position + length]
+        position += length
+        state.piles[index] = [card & ~FACE_UP_BIT for card in pile]
+        if index < TABLEAU_COUNT:
+            # Face-down cards are the ones below the first face-up card
+            state.hidden[index] = next((i for i, card in enumerate(pile) if card & FACE_UP_BIT), length)
+        if index >= FOUNDATION_START and pile:
+            suit = card_suit(pile[0] & ~FACE_UP_BIT)
+            state.foundation_height[suit] = length
+            state.foundation_pile[suit] = index
+
+    state.draw_count = draw_count
+    state.zobrist = state.compute_zobrist()
+    state.move_made = bool(flags & MOVE_MADE_FLAG)
+    state.lost = bool(flags & LOST_FLAG)
+    state.score = score
+    state.moves_made = moves_made
+    state.consecutive_foundation_moves = consecutive
+    state.stockpile_refresh_count = refresh_count
+    return state
+
+def iter_records(data):
+    # Yields the GameState of every record in a buffer of back to back records, e.g. an mmap'ed file
+    for offset in range(0, len(data) - STATE_RECORD.size + 1, STATE_RECORD.size):
+        yield decode(data, offset)
+
+
+def save_game(state, score=None, deal_id=0, moves=b'', path=AUTOSAVE_PATH):
+    # Writes the game to a temporary file and swaps it in, so a crash never leaves a half written save
+    # The moves are written as they are, without copying them into one buffer with the header
+    header = SAVE_HEADER.pack(SAVE_MAGIC, SAVE_VERSION, deal_id, len(moves) // 2) + encode(state, score)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as file:
+            file.write(header)
+            file.write(moves)
+        os.replace(temp_path, path)
+        return True
+    except OSError as e:
+        print(f"Could not save game to {path}: {e}")
+        return False
+
+def load_game(path=AUTOSAVE_PATH):
+    # Returns the saved (GameState, deal id, encoded moves), or None if there is no valid save
+    try:
+        with open(path, 'rb') as file:
+            data = file.read()
+        magic, version, deal_id, move_count = SAVE_HEADER.unpack_from(data)
+        moves_start = SAVE_HEADER.size + STATE_RECORD.size
+        if magic != SAVE_MAGIC or version != SAVE_VERSION or len(data) != moves_start + move_count * 2:
+            return None
+        return decode(data, SAVE_HEADER.size), deal_id, data[moves_start:]
+    except (OSError, ValueError, struct.error):
+        return None
+
+def delete_save(path=AUTOSAVE_PATH):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -1,11 +1,14 @@
 import time
 
+from events import ScoreEvent, TABLEAU, FOUNDATION, FROM_FOUNDATION, REFRESH, UNDO
 from gamemode import Gamemode
+from journal import MOVE, RECYCLED
 
 class Score:
-    def __init__(self, settings):
+    def __init__(self, settings, events=None):
         self.initial = True
         self.settings = settings
+        self.events = events # EventStream every score change is emitted to, if any
         self.score = 0 if self.settings.active_gamemode == Gamemode.KLONDIKE else -52
         self.start_game()
         self.update(self.settings)
@@ -26,27 +29,40 @@ class Score:
 
     def get_score(self):
         return self.score
+
+    def emit(self, kind, delta):
+        if self.events is not None:
+            self.events.emit(ScoreEvent(kind, time.time(), delta, self.score, self.consecutive_foundation_moves))
     
     def move_to_tableau(self):
         self.score += 10
-        print(f"Moved to Tableau (award 10 points): Score = {self.score}")
+        self.emit(TABLEAU, 10)
 
     def move_to_foundation(self):
         self.consecutive_foundation_moves += 1  # Increment the counter
         score_modifier = 10 if self.gamemode == Gamemode.KLONDIKE else 5
         self.score += score_modifier * self.consecutive_foundation_moves  # Multiply the points by the consecutive counter
-        print(f"Moved to Foundation (award {score_modifier * self.consecutive_foundation_moves} points): Score = {self.score}")
+        self.emit(FOUNDATION, score_modifier * self.consecutive_foundation_moves)
 
     def move_from_foundation(self):
         self.score -= 10
-        print(f"Moved from Foundation (reduce 10 points): Score = {self.score}")
+        self.emit(FROM_FOUNDATION, -10)
+
+    def undo(self, delta):
+        # Takes back the points and moves of a journal Delta, exactly as they were awarded
+        self.score -= delta.score
+        self.moves_made -= delta.count if delta.kind == MOVE else 0
+        self.stockpile_refresh_count -= 1 if delta.kind == RECYCLED else 0
+        self.consecutive_foundation_moves = delta.consecutive
+        self.emit(UNDO, -delta.score)
 
     def reset_consecutive_moves(self):
         self.consecutive_foundation_moves = 0  # Reset the counter when a non-foundation move is made
         
     def refresh_stockpile(self):
+        self.stockpile_refresh_count += 1
         self.score -= 5
-        print(f"Refreshed Stockpile (reduce 5 points): Score = {self.score}")
+        self.emit(REFRESH, -5)
 
     # def apply_time_penalty(self):
     #     current_time = time.time()
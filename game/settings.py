@@ -5,6 +5,7 @@ class Settings:
         self.active_gamemode = Gamemode.KLONDIKE
         self.draw_amount = 1
         self.reset_score = True
+        self.auto_play = False # Move safe cards to the foundations after each move, kept across gamemodes
 
     def use_default_settings(self):
         self.active_gamemode = Gamemode.KLONDIKE
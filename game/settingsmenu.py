@@ -1,5 +1,6 @@
 import pygame
 
+from fonts import TITLE_FONT, get_font
 from text import Text
 from widgets import Button, RadioButton, RadioGroup
 
@@ -16,11 +17,13 @@ class SettingsMenu:
         self.menu = pygame.Rect(self.ORIGIN_X, self.ORIGIN_Y, self.WIDTH, self.HEIGHT)
         self.border = pygame.Rect(self.ORIGIN_X, self.ORIGIN_Y, self.WIDTH, self.HEIGHT)
         
-        self.prompt = Text(title, (self.menu.left + (self.menu.w / 2)-1, self.menu.top + 25), pygame.font.SysFont('Times New Roman', 24))
+        self.prompt = Text(title, (self.menu.left + (self.menu.w / 2)-1, self.menu.top + 25), get_font(*TITLE_FONT))
         
         ''' Additional widgets '''
-        self.gamemode_prompt = Text('Gamemode', (self.menu.left+60, self.menu.top+95))
-        self.gamemode = RadioGroup((self.menu.left+225, self.menu.top+95), [RadioButton('Klondike'), RadioButton('Vegas      ')])
+        self.gamemode_prompt = Text('Gamemode', (self.menu.left+60, self.menu.top+75))
+        self.gamemode = RadioGroup((self.menu.left+225, self.menu.top+75), [RadioButton('Klondike'), RadioButton('Vegas      ')])
+        self.auto_play_prompt = Text('Auto-play', (self.menu.left+60, self.menu.top+110))
+        self.auto_play = RadioGroup((self.menu.left+225, self.menu.top+110), [RadioButton('Off         '), RadioButton('On          ')])
         self.close = Button('Ok', pygame.Rect(self.menu.x+150, self.menu.bottom-50, Button.DEFAULT_WIDTH, Button.DEFAULT_HEIGHT))
 
     def clicked_close(self, mouse_pos):
@@ -39,5 +42,7 @@ class SettingsMenu:
         pygame.draw.rect(surface, (0,0,0), self.border, 1)
         self.gamemode_prompt.draw(surface)
         self.gamemode.draw(surface)
+        self.auto_play_prompt.draw(surface)
+        self.auto_play.draw(surface)
         self.close.draw(surface)
         self.prompt.draw(surface)
@@ -0,0 +1,463 @@
+import argparse
+import json
+import sys
+import time
+from collections import namedtuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from deals import deal_order
+from engine import DECK_SIZE, RED_SUITS, TABLEAU_COUNT, KING, card_is_red
+from gamemode import Gamemode
+
+'''
+Batch random-playout simulator for tuning the rules and scoring, e.g. the Vegas starting score and the
+consecutive foundation multiplier of Score.move_to_foundation. Needs NumPy (pip install numpy).
+
+A batch holds N games in arrays: the card code in every tableau slot, the tableau pile lengths and
+face-down counts (a card is face up from index hidden onwards), the talon, and the foundation height of
+each suit. Every step works out the legal moves of all N games at once and plays one per game, chosen by
+the policy. The moves and their scoring are those of GameState.legal_moves and GameState.move, which
+follow Deck.is_valid_move and Score.
+
+The talon is one row of cards in stock order followed by the waste, top card first: drawing only moves
+the boundary (stock_len) and recycling moves it back to the end, so no cards are copied.
+
+    python simulate.py --games 1000000 --gamemode klondike vegas
+'''
+
+# Longest a tableau pile can get: six face-down cards under a king-to-ace run
+TABLEAU_SLOTS = 6 + 13
+TALON_SIZE = DECK_SIZE - 28
+DEFAULT_MAX_STEPS = 1000
+POLICIES = ('random', 'greedy', 'foundation-first')
+
+# Actions, the moves a game can make in one step:
+#   0-48   tableau pile s to tableau pile d (s * 7 + d), the run that fits
+#   49-55  top card of tableau pile s to its foundation
+#   56     waste to its foundation
+#   57-63  waste to tableau pile d
+#   64-91  top card of suit f's foundation to tableau pile d (f * 7 + d)
+#   92     draw from the stock, or recycle the waste when the stock is empty
+TABLEAU_TO_TABLEAU = 0
+TABLEAU_TO_FOUNDATION = 49
+WASTE_TO_FOUNDATION = 56
+WASTE_TO_TABLEAU = 57
+FOUNDATION_TO_TABLEAU = 64
+TALON = 92
+ACTION_COUNT = 93
+
+# Game outcomes
+PLAYING, WON, LOST, STUCK, STEP_LIMIT = range(5)
+OUTCOMES = ('playing', 'won', 'lost', 'stuck', 'step_limit')
+
+Playouts = namedtuple('Playouts', ['score', 'won', 'moves_made', 'recycles', 'outcome'])
+'''
+Per game arrays returned by simulate: final score, whether the game was won, moves made (as counted by
+Score), stock recycles and outcome (one of the outcomes above).
+'''
+
+# Card code of an empty slot
+EMPTY = DECK_SIZE
+
+# Tableau moves are matched through 32-bit masks: bit rank * 2 + colour stands for a card of that rank and
+# colour (1 = red), bit KEY_EMPTY for a king run going to an empty pile. KEY_NONE is never set.
+KEY_EMPTY = 26
+KEY_NONE = 27
+
+if np is not None:
+    # Rank (0 = ace), colour and suit of each card code, EMPTY gives values that match nothing
+    RANKS = np.array([card % 13 for card in range(DECK_SIZE)] + [-10], dtype=np.int8)
+    REDS = np.array([int(card // 13 in RED_SUITS) for card in range(DECK_SIZE)] + [0], dtype=np.int8)
+    SUITS = np.array([card // 13 for card in range(DECK_SIZE)] + [0], dtype=np.intp)
+
+    # Bit of the card that can go on each card as a tableau top (none on an ace, a king on an empty pile),
+    # and the bit of each card moved on its own
+    WANTED_BITS = np.array([1 << ((card % 13 - 1) * 2 + 1 - card_is_red(card)) if card % 13 else 0
+                            for card in range(DECK_SIZE)] + [1 << KEY_EMPTY], dtype=np.uint32)
+    CARD_BITS = np.array([1 << (card % 13 * 2 + card_is_red(card)) | (1 << KEY_EMPTY if card % 13 == KING - 1 else 0)
+                          for card in range(DECK_SIZE)] + [0], dtype=np.uint32)
+    FOUNDATION_BITS = np.array([[CARD_BITS[suit * 13 + height - 1] if height else 0 for suit in range(4)]
+                                for height in range(14)], dtype=np.uint32)
+    # Colours alternate down a run, so a run's cards are the bits between its top and bottom ranks of one of
+    # two patterns
+    RUN_PATTERNS = np.array([sum(1 << (rank * 2 + (rank + parity) % 2) for rank in range(13)) for parity in (0, 1)],
+                            dtype=np.uint32)
+
+    # Greedy policy: foundation moves first, then moves that turn up a face-down card (see choose), the waste
+    # onto the tableau, the stock, and last the moves that only shuffle cards around
+    GREEDY_PRIORITY = np.full(ACTION_COUNT, 1 << 12, dtype=np.uint16)
+    GREEDY_PRIORITY[TABLEAU_TO_FOUNDATION:WASTE_TO_TABLEAU] = 5 << 12
+    GREEDY_PRIORITY[WASTE_TO_TABLEAU:FOUNDATION_TO_TABLEAU] = 3 << 12
+    GREEDY_PRIORITY[TALON] = 2 << 12
+
+    # Foundation-first policy: any foundation move, otherwise a random move
+    FOUNDATION_FIRST_PRIORITY = np.zeros(ACTION_COUNT, dtype=np.uint16)
+    FOUNDATION_FIRST_PRIORITY[TABLEAU_TO_FOUNDATION:WASTE_TO_TABLEAU] = 1 << 12
+
+
+class Batch:
+    """
+    N games dealt from `orders`, an (N, 52) array of card codes in the order GameState.deal deals them.
+    The scoring and recycle options are those of simulate.
+
+    The card arrays are read through flat indices (row offset + slot), which NumPy handles far faster
+    than indexing each axis.
+    """
+
+    def __init__(self, orders, gamemode=Gamemode.KLONDIKE, start_score=None, foundation_points=None, multiplier=True,
+                 recycles=None):
+        n = len(orders)
+        orders = np.asarray(orders, dtype=np.uint8)
+        self.gamemode = gamemode
+        self.draw_amount = 1 if gamemode == Gamemode.KLONDIKE else 3
+        self.foundation_points = foundation_points if foundation_points is not None else 10 if gamemode == Gamemode.KLONDIKE else 5
+        self.multiplier = multiplier
+        self.game = np.arange(n) # Index of each game in the batch, kept through compact
+
+        self.tableau = np.full((n, TABLEAU_COUNT, TABLEAU_SLOTS), EMPTY, dtype=np.uint8)
+        start = 0
+        for pile in range(TABLEAU_COUNT):
+            self.tableau[:, pile, :pile + 1] = orders[:, start:start + pile + 1]
+            start += pile + 1
+        self.length = np.tile(np.arange(1, TABLEAU_COUNT + 1), (n, 1))
+        self.hidden = np.tile(np.arange(TABLEAU_COUNT), (n, 1))
+
+        self.talon = orders[:, start:].copy()
+        self.talon_len = np.full(n, TALON_SIZE)
+        self.stock_len = np.full(n, TALON_SIZE)
+        self.height = np.zeros((n, 4), dtype=np.int8)
+
+        # Same starting values as GameState
+        if start_score is None:
+            start_score = 0 if gamemode == Gamemode.KLONDIKE else -52
+        self.score = np.full(n, start_score, dtype=np.int32)
+        self.moves_made = np.zeros(n, dtype=np.int32)
+        self.consecutive = np.zeros(n, dtype=np.int32)
+        self.draw_count = np.full(n, self.draw_amount if recycles is None else recycles, dtype=np.int32)
+        self.move_made = np.zeros(n, dtype=bool)
+        self.refresh_count = np.zeros(n, dtype=np.int32)
+        self.outcome = np.full(n, PLAYING, dtype=np.int8)
+        self.steps = np.zeros(n, dtype=np.int32)
+        self.set_offsets()
+
+    def __len__(self):
+        return len(self.game)
+
+    def set_offsets(self):
+        # Flat index of the first slot of each tableau pile, talon and set of foundation heights
+        n = len(self)
+        self.pile_offset = (np.arange(n)[:, None] * TABLEAU_COUNT + np.arange(TABLEAU_COUNT)) * TABLEAU_SLOTS
+        self.talon_offset = np.arange(n) * TALON_SIZE
+        self.height_offset = np.arange(n)[:, None] * 4
+
+    def compact(self, keep):
+        # Keeps only the games where `keep` is True
+        for name, value in vars(self).items():
+            if isinstance(value, np.ndarray):
+                setattr(self, name, value[keep])
+        self.set_offsets()
+
+    def tops(self):
+        # Top card of each tableau pile, EMPTY when there is none
+        top = self.tableau.reshape(-1).take(self.pile_offset + self.length - 1, mode='clip')
+        top[self.length == 0] = EMPTY
+        return top
+
+    def waste_top(self):
+        top = self.talon.reshape(-1).take(self.talon_offset + self.stock_len, mode='clip')
+        top[self.stock_len == self.talon_len] = EMPTY
+        return top
+
+    def legal(self):
+        # Returns an (N, ACTION_COUNT) mask of the legal actions. Also keeps the bits each tableau pile wants
+        # and the bits of the runs' bottom cards moving off face-down cards, for choose.
+        n = len(self)
+        legal = np.empty((n, ACTION_COUNT), dtype=bool)
+        tops = self.tops()
+        top_ranks = RANKS[tops]
+        self.wanted = WANTED_BITS[tops]
+
+        # Bits of the cards each tableau pile can move, nothing for a pile without face-up cards
+        bottom = self.tableau.reshape(-1).take(self.pile_offset + self.hidden, mode='clip')
+        bottom_ranks = np.maximum(RANKS[bottom], 0).astype(np.uint32)
+        face_up = self.hidden < self.length
+        pattern = RUN_PATTERNS[(REDS[bottom] + bottom_ranks) & 1]
+        span = (np.uint32(1) << (bottom_ranks * 2 + 2)) - (np.uint32(1) << (np.maximum(top_ranks, 0).astype(np.uint32) * 2))
+        # Only a run with face-down cards under it may go to an empty pile
+        buried = self.hidden > 0
+        bottom_bits = CARD_BITS[bottom]
+        bottom_bits = np.where(buried, bottom_bits, bottom_bits & ~np.uint32(1 << KEY_EMPTY))
+        runs = np.where(face_up, pattern & span | bottom_bits, 0).astype(np.uint32)
+        self.bottom_bits = np.where(buried, bottom_bits, 0).astype(np.uint32)
+        legal[:, TABLEAU_TO_TABLEAU:TABLEAU_TO_FOUNDATION] = ((runs[:, :, None] & self.wanted[:, None, :]) != 0).reshape(n, -1)
+
+        # A card fits its foundation when the foundation is one rank below it, empty slots have no rank
+        heights = self.height.reshape(-1)
+        legal[:, TABLEAU_TO_FOUNDATION:WASTE_TO_FOUNDATION] = heights[self.height_offset + SUITS[tops]] == top_ranks
+        waste = self.waste_top()
+        legal[:, WASTE_TO_FOUNDATION] = heights[self.height_offset[:, 0] + SUITS[waste]] == RANKS[waste]
+
+        # Single cards onto the tableau, from the waste and from each suit's foundation
+        legal[:, WASTE_TO_TABLEAU:FOUNDATION_TO_TABLEAU] = (CARD_BITS[waste][:, None] & self.wanted) != 0
+        foundation_bits = FOUNDATION_BITS.reshape(-1).take(self.height * 4 + np.arange(4))
+        legal[:, FOUNDATION_TO_TABLEAU:TALON] = ((foundation_bits[:, :, None] & self.wanted[:, None, :]) != 0).reshape(n, -1)
+
+        legal[:, TALON] = self.talon_len > 0
+        return legal
+
+    def play(self, actions):
+        # Plays one action per game, games with an action of -1 are left alone
+        self.steps += actions >= 0
+        games = np.flatnonzero((actions >= TABLEAU_TO_TABLEAU) & (actions < TABLEAU_TO_FOUNDATION))
+        if len(games):
+            self.move_run(games, actions[games] // TABLEAU_COUNT, actions[games] % TABLEAU_COUNT)
+
+        games = np.flatnonzero((actions >= TABLEAU_TO_FOUNDATION) & (actions < WASTE_TO_FOUNDATION))
+        if len(games):
+            self.to_foundation(games, self.pop_tableau(games, actions[games] - TABLEAU_TO_FOUNDATION))
+
+        games = np.flatnonzero(actions == WASTE_TO_FOUNDATION)
+        if len(games):
+            self.to_foundation(games, self.pop_waste(games))
+
+        games = np.flatnonzero((actions >= WASTE_TO_TABLEAU) & (actions < FOUNDATION_TO_TABLEAU))
+        if len(games):
+            self.to_tableau(games, actions[games] - WASTE_TO_TABLEAU, self.pop_waste(games))
+
+        games = np.flatnonzero((actions >= FOUNDATION_TO_TABLEAU) & (actions < TALON))
+        if len(games):
+            suits = (actions[games] - FOUNDATION_TO_TABLEAU) // TABLEAU_COUNT
+            self.height[games, suits] -= 1
+            self.to_tableau(games, (actions[games] - FOUNDATION_TO_TABLEAU) % TABLEAU_COUNT, suits * 13 + self.height[games, suits])
+
+        games = np.flatnonzero(actions == TALON)
+        if len(games):
+            self.draw_or_recycle(games)
+
+    def move_run(self, games, source, target):
+        # The run's card one rank below the target's top moves with the cards on it, a whole king run
+        # goes to an empty pile
+        cards = self.tableau.reshape(-1)
+        hidden = self.hidden[games, source]
+        bottom_ranks = RANKS[cards[self.pile_offset[games, source] + hidden]].astype(np.intp)
+        target_length = self.length[games, target]
+        target_ranks = RANKS[cards[self.pile_offset[games, target] + target_length - 1]].astype(np.intp)
+        first = np.where(target_length > 0, hidden + bottom_ranks - target_ranks + 1, hidden)
+        count = self.length[games, source] - first
+        origin = self.pile_offset[games, source] + first
+        destination = self.pile_offset[games, target] + self.length[games, target]
+        for offset in range(13):
+            moving = offset < count
+            if not moving.any():
+                break
+            cards[destination[moving] + offset] = cards[origin[moving] + offset]
+            cards[origin[moving] + offset] = EMPTY
+        self.length[games, target] += count
+        self.length[games, source] = first
+        self.turn_up(games, source)
+
+        # GameState.move scores 10 points per card moved onto the tableau
+        self.score[games] += 10 * count
+        self.moves_made[games] += count
+        self.consecutive[games] = 0
+        self.move_made[games] = True
+
+    def pop_tableau(self, games, source):
+        top = self.pile_offset[games, source] + self.length[games, source] - 1
+        cards = self.tableau.reshape(-1)
+        popped = cards[top]
+        cards[top] = EMPTY
+        self.length[games, source] -= 1
+        self.turn_up(games, source)
+        return popped
+
+    def turn_up(self, games, source):
+        # Turns the new top card of the source piles face up
+        length = self.length[games, source]
+        hidden = self.hidden[games, source]
+        self.hidden[games, source] = np.where((length > 0) & (hidden == length), hidden - 1, hidden)
+
+    def pop_waste(self, games):
+        # Takes the top waste card out of the talon, closing the gap behind it
+        index = self.stock_len[games]
+        cards = self.talon[games, index]
+        slots = np.arange(TALON_SIZE)
+        shifted = np.minimum(slots + (slots >= index[:, None]), TALON_SIZE - 1)
+        self.talon[games] = np.take_along_axis(self.talon[games], shifted, 1)
+        self.talon_len[games] -= 1
+        self.talon[games, self.talon_len[games]] = EMPTY
+        return cards
+
+    def to_foundation(self, games, cards):
+        self.height[games, SUITS[cards]] += 1
+        self.consecutive[games] += 1
+        # Score.move_to_foundation multiplies the points by the number of foundation moves in a row
+        self.score[games] += self.foundation_points * self.consecutive[games] if self.multiplier else self.foundation_points
+        self.moves_made[games] += 1
+        self.move_made[games] = True
+
+    def to_tableau(self, games, target, cards):
+        self.tableau[games, target, self.length[games, target]] = cards
+        self.length[games, target] += 1
+        self.score[games] += 10
+        self.moves_made[games] += 1
+        self.consecutive[games] = 0
+        self.move_made[games] = True
+
+    def draw_or_recycle(self, games):
+        drawing = self.stock_len[games] > 0
+        drawn = games[drawing]
+        self.stock_len[drawn] -= np.minimum(self.stock_len[drawn], self.draw_amount)
+
+        # Same budget as GameState.recycle: out of recycles, a pass without a move loses the game
+        recycled = games[~drawing]
+        self.draw_count[recycled] -= 1
+        self.outcome[recycled[~self.move_made[recycled] & (self.draw_count[recycled] <= 0)]] = LOST
+        self.move_made[recycled] = False
+        self.stock_len[recycled] = self.talon_len[recycled]
+        self.score[recycled] -= 5
+        self.refresh_count[recycled] += 1
+
+
+def choose(policy, legal, batch, rng):
+    # Returns the action each game plays, -1 for games with no legal action. Each legal action gets a
+    # random weight from 1 to 4096, on top of its priority (in steps of 4096) under the greedy and
+    # foundation-first policies.
+    weights = np.frombuffer(rng.bytes(legal.size * 2), dtype=np.uint16).reshape(legal.shape) >> 4
+    weights += 1
+    if policy == 'greedy':
+        weights += GREEDY_PRIORITY
+        # Tableau moves of a run's bottom card turn up a face-down card, they rank just below foundation moves
+        reveals = (batch.bottom_bits[:, :, None] & batch.wanted[:, None, :]) != 0
+        weights[:, TABLEAU_TO_TABLEAU:TABLEAU_TO_FOUNDATION] += reveals.reshape(len(batch), -1) * np.uint16(3 << 12)
+    elif policy == 'foundation-first':
+        weights += FOUNDATION_FIRST_PRIORITY
+    weights *= legal
+    actions = weights.argmax(axis=1)
+    return np.where(legal.any(axis=1), actions, -1)
+
+
+def random_orders(count, rng):
+    # Uniformly shuffled decks, one row per game
+    return np.argsort(rng.random((count, DECK_SIZE)), axis=1).astype(np.uint8)
+
+def numbered_orders(deal_ids):
+    # The decks of numbered deals (see deals.py), slower to make than random_orders
+    return np.array([deal_order(deal_id) for deal_id in deal_ids], dtype=np.uint8)
+
+
+def simulate(orders, gamemode=Gamemode.KLONDIKE, policy='random', max_steps=DEFAULT_MAX_STEPS, rng=None,
+             start_score=None, foundation_points=None, multiplier=True, recycles=None):
+    '''
+    Plays out every deck in `orders` and returns their Playouts.
+
+    start_score and foundation_points default to the gamemode's rules (0 and 10 points for Klondike,
+    -52 and 5 points for Vegas); multiplier=False scores every foundation move the same instead of
+    multiplying by the consecutive foundation moves. recycles is the stock recycle budget GameState
+    starts with as draw_count, by default the draw amount like Ui.setup.
+    '''
+    rng = rng if rng is not None else np.random.default_rng()
+    batch = Batch(orders, gamemode, start_score, foundation_points, multiplier, recycles)
+
+    n = len(batch)
+    score = np.zeros(n, dtype=np.int32)
+    moves_made = np.zeros(n, dtype=np.int32)
+    recycled = np.zeros(n, dtype=np.int32)
+    outcome = np.zeros(n, dtype=np.int8)
+
+    while len(batch):
+        legal = batch.legal()
+        actions = choose(policy, legal, batch, rng)
+        batch.outcome[actions < 0] = STUCK
+        batch.play(actions)
+        batch.outcome[(batch.height == 13).all(axis=1)] = WON
+        batch.outcome[(batch.outcome == PLAYING) & (batch.steps >= max_steps)] = STEP_LIMIT
+
+        # Finished games leave the batch, so later steps only work on games still being played
+        finished = batch.outcome != PLAYING
+        if finished.any():
+            games = batch.game[finished]
+            score[games] = batch.score[finished]
+            moves_made[games] = batch.moves_made[finished]
+            recycled[games] = batch.refresh_count[finished]
+            outcome[games] = batch.outcome[finished]
+            batch.compact(~finished)
+
+    return Playouts(score, outcome == WON, moves_made, recycled, outcome)
+
+
+def summarise(score, won, moves_made, recycles, outcome, elapsed):
+    percentiles = np.percentile(score, [1, 10, 50, 90, 99])
+    values, counts = np.unique(score, return_counts=True)
+    return {
+        'games': int(len(score)),
+        'games_per_second': len(score) / elapsed if elapsed else 0.0,
+        'win_rate': float(won.mean()),
+        'score_mean': float(score.mean()),
+        'score_std': float(score.std()),
+        'score_min': int(score.min()),
+        'score_max': int(score.max()),
+        'score_percentiles': {f'p{p}': float(value) for p, value in zip((1, 10, 50, 90, 99), percentiles)},
+        'score_histogram': {int(value): int(count) for value, count in zip(values, counts)},
+        'moves_mean': float(moves_made.mean()),
+        'recycles_mean': float(recycles.mean()),
+        'outcomes': {name: int((outcome == index).sum()) for index, name in enumerate(OUTCOMES) if index != PLAYING},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Play random games in NumPy batches and report the score distribution.')
+    parser.add_argument('--games', type=int, default=100000, help='games per gamemode')
+    parser.add_argument('--batch-size', type=int, default=4096, help='games played at once, small batches stay in the CPU cache')
+    parser.add_argument('--gamemode', nargs='+', choices=[mode.value for mode in Gamemode],
+                        default=[mode.value for mode in Gamemode])
+    parser.add_argument('--policy', choices=POLICIES, default='random')
+    parser.add_argument('--max-steps', type=int, default=DEFAULT_MAX_STEPS, help='moves before a game is abandoned')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the shuffles and the policy')
+    parser.add_argument('--deal-start', type=int, default=None, help='play numbered deals from this one instead of random shuffles')
+    parser.add_argument('--start-score', type=int, default=None, help="override the gamemode's starting score")
+    parser.add_argument('--foundation-points', type=int, default=None, help="override the gamemode's points per foundation move")
+    parser.add_argument('--no-multiplier', action='store_true', help="don't multiply foundation points by the consecutive moves")
+    parser.add_argument('--output', help='write the summaries, with full score histograms, to this JSON file')
+    args = parser.parse_args()
+
+    if np is None:
+        print('simulate.py needs NumPy: pip install numpy')
+        sys.exit(2)
+
+    summaries = {}
+    for mode in args.gamemode:
+        gamemode = Gamemode(mode)
+        rng = np.random.default_rng(args.seed)
+        results = []
+        started = time.perf_counter()
+        for first in range(0, args.games, args.batch_size):
+            count = min(args.batch_size, args.games - first)
+            if args.deal_start is None:
+                orders = random_orders(count, rng)
+            else:
+                orders = numbered_orders(range(args.deal_start + first, args.deal_start + first + count))
+            results.append(simulate(orders, gamemode, args.policy, args.max_steps, rng, args.start_score,
+                                    args.foundation_points, not args.no_multiplier))
+        elapsed = time.perf_counter() - started
+        summary = summarise(*(np.concatenate(column) for column in zip(*results)), elapsed)
+        summaries[mode] = summary
+
+        percentiles = summary['score_percentiles']
+        print(f"{mode}: {summary['games']} games in {elapsed:.1f} s ({summary['games_per_second']:.0f} games/s), "
+              f"won {summary['win_rate']:.2%}")
+        print(f"  score mean {summary['score_mean']:.1f} (sd {summary['score_std']:.1f}), min {summary['score_min']}, "
+              + ', '.join(f'{name} {value:g}' for name, value in percentiles.items()) + f", max {summary['score_max']}")
+        print('  ' + ', '.join(f'{name} {count}' for name, count in summary['outcomes'].items()))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'policy': args.policy, 'max_steps': args.max_steps, 'seed': args.seed, 'results': summaries}, file, indent=2)
+            file.write('\n')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+import time
+from collections import namedtuple
+
+from engine import (Move, DRAW, RECYCLE, STOCK, WASTE, TABLEAU_COUNT, FOUNDATION_START, FOUNDATION_PILES,
+                    RED_SUITS, KING, is_safe)
+
+SolveResult = namedtuple('SolveResult', ['solvable', 'moves', 'nodes', 'elapsed'])
+'''
+solvable is True (moves holds the winning Move list), False (the whole game tree was searched
+without finding a win, so the deal can't be won) or None (a node or time limit was hit first).
+'''
+
+DEFAULT_NODE_LIMIT = 100000
+DEFAULT_TABLE_SIZE = 1 << 20
+MAX_DEPTH = 800
+
+
+class TranspositionTable:
+    """
+    Set of canonical state keys already searched without finding a win, bounded to max_size entries.
+    When full, the oldest quarter of the entries is evicted (dicts keep insertion order).
+    """
+
+    def __init__(self, max_size=DEFAULT_TABLE_SIZE):
+        self.max_size = max_size
+        self.entries = {}
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+
+    def add(self, key):
+        if len(self.entries) >= self.max_size:
+            evict = self.max_size // 4 or 1
+            for old_key in list(self.entries)[:evict]:
+                del self.entries[old_key]
+            self.evictions += evict
+        self.entries[key] = None
+
+
+'''
+The search works on immutable nodes:
+    (cols, hidden, talon, waste, found, recycle_ok)
+cols is a tuple of 7 tableau tuples and hidden their face-down counts. The stock and waste are
+merged into a single talon tuple (waste bottom to top, then the stock in drawing order), of which
+the first `waste` cards are on the waste pile. found holds the foundation height of each suit.
+recycle_ok tells whether the waste may be turned over without losing the game, which only matters
+until the first card is played (see GameState.recycle).
+
+Steps on the solution path are (src, dst, count, card), where foundations are given as
+FOUNDATION_START + suit and src == WASTE means "draw until card is on top of the waste, then play it".
+'''
+
+
+def _foundation_ok(found, card):
+    return found[card // 13] == card % 13
+
+# _HOLDS[card] is the set of the two cards that can be built on it in the tableau
+_HOLDS = [frozenset(other for other in range(52)
+                    if (other // 13 in RED_SUITS) != (card // 13 in RED_SUITS) and other % 13 == card % 13 - 1)
+          for card in range(52)]
+
+def _found_plus(found, suit):
+    return found[:suit] + (found[suit] + 1,) + found[suit + 1:]
+
+def _col_minus(cols, hidden, index, count):
+    # Removes the top `count` cards of a column, turning the new top card face up.
+    col = cols[index][:-count]
+    new_hidden = hidden
+    if col and hidden[index] >= len(col):
+        new_hidden = hidden[:index] + (len(col) - 1,) + hidden[index + 1:]
+    return cols[:index] + (col,) + cols[index + 1:], new_hidden
+
+def _set_col(cols, index, col):
+    return cols[:index] + (col,) + cols[index + 1:]
+
+
+class Solver:
+    """
+    Depth-first Klondike solver over canonicalised states.
+
+    Stock handling follows the GameState draw rules: every card that can be brought to the top of
+    the waste by drawing (and at most one recycle) is a candidate move of its own, so draws are
+    never searched one by one. Safe foundation moves are played automatically without branching.
+
+    A first search leaves out moves that don't look useful (splitting a run for nothing, emptying a
+    column with no king to fill it, taking a card back off the foundations for nothing). If that finds
+    no win, a second search tries every move, those last, so running it to the end without a win
+    proves the deal can't be won.
+    """
+
+    def __init__(self, node_limit=DEFAULT_NODE_LIMIT, time_limit=None, table_size=DEFAULT_TABLE_SIZE):
+        self.node_limit = node_limit
+        self.time_limit = time_limit
+        self.table = TranspositionTable(table_size)
+        self.nodes = 0
+        self.pruning = False
+
+    def solve(self, state):
+        # Decides whether the GameState can still be won, returns a SolveResult.
+        start = time.perf_counter()
+        self.nodes = 0
+        self.deadline = start + self.time_limit if self.time_limit else None
+        self.draw_amount = state.draw_amount
+        self.aborted = False
+        self.path = []
+        self.table.clear()
+
+        found = [0, 0, 0, 0]
+        for pile in FOUNDATION_PILES:
+            if state.piles[pile]:
+                found[state.piles[pile][-1] // 13] = len(state.piles[pile])
+        waste = state.piles[WASTE]
+        node = (tuple(tuple(state.piles[i]) for i in range(TABLEAU_COUNT)), tuple(state.hidden),
+                tuple(waste) + tuple(reversed(state.piles[STOCK])), len(waste), tuple(found),
+                state.move_made or state.draw_count > 1)
+
+        # Most wins are found quickly among the moves that look useful, so those are searched on their own
+        # first. Only a complete search can show there is no win, it gets the nodes left over.
+        self.pruning = True
+        won = self._search(node)
+        if not won and not self.aborted:
+            self.pruning = False
+            self.table.clear()
+            won = self._search(node)
+        elapsed = time.perf_counter() - start
+        if won:
+            return SolveResult(True, expand_steps(state, self.path), self.nodes, elapsed)
+        return SolveResult(None if self.aborted else False, None, self.nodes, elapsed)
+
+    def _key(self, node):
+        cols, hidden, talon, waste, _, recycle_ok = node
+        if recycle_ok and self.draw_amount == 1:
+            # Drawing one card at a time with the waste free to turn over, every talon card can be reached
+            # from any waste position
+            waste = 0
+        # Column order doesn't matter and the foundations follow from the remaining cards
+        return tuple(sorted(zip(hidden, cols))), talon, waste, recycle_ok
+
+    def _talon_positions(self, talon, waste, recycle_ok):
+        # Returns every talon index that can be brought to the top of the waste by drawing,
+        # turning the waste over at most once.
+        size = len(talon)
+        step = self.draw_amount
+        positions = [waste - 1] if waste else []
+        top = waste
+        while top < size:
+            top = min(top + step, size)
+            positions.append(top - 1)
+        if recycle_ok and waste:
+            reachable = set(positions)
+            top = 0
+            while top < size:
+                top = min(top + step, size)
+                if top - 1 not in reachable:
+                    positions.append(top - 1)
+        return positions
+
+    def _auto_play(self, node, steps):
+        # Plays safe foundation moves from the column tops and the waste until none is left.
+        cols, hidden, talon, waste, found, recycle_ok = node
+        progress = True
+        while progress:
+            progress = False
+            for index in range(TABLEAU_COUNT):
+                col = cols[index]
+                if col and _foundation_ok(found, col[-1]) and is_safe(found, col[-1]):
+                    card = col[-1]
+                    cols, hidden = _col_minus(cols, hidden, index, 1)
+                    found = _found_plus(found, card // 13)
+                    steps.append((index, FOUNDATION_START + card // 13, 1, card))
+                    progress = True
+            if waste:
+                card = talon[waste - 1]
+                if _foundation_ok(found, card) and is_safe(found, card):
+                    talon = talon[:waste - 1] + talon[waste:]
+                    waste -= 1
+                    found = _found_plus(found, card // 13)
+                    steps.append((WASTE, FOUNDATION_START + card // 13, 1, card))
+                    recycle_ok = True
+                    progress = True
+        return cols, hidden, talon, waste, found, recycle_ok
+
+    def _children(self, node):
+        # Yields (step, child node) pairs, the most promising moves first.
+        cols, hidden, talon, waste, found, recycle_ok = node
+        talon_positions = self._talon_positions(talon, waste, recycle_ok)
+        talon_cards = {talon[position] for position in talon_positions}
+
+        # Column tops to the foundations
+        for index in range(TABLEAU_COUNT):
+            col = cols[index]
+            if col and _foundation_ok(found, col[-1]):
+                card = col[-1]
+                new_cols, new_hidden = _col_minus(cols, hidden, index, 1)
+                yield ((index, FOUNDATION_START + card // 13, 1, card),
+                       (new_cols, new_hidden, talon, waste, _found_plus(found, card // 13), True))
+
+        # Talon cards to the foundations
+        for position in talon_positions:
+            card = talon[position]
+            if _foundation_ok(found, card):
+                yield ((WASTE, FOUNDATION_START + card // 13, 1, card),
+                       (cols, hidden, talon[:position] + talon[position + 1:], position,
+                        _found_plus(found, card // 13), True))
+
+        # Column to column, moves that turn a card over or empty a column first
+        uncovering = []
+        later = []
+        last = [] # Moves that don't look useful yet, only tried once everything else failed
+        empty_col = next((index for index in range(TABLEAU_COUNT) if not cols[index]), None)
+        # Emptying a column is mostly worth it when a king is waiting to take it
+        king_waiting = any(card % 13 == KING - 1 for card in talon_cards) or any(
+            col[i] % 13 == KING - 1 for col, first in zip(cols, hidden) for i in range(max(first, 1), len(col)))
+        for src in range(TABLEAU_COUNT):
+            col = cols[src]
+            first = hidden[src]
+            if first >= len(col):
+                continue
+            for start in range(first, len(col)):
+                card = col[start]
+                count = len(col) - start
+                whole_run = start == first
+                # Splitting a run mostly helps when the exposed card can go to a foundation or take a talon card
+                exposed = col[start - 1] if start else None
+                hopeful = not (not whole_run and not _foundation_ok(found, exposed) and not _HOLDS[exposed] & talon_cards
+                               or start == 0 and not king_waiting)
+                if card % 13 == KING - 1:
+                    # Kings only move to an empty column, and only to uncover something
+                    if empty_col is None or start == 0:
+                        continue
+                    targets = (empty_col,)
+                else:
+                    targets = [dst for dst in range(TABLEAU_COUNT)
+                               if dst != src and cols[dst] and card in _HOLDS[cols[dst][-1]]]
+                for dst in targets:
+                    new_cols, new_hidden = _col_minus(cols, hidden, src, count)
+                    new_cols = _set_col(new_cols, dst, cols[dst] + col[start:])
+                    child = ((src, dst, count, card), (new_cols, new_hidden, talon, waste, found, True))
+                    if not hopeful:
+                        if not self.pruning:
+                            last.append(child)
+                    elif whole_run and first:
+                        uncovering.append((first, child))
+                    elif not whole_run and _foundation_ok(found, exposed):
+                        # Right after those, splits that free a card for the foundations
+                        uncovering.append((-1, child))
+                    else:
+                        later.append(child)
+
+        # Uncovering the column with the most face-down cards first (sorted is stable)
+        uncovering.sort(key=lambda item: -item[0])
+        for _, child in uncovering:
+            yield child
+
+        # Talon cards to the columns
+        for position in talon_positions:
+            card = talon[position]
+            for dst in range(TABLEAU_COUNT):
+                target = cols[dst]
+                if (target and card in _HOLDS[target[-1]]) or (not target and card % 13 == KING - 1):
+                    yield ((WASTE, dst, 1, card),
+                           (_set_col(cols, dst, target + (card,)), hidden, talon[:position] + talon[position + 1:],
+                            position, found, True))
+                    if not target:
+                        break
+
+        yield from later
+
+        # Foundation cards back to the columns, first those something can then be built on
+        face_up = None
+        for suit in range(4):
+            height = found[suit]
+            if height < 2:
+                continue
+            card = suit * 13 + height - 1
+            for dst in range(TABLEAU_COUNT):
+                target = cols[dst]
+                if not (target and card in _HOLDS[target[-1]]):
+                    continue
+                child = ((FOUNDATION_START + suit, dst, 1, card),
+                         (_set_col(cols, dst, target + (card,)), hidden, talon, waste,
+                          found[:suit] + (height - 1,) + found[suit + 1:], True))
+                if face_up is None:
+                    face_up = talon_cards.union(*(col[first:] for col, first in zip(cols, hidden)))
+                if _HOLDS[card] & face_up:
+                    yield child
+                elif not self.pruning:
+                    last.append(child)
+
+        yield from last
+
+    def _search(self, node):
+        steps = []
+        node = self._auto_play(node, steps)
+        cols, hidden, talon, waste, found, _ = node
+
+        if not talon and not any(hidden):
+            # Every card is face up in descending runs, the rest is just moving them up
+            self.path.extend(steps)
+            self.path.extend(_finish(cols, found))
+            return True
+
+        key = self._key(node)
+        if key in self.table:
+            return False
+        # Added on the way in, so positions on the current path are not searched again
+        self.table.add(key)
+
+        self.nodes += 1
+        if self.nodes >= self.node_limit or len(self.path) > MAX_DEPTH or (
+                self.deadline and not self.nodes & 1023 and time.perf_counter() > self.deadline):
+            self.aborted = True
+            return False
+
+        depth = len(self.path)
+        self.path.extend(steps)
+        for step, child in self._children(node):
+            self.path.append(step)
+            if self._search(child):
+                return True
+            self.path.pop()
+            if self.aborted:
+                break
+        del self.path[depth:]
+        return False
+
+
+def _finish(cols, found):
+    # Plays all remaining column cards to the foundations.
+    cols = list(cols)
+    found = list(found)
+    steps = []
+    remaining = sum(len(col) for col in cols)
+    while remaining:
+        for index, col in enumerate(cols):
+            if col and found[col[-1] // 13] == col[-1] % 13:
+                card = col[-1]
+                steps.append((index, FOUNDATION_START + card // 13, 1, card))
+                found[card // 13] += 1
+                cols[index] = col[:-1]
+                remaining -= 1
+    return steps
+
+
+def _foundation_pile(state, suit):
+    # Returns the foundation pile holding the suit, or the first empty one.
+    empty = None
+    for pile in FOUNDATION_PILES:
+        cards = state.piles[pile]
+        if cards and cards[-1] // 13 == suit:
+            return pile
+        if not cards and empty is None:
+            empty = pile
+    return empty
+
+
+def expand_steps(state, steps):
+    # Turns solver steps into the GameState moves that play them, starting from the given state.
+    state = state.copy()
+    moves = []
+    for src, dst, count, card in steps:
+        if src == WASTE:
+            while not state.piles[WASTE] or state.piles[WASTE][-1] != card:
+                move = RECYCLE if not state.piles[STOCK] else DRAW
+                state.apply(move)
+                moves.append(move)
+        elif src >= FOUNDATION_START:
+            src = _foundation_pile(state, src - FOUNDATION_START)
+        if dst >= FOUNDATION_START:
+            dst = _foundation_pile(state, dst - FOUNDATION_START)
+        move = Move(src, dst, count)
+        if not state.apply(move):
+            raise RuntimeError(f'Solver produced an illegal move {move}')
+        moves.append(move)
+    return moves
+
+
+def solve(state, node_limit=DEFAULT_NODE_LIMIT, time_limit=None):
+    # Convenience wrapper, see Solver.solve
+    return Solver(node_limit, time_limit).solve(state)
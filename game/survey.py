@@ -0,0 +1,130 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from deals import deal
+from gamemode import Gamemode
+from solver import Solver, DEFAULT_NODE_LIMIT
+
+'''
+Solvability survey over a range of deal numbers (see deals.py), run across a process pool.
+
+Each finished seed is written as one JSON line (seed, solvable, length, nodes, time) to the output
+file, which doubles as the checkpoint: running the same command again skips the seeds already in it.
+Seeds whose search hit the node or time limit ("solvable": null) are skipped too, unless --retry-aborted
+is given, e.g. along with a higher --node-limit. The last line written for a seed is its result.
+
+    python survey.py --start 0 --count 1000000 --output klondike.jsonl
+'''
+
+
+def solve_seeds(seeds, gamemode, node_limit, time_limit):
+    # Worker side: solves a chunk of seeds and returns one result dict per seed
+    solver = Solver(node_limit, time_limit)
+    results = []
+    for seed in seeds:
+        result = solver.solve(deal(seed, gamemode))
+        results.append({
+            'seed': seed,
+            'solvable': result.solvable,
+            'length': len(result.moves) if result.moves else None,
+            'nodes': result.nodes,
+            'time': round(result.elapsed, 4),
+        })
+    return results
+
+
+def completed_seeds(path, retry_aborted=False):
+    # Reads the seeds already in the output file, ignoring a partly written last line. With retry_aborted,
+    # seeds whose latest result is an aborted search don't count as done.
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as file:
+        for line in file:
+            try:
+                result = json.loads(line)
+                if retry_aborted and result['solvable'] is None:
+                    done.discard(result['seed'])
+                else:
+                    done.add(result['seed'])
+            except (ValueError, KeyError):
+                pass
+    return done
+
+
+def chunked(seeds, size):
+    for start in range(0, len(seeds), size):
+        yield seeds[start:start + size]
+
+
+def run_survey(start, count, output, gamemode=Gamemode.KLONDIKE, workers=None, chunk_size=64,
+               node_limit=DEFAULT_NODE_LIMIT, time_limit=None, retry_aborted=False):
+    # Solves seeds start .. start + count - 1 not yet in the output file, returns the number solved now
+    done = completed_seeds(output, retry_aborted)
+    seeds = [seed for seed in range(start, start + count) if seed not in done]
+    if not seeds:
+        return 0
+
+    # Make sure new lines don't get appended to a line cut short by an interrupted run
+    if os.path.exists(output) and os.path.getsize(output):
+        with open(output, 'rb') as file:
+            file.seek(-1, os.SEEK_END)
+            needs_newline = file.read(1) != b'\n'
+    else:
+        needs_newline = False
+
+    workers = workers or os.cpu_count() or 1
+    chunks = chunked(seeds, chunk_size)
+    finished = 0
+    started = time.perf_counter()
+
+    with open(output, 'a') as file, ProcessPoolExecutor(workers) as pool:
+        if needs_newline:
+            file.write('\n')
+
+        # Keep a couple of chunks queued per worker rather than submitting millions of futures up front
+        pending = set()
+        for chunk in chunks:
+            pending.add(pool.submit(solve_seeds, chunk, gamemode, node_limit, time_limit))
+            if len(pending) >= workers * 2:
+                break
+
+        while pending:
+            finished_futures, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished_futures:
+                for result in future.result():
+                    file.write(json.dumps(result) + '\n')
+                finished += len(future.result())
+                chunk = next(chunks, None)
+                if chunk is not None:
+                    pending.add(pool.submit(solve_seeds, chunk, gamemode, node_limit, time_limit))
+            file.flush()
+
+            elapsed = time.perf_counter() - started
+            print(f'{finished}/{len(seeds)} seeds, {finished / elapsed:.1f} seeds/s', end='\r', flush=True)
+
+    print()
+    return finished
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Solve a range of seeded deals across all cores.')
+    parser.add_argument('--start', type=int, default=0, help='first seed')
+    parser.add_argument('--count', type=int, required=True, help='number of seeds')
+    parser.add_argument('--output', required=True, help='JSON lines file, also used to resume')
+    parser.add_argument('--gamemode', choices=[mode.value for mode in Gamemode], default=Gamemode.KLONDIKE.value)
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--chunk-size', type=int, default=64, help='seeds per task')
+    parser.add_argument('--node-limit', type=int, default=DEFAULT_NODE_LIMIT)
+    parser.add_argument('--time-limit', type=float, default=None, help='seconds per deal')
+    parser.add_argument('--retry-aborted', action='store_true', help='solve again the seeds whose search hit a limit')
+    args = parser.parse_args()
+
+    run_survey(args.start, args.count, args.output, Gamemode(args.gamemode), args.workers, args.chunk_size,
+               args.node_limit, args.time_limit, args.retry_aborted)
+
+if __name__ == "__main__":
+    main()
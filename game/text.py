@@ -1,14 +1,12 @@
-import pygame
-pygame.init() # Due to the order of calls, pygame complains without this
+from fonts import DEFAULT_FONT, get_font, render_text
 
 class Text:
-    def __init__(self, content, centre, font=pygame.font.SysFont('Times New Roman', 18), colour=(0,0,0)):
+    def __init__(self, content, centre, font=None, colour=(0,0,0)):
         self.content = content
-        self.font = font
+        self.font = font if font is not None else get_font(*DEFAULT_FONT)
         self.colour = colour
-        self.display = self.font.render(self.content, True, self.colour)
-        self.display_rect = self.display.get_rect()
+        self.display_rect = render_text(self.font, self.content, self.colour).get_rect()
         self.display_rect.center = centre
 
     def draw(self, surface):
-        surface.blit(self.display, self.display_rect)
+        surface.blit(render_text(self.font, self.content, self.colour), self.display_rect)
\ No newline at end of file
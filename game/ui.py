@@ -1,6 +1,16 @@
 import pygame
 import sys
+import time
 from deck import Deck
+from fonts import HUD_FONT, get_font, render_text
+from pacing import FrameScheduler
+from profiler import FrameProfiler
+from save import save_game, load_game, delete_save
+from deals import MAX_DEAL_ID, random_deal_id
+from replay import append_replay
+from hint import HintEngine
+from events import EventStream, JsonlSink, AggregatorSink
+from engine import WASTE
 from text import Text
 from gamemode import Gamemode
 from settings import Settings
@@ -19,37 +29,87 @@ BACKGROUND_COLOR = (0,128,0)
 UI_BAR_COLOR = (255,255,255)
 UI_BAR_SIZE = 35
 
+# Frame rate cap while cards are moving, and how long an idle frame waits for input (ms)
+ACTIVE_FPS = 60
+IDLE_TIMEOUT = 500
+
+# Seconds an auto-played card takes to slide onto its foundation
+AUTO_MOVE_TIME = 0.12
+
+# Posted by the hint engine's thread when a search finishes, and the outline drawn around the hinted piles
+HINT_EVENT = pygame.event.custom_type()
+HINT_COLOUR = (255, 215, 0)
+NO_HINT_MESSAGE = "No hint: there are no useful moves left."
+HINT_FAILED_MESSAGE = "No hint: the search failed."
+
 class Ui:
-    def __init__(self):
+    def __init__(self, score_sink=None):
         # Initialize Pygame
         pygame.init()
         self.saved_settings = Settings()
         self.settings_changed = False
-        self.score = Score(self.saved_settings)
-        self.setup(Gamemode.KLONDIKE)
 
-    def setup(self, gamemode):
+        # Score changes are logged (to the JSONL file in resources/logs unless another sink is given) and
+        # totalled in memory by a background writer
+        self.score_stats = AggregatorSink()
+        self.score_events = EventStream(score_sink if score_sink is not None else JsonlSink(), self.score_stats)
+        self.score = Score(self.saved_settings, self.score_events)
+
+        # Dirty-region rendering only redraws and pushes the screen areas that changed,
+        # set to False to redraw and flip the whole screen every frame
+        self.dirty_rendering = True
+
+        self.frames = FrameScheduler(ACTIVE_FPS, IDLE_TIMEOUT)
+
+        # Times each phase of a frame, F3 shows the overlay (see profiler.py for the other hotkeys)
+        self.profiler = FrameProfiler(pacing=self.frames)
+
+        # Hint searches run in a worker process, the result arrives as a HINT_EVENT
+        self.hints = HintEngine(lambda generation: pygame.event.post(pygame.event.Event(HINT_EVENT, generation=generation)))
+
+        # Resume the autosaved game if it was still being played
+        saved, deal_id, moves = load_game() or (None, None, None)
+        if saved is not None and not saved.is_won() and not saved.lost:
+            self.setup(saved.gamemode, saved, deal_id)
+            self.deck.restore_history(moves)
+            self.score.update(self.saved_settings)
+            self.score.score = saved.score
+            self.score.moves_made = saved.moves_made
+            self.score.consecutive_foundation_moves = saved.consecutive_foundation_moves
+            self.score.stockpile_refresh_count = saved.stockpile_refresh_count
+        else:
+            self.setup(Gamemode.KLONDIKE)
+
+    def setup(self, gamemode, state=None, deal_id=None):
         self.saved_settings.update_settings(gamemode)
         self.settings_changed = False
         
+        # The Vegas score carries over between games, its counters start again like the GameState's
         self.score.start_game()
         self.score.moves_made = 0
-        self.move_made = False
+        self.score.stockpile_refresh_count = 0
+        self.score.reset_consecutive_moves()
 
         self.starting_gamemode = gamemode
-        self.draw_count = self.saved_settings.draw_amount
         
-        # set screen size
-        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        # set screen size, the window is kept between games
+        self.screen = pygame.display.get_surface()
+        if self.screen is None or self.screen.get_size() != (SCREEN_WIDTH, SCREEN_HEIGHT):
+            self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
 
         # Set up GUI
         self.topbar = pygame.Rect(0, 0, SCREEN_WIDTH, UI_BAR_SIZE)
         self.bottom_bar = pygame.Rect(0, SCREEN_HEIGHT-UI_BAR_SIZE, SCREEN_WIDTH, UI_BAR_SIZE)
         self.new_game_btn = Button('New Game', pygame.Rect(0,0,125,Button.DEFAULT_HEIGHT+5))
         self.settings_btn = Button('Settings', pygame.Rect(self.new_game_btn.rect.right+1, 0, 125, Button.DEFAULT_HEIGHT+5))
+        self.play_deal_btn = Button('Play Deal #', pygame.Rect(self.settings_btn.rect.right+1, 0, 125, Button.DEFAULT_HEIGHT+5))
+        self.hint_btn = Button('Hint', pygame.Rect(self.play_deal_btn.rect.right+1, 0, 100, Button.DEFAULT_HEIGHT+5))
+        self.redo_btn = Button('Redo', pygame.Rect(SCREEN_WIDTH-100, 0, 100, Button.DEFAULT_HEIGHT+5))
+        self.undo_btn = Button('Undo', pygame.Rect(self.redo_btn.rect.left-101, 0, 100, Button.DEFAULT_HEIGHT+5))
         self.settings = SettingsMenu('Game Settings')
         self.settings_close_msg = ConfirmationBox('Changes will be applied on the next game.')
         self.end_game_screen = MessageBox('Play again?')
+        self.deal_box = NumberInputBox('Enter the deal number to play:')
         self.gamemode_display = Text(str.capitalize(self.saved_settings.active_gamemode.name) + " rules applied.", (SCREEN_WIDTH//2, self.bottom_bar.bottom-19))
 
         # Set up saved settings
@@ -62,6 +122,8 @@ class Ui:
                 self.settings.gamemode.options[0].unselect()
             case _:
                 pass
+        self.settings.auto_play.options[0].selected = not self.saved_settings.auto_play
+        self.settings.auto_play.options[1].selected = self.saved_settings.auto_play
         
         # set title
         pygame.display.set_caption(SCREEN_TITLE)
@@ -69,89 +131,360 @@ class Ui:
         # Background color
         self.bg_color = (BACKGROUND_COLOR) 
 
-        # Initialize deck
+        # Initialize deck, with a random deal unless one is asked for
+        if deal_id is None:
+            deal_id = random_deal_id()
         self.deck = Deck(self)
         self.deck.load_cards() 
-        self.deck.shuffle_cards()
-        self.deck.load_piles((SCREEN_WIDTH, SCREEN_HEIGHT))
+        self.deck.shuffle_cards(deal_id)
+        self.deck.load_piles((SCREEN_WIDTH, SCREEN_HEIGHT), state)
+        self.deal_display = Text(f'Deal #{deal_id}', (SCREEN_WIDTH-170, self.bottom_bar.bottom-19))
+        self.game_recorded = False
 
         self.dragged_cards = []
         self.drag_offset_x = 0
         self.drag_offset_y = 0
 
+        # Card sliding to a foundation (see start_auto_move), and whether to look for one after the player's move
+        self.auto_move = None
+        self.auto_play_pending = False
+
+        # Hinted Move and the position (GameState.zobrist) it was asked for
+        self.hints.cancel()
+        self.hint = None
+        self.hint_position = None
+
+        # Static background layer, built on the first frame
+        self.background = None
+        self.background_key = None
+
+        # Everything needs drawing on the new screen
+        self.dirty_rects = []
+        self.full_redraw = True
+        self.last_frame_state = None
+        self.last_hud = None
+
+    def mark_dirty(self, rect):
+        # Marks a screen area to be redrawn and pushed on the next frame
+        self.dirty_rects.append(pygame.Rect(rect))
+
+    def mark_all_dirty(self):
+        self.full_redraw = True
+
+    def frame_state(self):
+        # Dialogs, button states and settings selections, any change to these redraws the whole screen
+        return (self.end_game_screen.visible, self.settings.visible, self.settings_close_msg.visible,
+                self.deal_box.visible, self.deal_box.digits, self.new_game_btn.enabled, self.settings_btn.enabled,
+                self.play_deal_btn.enabled, self.hint_btn.enabled, self.undo_btn.enabled, self.redo_btn.enabled,
+                tuple(option.selected for option in self.settings.gamemode.options),
+                tuple(option.selected for option in self.settings.auto_play.options))
+
+    def dragged_rect(self):
+        # Screen area covered by the cards being dragged
+        rect = pygame.Rect(self.dragged_cards[0].position, self.deck.card_size)
+        for card in self.dragged_cards[1:]:
+            rect.union_ip(pygame.Rect(card.position, self.deck.card_size))
+        if self.starting_gamemode == Gamemode.VEGAS and self.origin_pile is self.deck.piles[-5]:
+            # Waste cards are drawn with the fan offset
+            rect.width += 50
+        return rect
+
+    def shutdown(self):
+        # Every way out of the game ends here: running profiler captures and buffered score events are
+        # written out and the hint worker stopped
+        self.profiler.close()
+        self.score_events.close()
+        self.hints.close()
+        pygame.quit()
+        sys.exit()
 
     def mainloop(self):
 
         # Main loop of the game
         while True:
 
-            # Check for events
-            for event in pygame.event.get():
+            # Check for events, waiting for them when nothing is moving
+            events = self.frames.next_frame(self.is_active())
+            self.profiler.begin_frame()
+            for event in events:
                 if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
+                    self.shutdown()
                 elif event.type == pygame.MOUSEBUTTONDOWN:
                     self.handle_mouse_down(pygame.mouse.get_pos())
                 elif event.type == pygame.MOUSEBUTTONUP:
                     self.handle_mouse_up(pygame.mouse.get_pos())
                 elif event.type == pygame.MOUSEMOTION and self.dragged_cards:
                     self.handle_mouse_motion(pygame.mouse.get_pos())
+                elif event.type == pygame.KEYDOWN:
+                    self.handle_key_down(event)
+                elif event.type == HINT_EVENT:
+                    self.show_hint(event.generation)
+            self.profiler.mark('events')
             
-            # Fill the background with green color (or lighter green if game is over)
-            self.screen.fill(self.bg_color if not self.end_game_screen.visible and not self.settings.visible and not self.settings_close_msg.visible else (125,218,88))
-
-            # Display the deck
-            self.deck.display(self.screen)
-
-            # Display the GUI
-            pygame.draw.rect(self.screen, UI_BAR_COLOR, self.topbar)
-            pygame.draw.rect(self.screen, UI_BAR_COLOR, self.bottom_bar)
-            self.new_game_btn.draw(self.screen)
-            self.settings_btn.draw(self.screen)
-            self.gamemode_display.draw(self.screen)
-            
-            if self.end_game_screen.visible:
-                self.end_game_screen.draw(self.screen)
-            elif self.settings.visible:
-                self.settings.draw(self.screen)
-            elif self.settings_close_msg.visible:
-                self.settings_close_msg.draw(self.screen)
-            
-            # Display the score on the top bar
-            font = pygame.font.Font(None, 30)  
-            text = font.render(f'Score: {self.score.score}', True, (0, 0, 0))  # Black color for the font
-            text_rect = text.get_rect(center=(SCREEN_WIDTH // 2, UI_BAR_SIZE // 2))
-            self.screen.blit(text, text_rect)
-
-            # Display the move count on the top bar
-            move_count_text = font.render(f'Moves: {self.score.moves_made}', True, (0, 0, 0))  
-            move_count_rect = move_count_text.get_rect(center=(SCREEN_WIDTH // 3, UI_BAR_SIZE // 2))
-            self.screen.blit(move_count_text, move_count_rect)
-
-            # Check if there are any dragged cards
-            if self.dragged_cards:  
-                for dragged_card in self.dragged_cards:  
-                    img = self.deck.card_images[dragged_card.name_of_card] 
-                    # If game mode is Vegas and the dragged card is from the waste pile, offset graphics due to 3 card fan
-                    # Otherwise, display normally
-                    offset = 50 if self.starting_gamemode == Gamemode.VEGAS and dragged_card in self.deck.piles[-5].cards else 0
-                    self.screen.blit(img, (dragged_card.x+offset, dragged_card.y))
+            # Play out safe cards and finished games, one sliding card at a time
+            if self.auto_move is not None:
+                self.step_auto_move()
+            elif self.auto_play_pending:
+                self.start_auto_move()
+            self.profiler.mark('auto_play')
 
             # Place a win condition that restarts the game when triggered
-            if len(self.deck.piles[-1].cards) == 13 and len(self.deck.piles[-2].cards) == 13 and len(self.deck.piles[-3].cards) == 13 and len(self.deck.piles[-4].cards) == 13:
+            if self.deck.state.is_won() and not self.end_game_screen.visible:
+                self.record_game()
                 self.end_game_screen.show()
                 self.new_game_btn.disable()
                 self.settings_btn.disable()
+                self.play_deal_btn.disable()
+            self.profiler.mark('win_check')
+
+            # Save after every change, a finished game leaves nothing to resume
+            if self.deck.unsaved:
+                self.autosave()
+            self.profiler.mark('autosave')
 
             # Apply time penalty when game is not win
             # if not self.win_screen.visible:
             #     self.score.apply_time_penalty()
 
-            # Render score
-            self.score.display_score(self.screen)
-        
-            # Update the display
+            # Draw and push the frame
+            self.render()
+            self.frames.end_frame()
+            self.profiler.end_frame()
+
+    def autosave(self):
+        self.deck.unsaved = False
+        if self.end_game_screen.visible:
+            delete_save()
+        else:
+            save_game(self.deck.state, self.score, self.deck.deal_id, self.deck.journal.encoded)
+
+    def record_game(self):
+        # Adds the game to the replay archive once it is over or abandoned, games without a move are not kept
+        if self.game_recorded or not self.deck.journal.can_undo():
+            return
+        self.game_recorded = True
+        append_replay(self.deck.replay())
+
+    def is_active(self):
+        # Whether something is moving on screen, frames then run at the capped rate instead of waiting for input
+        return bool(self.dragged_cards) or self.auto_move is not None or self.auto_play_pending
+
+    def start_auto_move(self):
+        # Starts sliding the next card that plays itself: any card once the game can be played out, otherwise
+        # a safe card if auto-play is on. Stops looking when there is none.
+        state = self.deck.state
+        if self.dialog_open() or self.dragged_cards:
+            move = None
+        elif state.can_auto_complete():
+            move = state.next_finishing_move()
+        elif self.saved_settings.auto_play:
+            move = state.next_safe_move()
+        else:
+            move = None
+        if move is None:
+            self.auto_play_pending = False
+            return
+        # The card leaves its pile's view while it slides, the game state changes once it lands
+        source = self.deck.piles[move.src]
+        target = self.deck.piles[move.dst]
+        self.mark_dirty(self.deck.pile_rect(source))
+        start = card_x, card_y = source.card_position(len(source.cards) - 1)
+        if move.src == WASTE and self.starting_gamemode == Gamemode.VEGAS:
+            # Vegas draws the top waste card at the end of the fan
+            start = (card_x + 25 * (min(len(source.cards), 3) - 1), card_y)
+        card = source.cards.pop()
+        self.deck.invalidate_draw_list()
+        self.auto_move = (move, card, start, (target.x, target.y), time.perf_counter())
+
+    def step_auto_move(self):
+        # Moves the sliding card along, only its old and new areas are redrawn
+        move, card, start, end, start_time = self.auto_move
+        self.mark_dirty(pygame.Rect(card.position, self.deck.card_size))
+        progress = (time.perf_counter() - start_time) / AUTO_MOVE_TIME
+        if progress >= 1:
+            self.auto_move = None
+            source = self.deck.piles[move.src]
+            source.cards.append(card)
+            self.deck.move_card(card, source, self.deck.piles[move.dst], self.score)
+            self.auto_play_pending = True
+            return
+        card.set_position(start[0] + (end[0] - start[0]) * progress, start[1] + (end[1] - start[1]) * progress)
+        self.deck.invalidate_draw_list()
+        self.mark_dirty(pygame.Rect(card.position, self.deck.card_size))
+
+    def dialog_open(self):
+        return self.end_game_screen.visible or self.settings.visible or self.settings_close_msg.visible or self.deal_box.visible
+
+    def update_game_buttons(self):
+        # Hint, undo and redo are only available while no dialog is open and no card is held
+        playing = not self.dialog_open() and not self.dragged_cards
+        for button, available in ((self.hint_btn, not self.hints.busy()),
+                                  (self.undo_btn, self.deck.journal.can_undo()), (self.redo_btn, self.deck.journal.can_redo())):
+            if playing and available and not button.enabled:
+                button.enable()
+            elif not (playing and available) and button.enabled:
+                button.disable()
+
+    def request_hint(self):
+        self.clear_hint()
+        self.hint_position = self.deck.state.zobrist
+        self.hints.request(self.deck.state)
+
+    def show_hint(self, generation):
+        # Outlines the source and target piles of a finished search, unless the player moved or asked again meanwhile
+        if generation != self.hints.generation or self.hint_position != self.deck.state.zobrist:
+            return
+        self.hint = self.hints.result(generation)
+        if self.hint is None:
+            # Said in the bottom bar until the player moves or asks again
+            self.show_message(HINT_FAILED_MESSAGE if self.hints.failed else NO_HINT_MESSAGE)
+            return
+        for index in (self.hint.src, self.hint.dst):
+            self.mark_dirty(self.deck.pile_rect(self.deck.piles[index]))
+
+    def show_message(self, message=None):
+        # Puts the message in the middle of the bottom bar, or the rules in use back when None
+        content = message or str.capitalize(self.saved_settings.active_gamemode.name) + " rules applied."
+        if content != self.gamemode_display.content:
+            self.gamemode_display = Text(content, (SCREEN_WIDTH//2, self.bottom_bar.bottom-19))
+            self.mark_dirty(self.bottom_bar)
+
+    def clear_hint(self):
+        # Stops a running search and removes the outline or message
+        self.hints.cancel()
+        self.show_message()
+        if self.hint is not None:
+            for index in (self.hint.src, self.hint.dst):
+                self.mark_dirty(self.deck.pile_rect(self.deck.piles[index]).inflate(6, 6))
+        self.hint = None
+        self.hint_position = None
+
+    def render(self):
+        # Picks up what changed since the last frame
+        if self.hint_position is not None and self.hint_position != self.deck.state.zobrist:
+            self.clear_hint()
+        self.update_game_buttons()
+        frame_state = self.frame_state()
+        if frame_state != self.last_frame_state:
+            self.last_frame_state = frame_state
+            self.mark_all_dirty()
+        hud = (self.score.score, self.score.moves_made)
+        if hud != self.last_hud:
+            self.last_hud = hud
+            self.mark_dirty(self.topbar)
+        self.dirty_rects.extend(self.deck.dirty_rects)
+        self.deck.dirty_rects.clear()
+        overlay_rect = self.profiler.refresh_overlay()
+        if overlay_rect is not None:
+            self.mark_dirty(overlay_rect)
+        self.profiler.mark('gui')
+
+        if not self.dirty_rendering or self.full_redraw:
+            self.draw_frame()
+            self.profiler.draw_overlay(self.screen)
+            self.profiler.mark('overlay')
             pygame.display.flip()
+        elif self.dirty_rects:
+            # Redraw only inside the changed areas, then push just those areas to the display
+            self.screen.set_clip(self.dirty_rects[0].unionall(self.dirty_rects[1:]))
+            self.draw_frame()
+            self.profiler.draw_overlay(self.screen)
+            self.profiler.mark('overlay')
+            self.screen.set_clip(None)
+            pygame.display.update(self.dirty_rects)
+        self.profiler.mark('flip')
+
+        self.dirty_rects = []
+        self.full_redraw = False
+
+    def build_background(self, background_color):
+        # Composites everything that only changes with the layout, settings or button states
+        background = pygame.Surface(self.screen.get_size()).convert()
+        background.fill(background_color)
+        self.deck.draw_mats(background)
+        pygame.draw.rect(background, UI_BAR_COLOR, self.topbar)
+        pygame.draw.rect(background, UI_BAR_COLOR, self.bottom_bar)
+        self.new_game_btn.draw(background)
+        self.settings_btn.draw(background)
+        self.play_deal_btn.draw(background)
+        self.hint_btn.draw(background)
+        self.undo_btn.draw(background)
+        self.redo_btn.draw(background)
+        self.gamemode_display.draw(background)
+        self.deal_display.draw(background)
+        return background
+
+    def draw_frame(self):
+        # Background green color (or lighter green if game is over)
+        background_color = self.bg_color if not self.dialog_open() else (125,218,88)
+        background_key = (background_color, self.screen.get_size(), self.new_game_btn.enabled, self.settings_btn.enabled,
+                          self.play_deal_btn.enabled, self.hint_btn.enabled, self.undo_btn.enabled, self.redo_btn.enabled,
+                          self.gamemode_display.content, self.deal_display.content)
+        if background_key != self.background_key:
+            self.background = self.build_background(background_color)
+            self.background_key = background_key
+        self.screen.blit(self.background, (0, 0))
+        self.profiler.count_blits()
+        self.profiler.mark('background')
+
+        # Display the deck
+        self.profiler.count_blits(self.deck.display(self.screen))
+
+        # Outline the piles of the hinted move
+        if self.hint is not None:
+            for index in (self.hint.src, self.hint.dst):
+                pygame.draw.rect(self.screen, HINT_COLOUR, self.deck.pile_rect(self.deck.piles[index]), 3)
+        self.profiler.mark('deck')
+
+        # Long tableau piles run under the bottom bar
+        self.screen.blit(self.background, self.bottom_bar, self.bottom_bar)
+        self.profiler.count_blits()
+        
+        if self.end_game_screen.visible:
+            self.end_game_screen.draw(self.screen)
+        elif self.settings.visible:
+            self.settings.draw(self.screen)
+        elif self.settings_close_msg.visible:
+            self.settings_close_msg.draw(self.screen)
+        elif self.deal_box.visible:
+            self.deal_box.draw(self.screen)
+        self.profiler.mark('gui')
+        
+        # Display the score on the top bar
+        font = get_font(*HUD_FONT)
+        text = render_text(font, f'Score: {self.score.score}', (0, 0, 0))  # Black color for the font
+        # Both sit between the left and right button groups
+        hud_centre = (self.hint_btn.rect.right + self.undo_btn.rect.left) // 2
+        text_rect = text.get_rect(center=(hud_centre + 90, UI_BAR_SIZE // 2))
+        self.screen.blit(text, text_rect)
+
+        # Display the move count on the top bar
+        move_count_text = render_text(font, f'Moves: {self.score.moves_made}', (0, 0, 0))
+        move_count_rect = move_count_text.get_rect(center=(hud_centre - 90, UI_BAR_SIZE // 2))
+        self.screen.blit(move_count_text, move_count_rect)
+        self.profiler.count_blits(2)
+        self.profiler.mark('hud')
+
+        # The sliding card goes over every pile
+        if self.auto_move is not None:
+            card = self.auto_move[1]
+            self.screen.blit(self.deck.card_image(card), card.position)
+            self.profiler.count_blits()
+
+        # Check if there are any dragged cards
+        if self.dragged_cards:  
+            for dragged_card in self.dragged_cards:  
+                img = self.deck.card_images[dragged_card.name_of_card] 
+                # If game mode is Vegas and the dragged card is from the waste pile, offset graphics due to 3 card fan
+                # Otherwise, display normally
+                offset = 50 if self.starting_gamemode == Gamemode.VEGAS and dragged_card in self.deck.piles[-5].cards else 0
+                self.screen.blit(img, (dragged_card.x+offset, dragged_card.y))
+            self.profiler.count_blits(len(self.dragged_cards))
+        self.profiler.mark('drag')
+
+        # Render score
+        self.score.display_score(self.screen)
+        self.profiler.mark('hud')
 
     def handle_mouse_down(self, mouse_pos):
         # Handle saved settings
@@ -167,18 +500,39 @@ class Ui:
                 self.settings.gamemode.options[1].select()
                 self.settings.gamemode.options[0].unselect()
 
+            # Auto-play applies straight away
+            if self.settings.auto_play.options[0].clicked(mouse_pos):
+                self.saved_settings.auto_play = False
+                self.settings.auto_play.options[0].select()
+                self.settings.auto_play.options[1].unselect()
+            elif self.settings.auto_play.options[1].clicked(mouse_pos):
+                self.saved_settings.auto_play = True
+                self.settings.auto_play.options[1].select()
+                self.settings.auto_play.options[0].unselect()
+                self.auto_play_pending = True
+
         # Handle In-game button (GUI) clicks
         if self.new_game_btn.clicked(mouse_pos) and self.new_game_btn.enabled:
-            if self.settings_changed:
-                self.saved_settings.update_settings(self.saved_settings.active_gamemode)
-                self.score.update(self.saved_settings)
-            self.setup(self.saved_settings.active_gamemode)
-            if self.saved_settings.active_gamemode == Gamemode.KLONDIKE:
-                self.score = Score(self.saved_settings)
+            self.new_game()
         elif self.settings_btn.clicked(mouse_pos) and self.settings_btn.enabled:
             self.settings.show()
             self.settings_btn.disable()
             self.new_game_btn.disable()
+            self.play_deal_btn.disable()
+        elif self.auto_move is not None and self.topbar.collidepoint(mouse_pos):
+            # Buttons that change the game wait for the sliding card to land
+            pass
+        elif self.hint_btn.clicked(mouse_pos) and self.hint_btn.enabled:
+            self.request_hint()
+        elif self.play_deal_btn.clicked(mouse_pos) and self.play_deal_btn.enabled:
+            self.deal_box.show()
+            self.settings_btn.disable()
+            self.new_game_btn.disable()
+            self.play_deal_btn.disable()
+        elif self.undo_btn.clicked(mouse_pos) and self.undo_btn.enabled:
+            self.deck.undo(self.score)
+        elif self.redo_btn.clicked(mouse_pos) and self.redo_btn.enabled:
+            self.deck.redo(self.score)
 
         # Handle settings menu button clicks
         if self.settings.visible and self.settings.clicked_close(mouse_pos):
@@ -188,6 +542,7 @@ class Ui:
             else:
                 self.settings_btn.enable()
                 self.new_game_btn.enable()
+                self.play_deal_btn.enable()
 
         if self.settings_close_msg.visible:
             if self.settings_close_msg.clicked_ok(mouse_pos):
@@ -195,47 +550,44 @@ class Ui:
                 self.settings.hide()
                 self.settings_btn.enable()
                 self.new_game_btn.enable()
+                self.play_deal_btn.enable()
+
+        # Handle deal number dialog button clicks
+        if self.deal_box.visible:
+            if self.deal_box.clicked_ok(mouse_pos):
+                self.play_entered_deal()
+            elif self.deal_box.clicked_cancel(mouse_pos):
+                self.deal_box.hide()
+                self.settings_btn.enable()
+                self.new_game_btn.enable()
+                self.play_deal_btn.enable()
 
         # Handle end screen button clicks
         if self.end_game_screen.visible:
             if self.end_game_screen.clicked_yes(mouse_pos):
                 self.end_game_screen.hide()
-                self.new_game_btn.enable()
-                self.settings_btn.enable()
-                if self.settings_changed:
-                    self.saved_settings.update_settings(self.saved_settings.active_gamemode)
-                    self.score.update(self.saved_settings)
-                self.setup(self.saved_settings.active_gamemode)
-                if self.saved_settings.active_gamemode == Gamemode.KLONDIKE:
-                    self.score = Score(self.saved_settings)
+                self.new_game()
             elif self.end_game_screen.clicked_no(mouse_pos):
-                pygame.quit()
-                sys.exit()
+                self.shutdown()
 
-        if not self.end_game_screen.visible and not self.settings.visible and not self.settings_close_msg.visible:
+        if not self.dialog_open() and self.auto_move is None:
             # Check if the click is on the deck pile
             deck_pile = next((pile for pile in self.deck.piles if pile.pile_type == PileType.STOCK), None)
             if deck_pile and deck_pile.is_mouse_over(mouse_pos):
                  # If the deck pile is empty
                 if not deck_pile.cards:
-                    '''
-                    Determine if possible according to the rules outlined
-                    Where Draw 3 allows for 3 complete shuffles of the stock,
-                    Draw 1 allows for 1 complete shuffle of the stock
-                    '''
-                    self.draw_count -= 1
-                    if not self.move_made and self.draw_count <= 0:
+                    # The deck ends the game when the stock is recycled too many times without a move
+                    if not self.deck.transfer_waste_to_deck():
+                        self.record_game()
                         self.end_game_screen.show()
                         self.new_game_btn.disable()
                         self.settings_btn.disable()
-                    
-                    self.move_made = False
-                    
-                    self.deck.transfer_waste_to_deck()
+                        self.play_deal_btn.disable()
+
                     self.score.refresh_stockpile()
                 else:
-                   for _ in range(1 if self.starting_gamemode == Gamemode.KLONDIKE else 3):
-                        self.deck.transfer_card_from_deck_to_waste()
+                    self.deck.transfer_card_from_deck_to_waste()
+                self.auto_play_pending = True
                 return
             
             # For all other pile types
@@ -260,8 +612,51 @@ class Ui:
                 self.offset_x = mouse_pos[0] - picked_card.x
                 self.offset_y = mouse_pos[1] - picked_card.y
 
+    def new_game(self, deal_id=None):
+        # Starts a new game with the saved settings, a random deal unless one is given
+        self.record_game()
+        if self.settings_changed:
+            self.saved_settings.update_settings(self.saved_settings.active_gamemode)
+            self.score.update(self.saved_settings)
+        self.setup(self.saved_settings.active_gamemode, deal_id=deal_id)
+        if self.saved_settings.active_gamemode == Gamemode.KLONDIKE:
+            self.score = Score(self.saved_settings, self.score_events)
+
+    def play_entered_deal(self):
+        # Starts the deal typed into the deal dialog, if it is a valid deal number
+        deal_id = self.deal_box.value()
+        if deal_id is None or deal_id > MAX_DEAL_ID:
+            return
+        self.deal_box.hide()
+        self.new_game(deal_id)
+
+    def handle_key_down(self, event):
+        # Function keys of the profiler work everywhere
+        if self.profiler.handle_key(event):
+            return
+
+        # Typing goes to the deal dialog while it is open
+        if self.deal_box.visible:
+            if self.deal_box.handle_key(event):
+                self.play_entered_deal()
+            return
+
+        # Ctrl+Z undoes, Ctrl+Y or Ctrl+Shift+Z redoes
+        if not event.mod & pygame.KMOD_CTRL or self.auto_move is not None:
+            return
+        self.update_game_buttons()
+        if event.key == pygame.K_z and not event.mod & pygame.KMOD_SHIFT:
+            if self.undo_btn.enabled:
+                self.deck.undo(self.score)
+        elif event.key == pygame.K_y or event.key == pygame.K_z:
+            if self.redo_btn.enabled:
+                self.deck.redo(self.score)
+
     def handle_mouse_motion(self, mouse_pos):
         if self.dragged_cards: 
+            # Erase the cards where they were
+            self.mark_dirty(self.dragged_rect())
+
             # Calculate the new position based on the current mouse position minus the drag offset
             delta_x = mouse_pos[0] - self.offset_x
             delta_y = mouse_pos[1] - self.offset_y
@@ -279,10 +674,16 @@ class Ui:
 
                 card.set_position(new_card_x, new_card_y)
 
+            self.deck.invalidate_draw_list()
+            self.mark_dirty(self.dragged_rect())
+
 
     def handle_mouse_up(self, mouse_pos):
-        if not self.end_game_screen.visible and not self.settings.visible and not self.settings_close_msg.visible:
+        if not self.dialog_open():
             if self.dragged_cards: 
+                # The cards leave the drop position whether or not the move is valid
+                self.mark_dirty(self.dragged_rect())
+
                 target_pile = self.deck.get_pile_at_position(mouse_pos)
                 move_valid = False
     
@@ -294,10 +695,9 @@ class Ui:
                     move_valid = self.deck.is_valid_move(bottom_card, self.origin_pile, target_pile)
     
                     if move_valid:
-                        # Move each card in the dragged stack to the target pile if the bottom card's move is valid
-                        for card in self.dragged_cards:
-                            self.snap_card_to_pile(card, target_pile)
-                            self.deck.move_card(card, self.origin_pile, target_pile, self.score)
+                        # Move the bottom card, and the rest of the dragged stack with it, to the target pile
+                        self.deck.move_card(bottom_card, self.origin_pile, target_pile, self.score)
+                        self.auto_play_pending = True
     
                 else:
                     move_valid = False
@@ -308,30 +708,8 @@ class Ui:
                         card.set_position(original_x, original_y)
                         if card not in self.origin_pile.cards:
                             self.origin_pile.cards.append(card)
-                else:
-                    self.move_made = True
+                    self.deck.invalidate_draw_list()
+                    self.mark_dirty(self.dragged_rect())
     
                 # Clear the list of dragged cards after dropping
                 self.dragged_cards = []
-
-    def snap_card_to_pile(self, card, target_pile):
-        # Snapping back to the original pile
-        if target_pile == self.origin_pile:
-            # Calculate the card's index in its original pile
-            card_index = self.origin_pile.cards.index(card)
-            # Calculate the Y position based on the card's index
-            new_y = target_pile.y + card_index * target_pile.card_spacing if target_pile.pile_type == PileType.TABLEAU else target_pile.y
-        else:
-            if target_pile.cards:
-                # Place the card at the correct offset from the last card in a tableau pile
-                last_card = target_pile.cards[-1]
-                new_y = last_card.y + target_pile.card_spacing if target_pile.pile_type == PileType.TABLEAU else target_pile.y
-            else:
-                # If the target pile is empty, place the card directly at the pile's base position
-                new_y = target_pile.y
-
-        new_x = target_pile.x
-        card.set_position(new_x, new_y)
-
-
-
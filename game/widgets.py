@@ -1,6 +1,8 @@
 import math
+import string
 import pygame
 
+from fonts import DEFAULT_FONT, TITLE_FONT, get_font
 from text import Text
 
 class Button:
@@ -85,7 +87,7 @@ class ConfirmationBox:
         self.visible = False
         self.menu = pygame.Rect(MessageBox.ORIGIN_X, MessageBox.ORIGIN_Y, MessageBox.WIDTH, MessageBox.HEIGHT)
         self.border = pygame.Rect(MessageBox.ORIGIN_X, MessageBox.ORIGIN_Y, MessageBox.WIDTH, MessageBox.HEIGHT)
-        self.prompt = Text(title, (self.menu.left + (self.menu.w / 2)-1, self.menu.top + 25), pygame.font.SysFont('Times New Roman', 18))
+        self.prompt = Text(title, (self.menu.left + (self.menu.w / 2)-1, self.menu.top + 25), get_font(*DEFAULT_FONT))
         self.ok = Button('Ok', pygame.Rect(self.menu.x + 150, self.menu.y + 75, Button.DEFAULT_WIDTH, Button.DEFAULT_HEIGHT))
 
     def clicked_ok(self, mouse_pos):
@@ -117,7 +119,7 @@ class MessageBox:
 
         self.menu = pygame.Rect(self.ORIGIN_X, self.ORIGIN_Y, self.WIDTH, self.HEIGHT)
         self.border = pygame.Rect(self.ORIGIN_X, self.ORIGIN_Y, self.WIDTH, self.HEIGHT)
-        self.prompt = Text(title, (self.menu.left + (self.menu.w / 2)-1, self.menu.top + 25), pygame.font.SysFont('Times New Roman', 24))
+        self.prompt = Text(title, (self.menu.left + (self.menu.w / 2)-1, self.menu.top + 25), get_font(*TITLE_FONT))
         self.yes = Button('Yes', pygame.Rect(self.menu.x + 75, self.menu.y + 75, Button.DEFAULT_WIDTH, Button.DEFAULT_HEIGHT))
         self.no = Button('Exit', pygame.Rect(self.yes.rect.x+self.yes.rect.w + 50, self.yes.rect.y, Button.DEFAULT_WIDTH, Button.DEFAULT_HEIGHT))
 
@@ -143,3 +145,60 @@ class MessageBox:
         self.yes.draw(surface)
         self.no.draw(surface)
         self.prompt.draw(surface)
+
+class NumberInputBox:
+    # Dialog asking for a whole number, typed digits are kept in `digits`
+
+    def __init__(self, title, max_digits=20):
+        self.visible = False
+        self.max_digits = max_digits
+        self.digits = ''
+
+        self.menu = pygame.Rect(MessageBox.ORIGIN_X, MessageBox.ORIGIN_Y, MessageBox.WIDTH, MessageBox.HEIGHT)
+        self.border = pygame.Rect(MessageBox.ORIGIN_X, MessageBox.ORIGIN_Y, MessageBox.WIDTH, MessageBox.HEIGHT)
+        self.prompt = Text(title, (self.menu.left + (self.menu.w / 2)-1, self.menu.top + 20), get_font(*DEFAULT_FONT))
+        self.field = pygame.Rect(self.menu.x + 75, self.menu.y + 35, 250, 28)
+        self.ok = Button('Play', pygame.Rect(self.menu.x + 75, self.menu.y + 80, Button.DEFAULT_WIDTH, Button.DEFAULT_HEIGHT))
+        self.cancel = Button('Cancel', pygame.Rect(self.ok.rect.x+self.ok.rect.w + 50, self.ok.rect.y, Button.DEFAULT_WIDTH, Button.DEFAULT_HEIGHT))
+
+    def clicked_ok(self, mouse_pos):
+        return self.ok.clicked(mouse_pos)
+
+    def clicked_cancel(self, mouse_pos):
+        return self.cancel.clicked(mouse_pos)
+
+    def handle_key(self, event):
+        # Edits the number, returns True when Enter is pressed
+        if event.key in (pygame.K_RETURN, pygame.K_KP_ENTER):
+            return True
+        if event.key == pygame.K_BACKSPACE:
+            self.digits = self.digits[:-1]
+        elif len(event.unicode) == 1 and event.unicode in string.digits and len(self.digits) < self.max_digits:
+            # Only ASCII digits: str.isdigit also takes the likes of '²', which int can't read
+            self.digits += event.unicode
+        return False
+
+    def value(self):
+        return int(self.digits) if self.digits else None
+
+    def show(self):
+        self.visible = True
+        self.digits = ''
+        self.ok.enable()
+        self.cancel.enable()
+
+    def hide(self):
+        self.visible = False
+        self.ok.disable()
+        self.cancel.disable()
+
+    def draw(self, surface):
+        pygame.draw.rect(surface, (206,206,206), self.menu)
+        pygame.draw.rect(surface, (0,0,0), self.border, 1)
+        pygame.draw.rect(surface, (255,255,255), self.field)
+        pygame.draw.rect(surface, (0,0,0), self.field, 1)
+        if self.digits:
+            Text(self.digits, self.field.center).draw(surface)
+        self.ok.draw(surface)
+        self.cancel.draw(surface)
+        self.prompt.draw(surface)
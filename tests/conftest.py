@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+# The game modules import each other as top-level modules, the way main.py is run from game/
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'game'))
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+
+@pytest.fixture
+def play():
+    # Plays up to `count` random legal moves on a GameState (through the journal if one is given),
+    # returns the moves played
+    def play(state, rng, count, journal=None):
+        played = []
+        for _ in range(count):
+            moves = state.legal_moves()
+            if not moves or state.lost:
+                break
+            move = rng.choice(moves)
+            if journal is not None:
+                assert journal.play(state, move) is not None
+            else:
+                assert state.apply(move)
+            played.append(move)
+        return played
+    return play
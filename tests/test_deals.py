@@ -0,0 +1,41 @@
+import pytest
+
+from deals import DEAL_VERSION, MAX_DEAL_ID, deal, deal_order
+from engine import STOCK, new_deck
+from gamemode import Gamemode
+
+
+def test_deal_orders_are_pinned():
+    # DEAL_VERSION 1 orders, these must never change or old deal numbers get new cards
+    assert DEAL_VERSION == 1
+    assert deal_order(0)[:12] == [12, 35, 8, 48, 2, 49, 51, 11, 28, 25, 18, 13]
+    assert deal_order(1)[:12] == [47, 45, 37, 42, 0, 33, 50, 36, 5, 30, 19, 10]
+    assert deal_order(MAX_DEAL_ID)[:12] == [15, 19, 12, 17, 50, 2, 36, 32, 26, 22, 37, 9]
+
+
+def test_every_deal_is_a_full_deck():
+    for deal_id in list(range(200)) + [MAX_DEAL_ID - deal_id for deal_id in range(50)]:
+        assert sorted(deal_order(deal_id)) == new_deck()
+
+
+def test_deals_are_repeatable_and_distinct():
+    orders = [tuple(deal_order(deal_id)) for deal_id in range(500)]
+    assert orders == [tuple(deal_order(deal_id)) for deal_id in range(500)]
+    assert len(set(orders)) == len(orders)
+
+
+def test_deal_uses_the_order():
+    order = deal_order(42)
+    for gamemode in (Gamemode.KLONDIKE, Gamemode.VEGAS):
+        state = deal(42, gamemode)
+        assert state.piles[0] == order[:1] and state.piles[6] == order[21:28]
+        assert state.piles[STOCK] == order[28:]
+        assert state.gamemode == gamemode
+
+
+def test_bad_deal_ids_and_versions():
+    for deal_id in (-1, MAX_DEAL_ID + 1):
+        with pytest.raises(ValueError):
+            deal_order(deal_id)
+    with pytest.raises(ValueError):
+        deal_order(1, DEAL_VERSION + 1)
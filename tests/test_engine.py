@@ -0,0 +1,97 @@
+import random
+
+import engine
+import solver
+from engine import (GameState, Move, DRAW, RECYCLE, STOCK, WASTE, TABLEAU_PILES, FOUNDATION_PILES, DECK_SIZE,
+                    new_deck)
+from deals import deal
+from gamemode import Gamemode
+
+
+def snapshot(state):
+    return ([list(pile) for pile in state.piles], list(state.hidden), state.score, state.moves_made,
+            state.consecutive_foundation_moves, state.foundation_height, state.foundation_pile, state.zobrist)
+
+
+def test_deal_layout():
+    state = GameState.deal(new_deck())
+    assert [len(state.piles[pile]) for pile in TABLEAU_PILES] == [1, 2, 3, 4, 5, 6, 7]
+    assert state.hidden == [0, 1, 2, 3, 4, 5, 6]
+    assert state.piles[STOCK] == list(range(28, DECK_SIZE))
+    assert not state.piles[WASTE] and not any(state.piles[pile] for pile in FOUNDATION_PILES)
+    assert state.score == 0
+    assert GameState.deal(new_deck(), Gamemode.VEGAS).score == -52
+
+
+def test_draw_and_recycle():
+    state = GameState.deal(new_deck())
+    while state.piles[STOCK]:
+        assert state.apply(DRAW)
+    assert state.piles[WASTE] == list(range(DECK_SIZE - 1, 27, -1))
+    assert not state.apply(DRAW)
+    # Draw 1 allows one pass, recycling without having moved a card loses
+    assert state.apply(RECYCLE)
+    assert state.lost
+    assert state.piles[STOCK] == list(range(28, DECK_SIZE)) and not state.piles[WASTE]
+
+
+def test_illegal_moves_change_nothing():
+    state = deal(1)
+    before = snapshot(state)
+    for move in (Move(0, 0, 1), Move(6, 0, 2), Move(STOCK, 0, 1), Move(WASTE, 0, 1), Move(0, FOUNDATION_PILES[0], 0)):
+        if move not in state.legal_moves():
+            assert not state.move(*move)
+    assert snapshot(state) == before
+
+
+def test_cards_are_kept_through_random_play(play):
+    rng = random.Random(1)
+    for deal_id in range(20):
+        state = deal(deal_id, rng.choice([Gamemode.KLONDIKE, Gamemode.VEGAS]))
+        play(state, rng, 300)
+        assert sorted(card for pile in state.piles for card in pile) == new_deck()
+        assert state.foundation_height == [
+            next((len(state.piles[pile]) for pile in FOUNDATION_PILES
+                  if state.piles[pile] and state.piles[pile][0] // 13 == suit), 0) for suit in range(4)]
+
+
+def test_undo_move_restores_the_position(play):
+    rng = random.Random(2)
+    for deal_id in range(20):
+        state = deal(deal_id)
+        play(state, rng, rng.randrange(60))
+        for move in state.legal_moves():
+            if not move.count:
+                continue
+            after = state.copy()
+            hidden = after.hidden[move.src] if move.src < len(after.hidden) else 0
+            assert after.move(*move)
+            flipped = move.src < len(after.hidden) and after.hidden[move.src] < hidden
+            after.undo_move(move.src, move.dst, move.count, flipped)
+            # Counters are the journal's job, the layout and hash come back here
+            assert snapshot(after)[:2] == snapshot(state)[:2]
+            assert after.foundation_height == state.foundation_height
+            assert after.zobrist == state.zobrist
+
+
+def test_safe_cards_wait_for_the_other_suit_of_their_colour():
+    # The five of hearts with both black suits up to four but diamonds only up to two: the three of diamonds
+    # could still need a black four back off the foundations, and that four the five of hearts
+    state = GameState()
+    for suit, height in enumerate([4, 4, 4, 2]):
+        state.piles[FOUNDATION_PILES[suit]] = [suit * 13 + rank for rank in range(height)]
+        state.foundation_height[suit] = height
+        state.foundation_pile[suit] = FOUNDATION_PILES[suit]
+    five_of_hearts = 13 + 4
+    state.piles[0] = [five_of_hearts]
+    assert state.foundation_move(0) is not None
+    assert not state.is_safe(five_of_hearts) and state.next_safe_move() is None
+
+    state.piles[FOUNDATION_PILES[3]].append(39 + 2)
+    state.foundation_height[3] = 3
+    assert state.is_safe(five_of_hearts)
+    assert state.next_safe_move() == Move(0, FOUNDATION_PILES[1], 1)
+
+
+def test_solver_uses_the_engine_safe_rule():
+    assert solver.is_safe is engine.is_safe
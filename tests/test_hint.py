@@ -0,0 +1,48 @@
+import random
+from concurrent.futures import Future
+
+from deals import deal
+from gamemode import Gamemode
+from hint import HintEngine, best_move
+from solver import Solver
+
+
+def test_hint_starts_a_win():
+    for gamemode, deal_id in ((Gamemode.KLONDIKE, 2), (Gamemode.KLONDIKE, 3), (Gamemode.KLONDIKE, 4),
+                              (Gamemode.VEGAS, 2)):
+        state = deal(deal_id, gamemode)
+        move = best_move(state)
+        assert move in state.legal_moves()
+        assert move == Solver(5000).solve(state).moves[0]
+
+
+def test_hints_play_a_game_to_the_end():
+    state = deal(3)
+    for _ in range(300):
+        if state.is_won():
+            break
+        move = best_move(state)
+        assert move in state.legal_moves()
+        assert state.apply(move)
+    assert state.is_won()
+
+
+def test_fallback_hint_is_legal(play):
+    rng = random.Random(18)
+    for deal_id in range(5, 10):
+        state = deal(deal_id)
+        play(state, rng, 20)
+        # Too little time for the solver, the hint comes from ranking the legal moves
+        move = best_move(state, time_limit=1e-9)
+        assert move is None or move in state.legal_moves()
+
+
+def test_failed_search_is_flagged_not_printed(capsys):
+    hints = HintEngine()
+    hints.future = Future()
+    hints.future.set_exception(RuntimeError('worker died'))
+    assert hints.result(hints.generation) is None
+    assert hints.failed
+    assert capsys.readouterr().out == ''
+    hints.cancel()
+    assert not hints.failed
@@ -0,0 +1,87 @@
+import random
+
+from deals import deal
+from engine import Move, DRAW, RECYCLE
+from gamemode import Gamemode
+from journal import MoveJournal, Delta, MOVE, RECYCLED, pack, unpack
+from replay import encode_moves
+
+
+def fields(state):
+    return ([list(pile) for pile in state.piles], list(state.hidden), state.draw_count, state.move_made,
+            state.lost, state.score, state.moves_made, state.consecutive_foundation_moves,
+            state.stockpile_refresh_count, state.foundation_height, state.foundation_pile, state.zobrist)
+
+
+def test_pack_round_trip():
+    for delta in (Delta(MOVE, 12, 0, 1, False, True, False, 0, -15),
+                  Delta(MOVE, 3, 6, 13, True, False, False, 127, 130),
+                  Delta(RECYCLED, 8, 7, 0, False, False, True, 5, -5)):
+        assert unpack(pack(delta)) == delta
+
+
+def test_undo_and_redo_everything(play):
+    rng = random.Random(13)
+    for deal_id in range(30):
+        state = deal(deal_id, rng.choice([Gamemode.KLONDIKE, Gamemode.VEGAS]))
+        dealt = fields(state)
+        journal = MoveJournal()
+        moves = play(state, rng, rng.randrange(1, 300), journal)
+        played = fields(state)
+        assert journal.moves() == moves
+
+        while journal.undo(state):
+            pass
+        assert fields(state) == dealt
+        while journal.redo(state):
+            pass
+        assert fields(state) == played
+
+
+def test_undo_steps_back_one_move_at_a_time(play):
+    rng = random.Random(31)
+    state = deal(5)
+    journal = MoveJournal()
+    history = [fields(state)]
+    for _ in range(150):
+        if not play(state, rng, 1, journal):
+            break
+        history.append(fields(state))
+    while history:
+        assert fields(state) == history.pop()
+        journal.undo(state)
+
+
+def test_new_move_drops_redo_entries():
+    state = deal(2)
+    journal = MoveJournal()
+    journal.play(state, DRAW)
+    journal.play(state, DRAW)
+    journal.undo(state)
+    assert journal.can_redo()
+    journal.play(state, DRAW)
+    assert not journal.can_redo()
+    assert journal.moves() == [DRAW, DRAW]
+    # Moves that don't happen aren't recorded
+    assert journal.play(state, Move(0, 0, 1)) is None
+    assert journal.play(state, RECYCLE) is None
+    assert len(journal) == 2
+
+
+def test_encoded_moves_follow_undo_and_redo(play):
+    # The incrementally kept replay encoding always matches encoding the moves from scratch
+    rng = random.Random(41)
+    for deal_id in range(10):
+        state = deal(deal_id, rng.choice([Gamemode.KLONDIKE, Gamemode.VEGAS]))
+        journal = MoveJournal()
+        for _ in range(60):
+            step = rng.random()
+            if step < 0.2:
+                journal.undo(state)
+            elif step < 0.3:
+                journal.redo(state)
+            elif not play(state, rng, 1, journal):
+                break
+            assert journal.encoded == encode_moves(journal.moves())
+        journal.clear()
+        assert journal.encoded == b''
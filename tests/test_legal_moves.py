@@ -0,0 +1,74 @@
+import random
+
+from deals import deal
+from engine import (GameState, Move, DRAW, RECYCLE, STOCK, WASTE, PILE_COUNT, TABLEAU_COUNT, FOUNDATION_START, KING, ACE,
+                    TABLEAU_PILES)
+from gamemode import Gamemode
+
+
+def brute_force_moves(state):
+    # Every move can_move allows, less the two kinds legal_moves leaves out on purpose
+    moves = set()
+    for src in range(PILE_COUNT):
+        for dst in range(PILE_COUNT):
+            if src == STOCK or dst in (STOCK, WASTE):
+                continue
+            for count in range(1, len(state.piles[src]) + 1):
+                if not state.can_move(src, dst, count):
+                    continue
+                card = state.piles[src][-count]
+                if src < TABLEAU_COUNT and dst < TABLEAU_COUNT and count == len(state.piles[src]) and card % 13 == KING - 1:
+                    continue # A whole pile that starts with a king, onto another empty pile
+                if src >= FOUNDATION_START and dst >= FOUNDATION_START and card % 13 == ACE - 1:
+                    continue # An ace between foundations
+                moves.add(Move(src, dst, count))
+    if state.piles[STOCK]:
+        moves.add(DRAW)
+    elif state.piles[WASTE]:
+        moves.add(RECYCLE)
+    return moves
+
+
+def test_legal_moves_match_the_rules(play):
+    rng = random.Random(12)
+    positions = 0
+    for deal_id in range(40):
+        state = deal(deal_id, rng.choice([Gamemode.KLONDIKE, Gamemode.VEGAS]))
+        for _ in range(150):
+            moves = state.legal_moves()
+            assert len(moves) == len(set(moves))
+            assert set(moves) == brute_force_moves(state)
+            positions += 1
+            if not play(state, rng, 1):
+                break
+    assert positions > 1000
+
+
+def test_every_legal_move_applies(play):
+    rng = random.Random(21)
+    for deal_id in range(20):
+        state = deal(deal_id)
+        play(state, rng, rng.randrange(100))
+        for move in state.legal_moves():
+            assert state.copy().apply(move)
+
+
+def test_copy_is_independent():
+    state = deal(4)
+    copy = state.copy()
+    assert copy.apply(copy.legal_moves()[0])
+    assert state.piles == deal(4).piles and state.hidden == deal(4).hidden
+    assert copy.piles != state.piles
+    assert all(copy.piles[pile] is not state.piles[pile] for pile in TABLEAU_PILES)
+
+
+def test_ace_between_foundations_keeps_its_suit_summary():
+    state = GameState()
+    state.piles[FOUNDATION_START] = [0] # Ace of clubs
+    state.foundation_height[0] = 1
+    state.foundation_pile[0] = FOUNDATION_START
+    state.piles[0] = [1] # Two of clubs
+    assert state.move(FOUNDATION_START, FOUNDATION_START + 1)
+    assert state.foundation_pile[0] == FOUNDATION_START + 1 and state.foundation_height[0] == 1
+    assert state.foundation_move(0) == Move(0, FOUNDATION_START + 1, 1)
+    assert set(state.legal_moves()) == brute_force_moves(state)
@@ -0,0 +1,123 @@
+import random
+
+import pytest
+
+import replay
+from deals import DEAL_VERSION, deal
+from engine import FOUNDATION_PILES, KING, GameState, Move, TABLEAU_PILES
+from gamemode import Gamemode
+from replay import Replay, encode_moves, verify, verify_many, verify_rules
+
+
+def unusual_moves(state):
+    # Legal moves legal_moves leaves out: an ace between foundations and a king run off an empty-bottomed pile
+    moves = []
+    empty_foundations = [pile for pile in FOUNDATION_PILES if not state.piles[pile]]
+    for pile in FOUNDATION_PILES:
+        if len(state.piles[pile]) == 1 and empty_foundations:
+            moves.append(Move(pile, empty_foundations[0], 1))
+    empty_columns = [pile for pile in TABLEAU_PILES if not state.piles[pile]]
+    for pile in TABLEAU_PILES:
+        cards = state.piles[pile]
+        if cards and not state.hidden[pile] and cards[0] % 13 == KING - 1 and empty_columns:
+            moves.append(Move(pile, empty_columns[0], len(cards)))
+    return moves
+
+
+def recorded_games(count, seed):
+    # Random games on a few deals, as Replays claiming their real scores
+    rng = random.Random(seed)
+    games = []
+    for index in range(count):
+        gamemode = (Gamemode.KLONDIKE, Gamemode.VEGAS)[index % 2]
+        deal_id = rng.randrange(8)
+        state = deal(deal_id, gamemode)
+        moves = []
+        for _ in range(rng.randrange(1, 250)):
+            legal = state.legal_moves() + (unusual_moves(state) if rng.random() < 0.02 else [])
+            if not legal or state.lost:
+                break
+            move = rng.choice(legal)
+            assert state.apply(move)
+            moves.append(move)
+        games.append(Replay(deal_id, gamemode, state.score, encode_moves(moves), DEAL_VERSION))
+    return games
+
+
+def corrupted(game, rng):
+    # The game with one move byte, move count or the claimed score changed
+    moves = bytearray(game.moves)
+    choice = rng.randrange(3)
+    if choice == 2 or not moves:
+        return game._replace(score=game.score + rng.choice((-5, 5, 10)))
+    index = rng.randrange(len(moves) // 2) * 2
+    if choice == 0:
+        moves[index] = rng.randrange(13) << 4 | rng.randrange(13)
+    else:
+        moves[index + 1] = rng.randrange(4)
+    return game._replace(moves=bytes(moves))
+
+
+def same_result(result, expected):
+    return (result.valid, result.score, result.won, result.moves_played, result.error) == \
+        (expected.valid, expected.score, expected.won, expected.moves_played, expected.error)
+
+
+def test_verifiers_agree_with_the_rules():
+    # The lean and batch paths accept exactly the replays GameState accepts, with the same scores
+    rng = random.Random(7)
+    games = recorded_games(80, 3)
+    games += [corrupted(game, rng) for game in games for _ in range(3)]
+    expected = [verify_rules(game, deal(game.deal_id, game.gamemode)) for game in games]
+    assert any(result.valid for result in expected) and not all(result.valid for result in expected)
+
+    for game, result in zip(games, expected):
+        assert same_result(verify(game), result)
+    if replay.np is not None:
+        for result, reference in zip(verify_many(games), expected):
+            assert same_result(result, reference)
+
+
+def test_lean_replay_rejects_a_move_after_the_game_is_lost():
+    state = deal(1, Gamemode.KLONDIKE)
+    moves = [Move(7, 8, 0)] * len(state.piles[7]) + [Move(8, 7, 0)]
+    game = Replay(1, Gamemode.KLONDIKE, -5, encode_moves(moves), DEAL_VERSION)
+    assert verify(game).valid
+    result = verify(game._replace(moves=game.moves + encode_moves([Move(7, 8, 0)])))
+    assert not result.valid
+    assert result.error == f'move {len(moves) + 1}: move after the game was lost'
+    if replay.np is not None:
+        assert [result.valid for result in verify_many([game, game._replace(moves=game.moves * 2)])] == [True, False]
+
+
+def test_face_down_cards_never_move():
+    # Pile 1 has the six of hearts face down under the ace of clubs, pile 2 the seven of clubs on top
+    dealt = [1, 18, 0, 2, 3, 6]
+    order = dealt + [card for card in range(52) if card not in dealt]
+    state = GameState.deal(order)
+    moves = encode_moves([Move(1, 2, 2)])
+    assert not state.copy().move(1, 2, 2)
+    assert replay.lean_replay(state, moves) is None
+    if replay.np is not None:
+        assert not replay.batch_replay(Gamemode.KLONDIKE, [bytes(order)], [moves])[2][0]
+
+
+def test_unknown_deals_are_invalid():
+    game = Replay(1, Gamemode.KLONDIKE, 0, b'', DEAL_VERSION + 1)
+    assert verify_many([game])[0].error == f'unknown deal 1 (version {DEAL_VERSION + 1})'
+
+
+@pytest.mark.skipif(replay.np is None, reason='needs NumPy')
+def test_batch_replay_matches_lean_replay():
+    games = recorded_games(40, 11)
+    for gamemode in (Gamemode.KLONDIKE, Gamemode.VEGAS):
+        chosen = [game for game in games if game.gamemode == gamemode]
+        scores, won, ok = replay.batch_replay(gamemode, [replay.dealt_order(game.deal_id, DEAL_VERSION) for game in chosen],
+                                              [game.moves for game in chosen])
+        for game, score, game_won, game_ok in zip(chosen, scores, won, ok):
+            lean = replay.lean_replay(deal(game.deal_id, gamemode), game.moves)
+            # The batch leaves moves between foundations to verify
+            if game_ok:
+                assert (score, game_won) == lean
+            else:
+                assert any(replay.MOVE_KINDS[pair] == replay.FOUNDATION_TO_FOUNDATION for pair in game.moves[0::2])
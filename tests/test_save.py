@@ -0,0 +1,80 @@
+import random
+
+import pytest
+
+from deals import deal
+from engine import DRAW, RECYCLE, STOCK
+from gamemode import Gamemode
+from journal import MoveJournal
+from save import STATE_RECORD, SAVE_HEADER, encode, decode, iter_records, save_game, load_game
+from score import Score
+from settings import Settings
+
+
+def fields(state):
+    return ([list(pile) for pile in state.piles], list(state.hidden), state.gamemode, state.draw_count,
+            state.move_made, state.lost, state.score, state.moves_made, state.consecutive_foundation_moves,
+            state.stockpile_refresh_count, state.foundation_height, state.foundation_pile, state.zobrist)
+
+
+def test_record_size():
+    assert STATE_RECORD.size == 79
+
+
+def test_round_trip(play):
+    rng = random.Random(14)
+    for deal_id in range(30):
+        state = deal(deal_id, rng.choice([Gamemode.KLONDIKE, Gamemode.VEGAS]))
+        play(state, rng, rng.randrange(200))
+        assert fields(decode(encode(state))) == fields(state)
+
+
+def test_records_back_to_back(play):
+    rng = random.Random(15)
+    states = []
+    for deal_id in range(5):
+        state = deal(deal_id)
+        play(state, rng, 40)
+        states.append(state)
+    buffer = bytearray(STATE_RECORD.size * len(states))
+    for index, state in enumerate(states):
+        encode(state, buffer=buffer, offset=index * STATE_RECORD.size)
+    assert [fields(state) for state in iter_records(buffer)] == [fields(state) for state in states]
+
+
+def test_invalid_records_are_rejected():
+    with pytest.raises(ValueError):
+        decode(b'\x00' * 10)
+    record = bytearray(encode(deal(1)))
+    record[0] = record[1] # The same card twice
+    with pytest.raises(ValueError):
+        decode(record)
+
+
+def test_save_file(tmp_path, play):
+    state = deal(7)
+    journal = MoveJournal()
+    play(state, random.Random(16), 50, journal)
+    path = str(tmp_path / 'game.sav')
+    assert save_game(state, deal_id=7, moves=journal.encoded, path=path)
+    loaded, deal_id, moves = load_game(path)
+    assert fields(loaded) == fields(state)
+    assert (deal_id, moves) == (7, journal.encoded)
+    # A truncated file is no save at all
+    with open(path, 'r+b') as file:
+        file.truncate(SAVE_HEADER.size + 10)
+    assert load_game(path) is None
+
+
+def test_score_counts_stock_refreshes():
+    state = deal(3)
+    journal = MoveJournal()
+    score = Score(Settings())
+    while state.piles[STOCK]:
+        journal.play(state, DRAW)
+    delta = journal.play(state, RECYCLE)
+    score.refresh_stockpile()
+    assert score.stockpile_refresh_count == 1
+    assert decode(encode(state, score)).stockpile_refresh_count == 1
+    score.undo(delta)
+    assert score.stockpile_refresh_count == 0
@@ -0,0 +1,133 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import simulate
+from deals import deal
+from engine import DRAW, FOUNDATION_START, Move, RECYCLE, STOCK, WASTE
+from gamemode import Gamemode
+from simulate import Batch, choose, numbered_orders
+
+DEAL_IDS = range(1000, 1040)
+
+
+def run_count(batch, game, source, target):
+    # Cards in the run a tableau action moves, worked out like Batch.move_run
+    hidden = batch.hidden[game, source]
+    length = batch.length[game, source]
+    if batch.length[game, target] == 0:
+        return int(length - hidden)
+    bottom_rank = batch.tableau[game, source, hidden] % 13
+    target_rank = batch.tableau[game, target, batch.length[game, target] - 1] % 13
+    return int(length - (hidden + bottom_rank - target_rank + 1))
+
+
+def batch_actions(batch, legal, game):
+    # The game's legal actions, tableau actions paired with the number of cards they move
+    actions = set()
+    for action in np.flatnonzero(legal[game]):
+        if action < simulate.TABLEAU_TO_FOUNDATION:
+            source, target = divmod(int(action), 7)
+            actions.add((int(action), run_count(batch, game, source, target)))
+        else:
+            actions.add(int(action))
+    return actions
+
+
+def engine_actions(state):
+    # GameState.legal_moves in the batch's action numbering
+    actions = set()
+    for move in state.legal_moves():
+        if move.count == 0:
+            actions.add(simulate.TALON)
+        elif move.dst >= FOUNDATION_START:
+            actions.add(simulate.WASTE_TO_FOUNDATION if move.src == WASTE else simulate.TABLEAU_TO_FOUNDATION + move.src)
+        elif move.src >= FOUNDATION_START:
+            actions.add(simulate.FOUNDATION_TO_TABLEAU + (state.piles[move.src][-1] // 13) * 7 + move.dst)
+        elif move.src == WASTE:
+            actions.add(simulate.WASTE_TO_TABLEAU + move.dst)
+        else:
+            actions.add((move.src * 7 + move.dst, move.count))
+    return actions
+
+
+def engine_move(state, batch, game, action):
+    # The GameState Move of a batch action
+    if action == simulate.TALON:
+        return DRAW if state.piles[STOCK] else RECYCLE
+    if action < simulate.TABLEAU_TO_FOUNDATION:
+        source, target = divmod(int(action), 7)
+        return Move(source, target, run_count(batch, game, source, target))
+    if action < simulate.WASTE_TO_FOUNDATION:
+        return state.foundation_move(action - simulate.TABLEAU_TO_FOUNDATION)
+    if action == simulate.WASTE_TO_FOUNDATION:
+        return state.foundation_move(WASTE)
+    if action < simulate.FOUNDATION_TO_TABLEAU:
+        return Move(WASTE, action - simulate.WASTE_TO_TABLEAU, 1)
+    suit, target = divmod(int(action) - simulate.FOUNDATION_TO_TABLEAU, 7)
+    return Move(state.foundation_pile[suit], target, 1)
+
+
+def assert_same_game(batch, game, state):
+    for pile in range(7):
+        assert [int(card) for card in batch.tableau[game, pile, :batch.length[game, pile]]] == state.piles[pile]
+        assert batch.hidden[game, pile] == state.hidden[pile]
+    talon = [int(card) for card in batch.talon[game, :batch.talon_len[game]]]
+    stock_len = batch.stock_len[game]
+    assert talon[:stock_len] == state.piles[STOCK]
+    assert talon[stock_len:] == state.piles[WASTE][::-1]
+    assert list(batch.height[game]) == state.foundation_height
+    assert batch.score[game] == state.score
+    assert batch.moves_made[game] == state.moves_made
+    assert batch.draw_count[game] == state.draw_count
+    assert (batch.outcome[game] == simulate.LOST) == state.lost
+
+
+@pytest.mark.parametrize('gamemode', [Gamemode.KLONDIKE, Gamemode.VEGAS])
+@pytest.mark.parametrize('policy', ['random', 'greedy'])
+def test_batch_plays_like_game_state(gamemode, policy):
+    # Every game of the batch has the same legal moves and reaches the same position and score as the
+    # GameState of its deal, step for step
+    batch = Batch(numbered_orders(DEAL_IDS), gamemode)
+    states = [deal(deal_id, gamemode) for deal_id in DEAL_IDS]
+    rng = np.random.default_rng(5)
+    playing = np.ones(len(states), dtype=bool)
+    for _ in range(200):
+        if not playing.any():
+            break
+        legal = batch.legal()
+        for game in np.flatnonzero(playing):
+            assert batch_actions(batch, legal, game) == engine_actions(states[game])
+        actions = choose(policy, legal, batch, rng)
+        actions[~playing] = -1
+        moves = {game: engine_move(states[game], batch, game, actions[game]) for game in np.flatnonzero(actions >= 0)}
+        batch.play(actions)
+        for game, move in moves.items():
+            assert states[game].apply(move)
+            assert_same_game(batch, game, states[game])
+        playing &= (actions >= 0) & (batch.outcome == simulate.PLAYING) & ~(batch.height == 13).all(axis=1)
+
+
+def test_recycle_budget_does_not_wrap():
+    # A game can recycle the stock far more often than its budget as long as each pass makes a move,
+    # the count keeps going down like GameState.draw_count
+    batch = Batch(numbered_orders([1]), Gamemode.VEGAS)
+    state = deal(1, Gamemode.VEGAS)
+    games = np.arange(1)
+    batch.stock_len[:] = 0
+    state.piles[WASTE] = state.piles[STOCK][::-1]
+    state.piles[STOCK] = []
+    for _ in range(300):
+        batch.move_made[:] = True
+        state.move_made = True
+        batch.draw_or_recycle(games)
+        assert state.apply(RECYCLE)
+        batch.stock_len[:] = 0
+        state.piles[WASTE] = state.piles[STOCK][::-1]
+        state.piles[STOCK] = []
+        assert batch.draw_count[0] == state.draw_count
+        assert batch.outcome[0] == simulate.PLAYING and not state.lost
+
+    # A pass without a move still ends the game
+    batch.draw_or_recycle(games)
+    assert batch.outcome[0] == simulate.LOST
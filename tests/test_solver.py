@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+from deals import deal
+from gamemode import Gamemode
+from solver import Solver, TranspositionTable, expand_steps
+
+
+def replays_to_a_win(state, moves):
+    state = state.copy()
+    for move in moves:
+        if not state.apply(move):
+            return False
+    return state.is_won()
+
+
+def winnable(state, limit=20000):
+    # Exhaustive search over the engine's own moves, for small game trees
+    seen = set()
+    stack = [state]
+    while stack:
+        state = stack.pop()
+        key = (tuple(map(tuple, state.piles)), tuple(state.hidden), state.move_made, min(max(state.draw_count, 0), 3))
+        if key in seen or state.lost:
+            continue
+        seen.add(key)
+        assert len(seen) < limit
+        if state.is_won():
+            return True
+        for move in state.legal_moves():
+            child = state.copy()
+            child.apply(move)
+            stack.append(child)
+    return False
+
+
+@pytest.mark.parametrize('gamemode, deal_id', [(Gamemode.KLONDIKE, deal_id) for deal_id in (2, 3, 4, 21, 22)]
+                         + [(Gamemode.VEGAS, deal_id) for deal_id in (2, 10, 12, 21)])
+def test_solutions_replay_to_a_win(gamemode, deal_id):
+    state = deal(deal_id, gamemode)
+    result = Solver(5000).solve(state)
+    assert result.solvable is True
+    assert replays_to_a_win(state, result.moves)
+
+
+def test_solutions_from_the_middle_of_a_game(play):
+    rng = random.Random(2)
+    solved = 0
+    for deal_id in (3, 4, 5, 9, 11):
+        state = deal(deal_id)
+        play(state, rng, 15)
+        result = Solver(5000).solve(state)
+        if result.solvable:
+            assert replays_to_a_win(state, result.moves)
+            solved += 1
+    assert solved
+
+
+def test_unwinnable_is_a_proof():
+    # Vegas deal 8 gets stuck within a few hundred positions
+    state = deal(8, Gamemode.VEGAS)
+    assert Solver(5000).solve(state).solvable is False
+    assert not winnable(state)
+
+
+def test_limits_abort_the_search():
+    result = Solver(10).solve(deal(2))
+    assert result.solvable is None and result.moves is None
+
+
+def test_expand_steps_rejects_illegal_steps():
+    with pytest.raises(RuntimeError):
+        expand_steps(deal(3), [(0, 1, 1, 0)])
+
+
+def test_transposition_table_is_bounded():
+    table = TranspositionTable(8)
+    for key in range(20):
+        table.add(key)
+    assert len(table) <= 8 and 19 in table and 0 not in table
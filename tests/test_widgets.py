@@ -0,0 +1,20 @@
+import pygame
+
+from widgets import NumberInputBox
+
+
+def key(unicode, key=0):
+    return pygame.event.Event(pygame.KEYDOWN, key=key, unicode=unicode)
+
+
+def test_number_box_only_takes_ascii_digits():
+    pygame.init()
+    box = NumberInputBox('Deal:')
+    box.show()
+    for character in '4²٣x2':
+        assert not box.handle_key(key(character))
+    box.handle_key(key(''))
+    assert box.digits == '42' and box.value() == 42
+    box.handle_key(key('', pygame.K_BACKSPACE))
+    assert box.value() == 4
+    assert box.handle_key(key('', pygame.K_RETURN))
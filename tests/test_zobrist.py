@@ -0,0 +1,58 @@
+import random
+
+from deals import deal
+from engine import GameState, STOCK, WASTE, TABLEAU_PILES, FOUNDATION_PILES, new_deck
+from gamemode import Gamemode
+from journal import MoveJournal
+
+
+def test_incremental_hash_matches_a_full_rehash(play):
+    rng = random.Random(15)
+    for deal_id in range(30):
+        state = deal(deal_id, rng.choice([Gamemode.KLONDIKE, Gamemode.VEGAS]))
+        journal = MoveJournal()
+        for _ in range(200):
+            if rng.random() < 0.2:
+                journal.undo(state)
+            elif not play(state, rng, 1, journal):
+                break
+            assert state.zobrist == state.compute_zobrist()
+        assert state.copy().zobrist == state.zobrist
+
+
+def test_undo_brings_the_hash_back(play):
+    rng = random.Random(16)
+    state = deal(9)
+    dealt = state.zobrist
+    journal = MoveJournal()
+    play(state, rng, 120, journal)
+    while journal.undo(state):
+        pass
+    assert state.zobrist == dealt
+
+
+def test_hash_ignores_the_order_of_tableau_piles():
+    state = GameState.deal(new_deck())
+    swapped = state.copy()
+    swapped.piles[2], swapped.piles[5] = swapped.piles[5], swapped.piles[2]
+    swapped.hidden[2], swapped.hidden[5] = swapped.hidden[5], swapped.hidden[2]
+    assert swapped.compute_zobrist() == state.zobrist
+
+
+def canonical(state):
+    # What the hash is meant to tell apart: pile order and the budget beyond its range don't count
+    return (tuple(sorted((tuple(state.piles[pile]), state.hidden[pile]) for pile in TABLEAU_PILES)),
+            tuple(state.piles[STOCK]), tuple(state.piles[WASTE]),
+            tuple(sorted(tuple(state.piles[pile]) for pile in FOUNDATION_PILES)), min(max(state.draw_count, 0), 3))
+
+
+def test_different_positions_hash_differently(play):
+    rng = random.Random(17)
+    seen = {}
+    for deal_id in range(20):
+        state = deal(deal_id)
+        for _ in range(60):
+            assert seen.setdefault(state.zobrist, canonical(state)) == canonical(state)
+            if not play(state, rng, 1):
+                break
+    assert len(seen) > 500